@@ -0,0 +1,325 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from modules import TradingStrategy
+from modules import TriangleStrategy
+from modules import TrendReversalBacktest
+from modules import TriangleBacktest
+from modules import ResampleData, MultiTimeframeResampler
+from modules import BarFeed, FakeRateSource
+
+settings_reversal = {
+    'symbol': 'USDJPY',
+    'risk_reward_ratio': 1.0,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 500,
+    'distance': 7,
+    'candle_size_pips': 0.05,
+}
+
+settings_triangle = {
+    'risk_reward_ratio': 1.3,
+    'take_profit_pips': 0.15,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 200,
+    'distance': 15,
+    'pivot_count': 2,
+    'horizontal_distance': 60,
+    'horizontal_threshold': 3,
+    'entry_horizontal_distance': 0.01,
+}
+
+
+def make_bars(n, seed=0):
+    """
+    USDJPY の1分足に似せたランダムウォークの OHLC・出来高・スプレッド (同じ seed なら同じデータ)
+    """
+    rng = np.random.default_rng(seed)
+    vol = 0.01
+    closes = 150 + np.cumsum(rng.normal(0, vol, n) + 0.3 * vol * np.sin(np.arange(n) / 300))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + np.abs(rng.normal(0, vol / 2, n))
+    lows = np.minimum(opens, closes) - np.abs(rng.normal(0, vol / 2, n))
+    return pd.DataFrame({
+        'time': pd.date_range('2022-08-01', periods=n, freq='min'),
+        'open': opens.round(3),
+        'high': highs.round(3),
+        'low': lows.round(3),
+        'close': closes.round(3),
+        'tick_volume': rng.integers(10, 200, n),
+        'spread': rng.integers(0, 5, n),
+        'real_volume': 0,
+    })
+
+
+def timed(func, latencies):
+    # 1回の呼び出しごとの時間を記録する
+    def wrapper(*args):
+        start = time.perf_counter_ns()
+        result = func(*args)
+        latencies.append(time.perf_counter_ns() - start)
+        return result
+    return wrapper
+
+
+# 各コンポーネントは df を受け取って実行し、1回の呼び出しごとの時間 (ns) のリストを返す
+def bench_trade_logic_trend_reversal(df):
+    from step_backtest import trade_logic
+    latencies = []
+    strategy = TradingStrategy(params=settings_reversal)
+    trade_logic(df, timed(strategy.trade_logic_trend_reversal, latencies), strategy.base_spread_pips)
+    return latencies
+
+
+def bench_trade_logic_triangle(df):
+    from step_backtest import trade_logic
+    latencies = []
+    strategy = TriangleStrategy('USDJPY', True, True, params=settings_triangle)
+    trade_logic(df, timed(strategy.trade_conditions_func, latencies), strategy.base_spread_pips)
+    return latencies
+
+
+def bench_trend_reversal_batch(df):
+    latencies = []
+    timed(TrendReversalBacktest(TradingStrategy(params=settings_reversal)).run, latencies)(df)
+    return latencies
+
+
+def bench_triangle_batch(df):
+    latencies = []
+    backtest = TriangleBacktest(TriangleStrategy('USDJPY', True, True, params=settings_triangle))
+    timed(backtest.run, latencies)(df)
+    return latencies
+
+
+def bench_resample_merge(df):
+    latencies = []
+    timed(ResampleData(df).merge_data, latencies)()
+    return latencies
+
+
+def bench_resampler_update(df):
+    latencies = []
+    update = timed(MultiTimeframeResampler().update, latencies)
+    times = df['time'].values.astype('datetime64[s]').astype(np.int64).tolist()
+    for row in zip(times, df['open'].tolist(), df['high'].tolist(), df['low'].tolist(),
+                   df['close'].tolist(), df['tick_volume'].tolist()):
+        update(*row)
+    return latencies
+
+
+def bench_bar_feed_poll(df):
+    latencies = []
+    source = FakeRateSource.from_dataframe(df, now=500)
+    feed = BarFeed(source, 'USDJPY', 1, capacity=500)
+    poll = timed(feed.poll, latencies)
+    poll()
+    while source.now < len(df):
+        source.advance(1)
+        poll()
+        feed.frame()
+    return latencies
+
+
+def warm_up():
+    # numba のコンパイル時間を計測に含めない
+    bench_triangle_batch(make_bars(1000))
+
+
+# (名前, 計測する最大本数, 関数)
+COMPONENTS = [
+    ('trade_logic/trend_reversal', 100_000, bench_trade_logic_trend_reversal),
+    ('trade_logic/triangle', 100_000, bench_trade_logic_triangle),
+    ('TrendReversalBacktest.run', 1_000_000, bench_trend_reversal_batch),
+    ('TriangleBacktest.run', 1_000_000, bench_triangle_batch),
+    ('ResampleData.merge_data', 1_000_000, bench_resample_merge),
+    ('MultiTimeframeResampler.update', 1_000_000, bench_resampler_update),
+    ('BarFeed.poll', 100_000, bench_bar_feed_poll),
+]
+
+
+# ライブ取引の起動を新しいプロセスで再現する: import から SimulatedTerminal 上の LiveEngine で最初の足を判定するまで
+STARTUP_SCRIPT = r"""
+import sys
+import time
+sys.path[:0] = [sys.argv[1], sys.argv[1] + '/trade']
+import numpy as np
+from modules import SimulatedTerminal
+from modules.bar_feed import RATES_DTYPE
+
+n = 600
+rng = np.random.default_rng(0)
+closes = 150 + np.cumsum(rng.normal(0, 0.01, n))
+bars = np.zeros(n, dtype=RATES_DTYPE)
+bars['time'] = 1659312000 + 60 * np.arange(n)
+bars['open'] = np.r_[closes[0], closes[:-1]]
+bars['high'] = np.maximum(bars['open'], closes) + 0.005
+bars['low'] = np.minimum(bars['open'], closes) - 0.005
+bars['close'] = closes
+terminal = SimulatedTerminal().add_symbol('USDJPY', bars).install()
+terminal.clock.set(int(bars['time'][500]) + 60)
+terminal.initialize()
+
+from engine import LiveEngine
+settings = {'symbol': 'USDJPY', 'risk_reward_ratio': 1.0, 'stop_loss_pips': 0.10, 'base_spread_pips': 0.03,
+            'df_sliced_period': 500, 'distance': 7, 'candle_size_pips': 0.05}
+engine = LiveEngine(terminal, [settings], bar_count=500, clock=terminal.clock)
+engine.run_once(int(bars['time'][500]) + 60)
+print(' '.join(name for name in ('scipy', 'numba', 'matplotlib', 'trendln') if name in sys.modules), file=sys.stderr)
+"""
+
+
+def measure_startup(repeat=5):
+    """
+    インタープリターの起動から最初の判定が終わるまでの秒数 (repeat 回の最小と中央値) と、読み込まれた重いライブラリ
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    seconds = []
+    heavy = ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, root], capture_output=True, text=True)
+        seconds.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            raise RuntimeError(f"Startup script failed:\n{process.stderr}")
+        heavy = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ''
+    return {
+        'min_seconds': min(seconds),
+        'median_seconds': float(np.median(seconds)),
+        'heavy_modules': heavy.split(),
+    }
+
+
+def measure(func, df, memory=True):
+    start = time.perf_counter()
+    latencies = np.array(func(df), dtype=np.float64) / 1000  # us
+    seconds = time.perf_counter() - start
+
+    peak_memory_mb = None
+    if memory:
+        # tracemalloc は実行を遅くするので、時間とは別にもう1回実行して測る
+        tracemalloc.start()
+        func(df)
+        peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+
+    return {
+        'seconds': seconds,
+        'bars_per_sec': len(df) / seconds,
+        'calls': len(latencies),
+        'latency_us': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max()),
+        },
+        'peak_memory_mb': peak_memory_mb,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(sizes, components=None, seed=0, memory=True):
+    warm_up()
+    results = []
+    for size in sizes:
+        df = make_bars(size, seed)
+        for name, max_bars, func in COMPONENTS:
+            if components and name not in components:
+                continue
+            if size > max_bars:
+                continue
+            result = dict(component=name, bars=size, **measure(func, df, memory))
+            results.append(result)
+            print(f"{name:32s} {size:>9,d} bars  {result['bars_per_sec']:>12,.0f} bars/s  "
+                  f"p50 {result['latency_us']['p50']:>10,.1f}us  p99 {result['latency_us']['p99']:>10,.1f}us  "
+                  f"peak {result['peak_memory_mb'] or 0:>8,.1f}MB")
+
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=0.1):
+    """
+    baseline より bars/s が threshold 以上落ちたコンポーネントを返す
+    """
+    previous = {(r['component'], r['bars']): r for r in baseline['results']}
+    regressions = []
+    print(f"===== Compared with {baseline.get('commit')} =====")
+    for result in report['results']:
+        old = previous.get((result['component'], result['bars']))
+        if old is None:
+            continue
+        ratio = result['bars_per_sec'] / old['bars_per_sec']
+        mark = ' <- regression' if ratio < 1 - threshold else ''
+        print(f"{result['component']:32s} {result['bars']:>9,d} bars  x{ratio:.2f}{mark}")
+        if mark:
+            regressions.append(result)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark strategies, resampler and backtest loops')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--components', nargs='+', help='names in COMPONENTS (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='JSON path (default: ./benchmarks/benchmark_{commit}_{time}.json)')
+    parser.add_argument('--compare', help='baseline JSON to compare bars/s against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown before failing')
+    parser.add_argument('--startup-budget', type=float, default=1.0,
+                        help='seconds allowed from process start to the first live strategy evaluation')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.components, args.seed, memory=not args.no_memory)
+
+    report['startup'] = measure_startup()
+    startup = report['startup']
+    print(f"{'startup':32s} min {startup['min_seconds']:.3f}s  median {startup['median_seconds']:.3f}s  "
+          f"budget {args.startup_budget:.3f}s  heavy modules: {', '.join(startup['heavy_modules']) or 'none'}")
+
+    output_path = args.output
+    if output_path is None:
+        os.makedirs('./benchmarks', exist_ok=True)
+        current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+        output_path = f"./benchmarks/benchmark_{report['commit'] or 'unknown'}_{current_time}.json"
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"{output_path} has been saved.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+    # 起動が遅くなった、またはライブ取引で使わない重いライブラリを読み込むようになった
+    if startup['median_seconds'] > args.startup_budget or startup['heavy_modules']:
+        print(f"Startup is over budget or loads {startup['heavy_modules']}")
+        sys.exit(1)
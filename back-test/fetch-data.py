@@ -1,8 +1,11 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import MetaTrader5 as mt5
-import pandas as pd
 from datetime import datetime, timezone
 import pytz
-import os
+from modules.bar_store import BarStore
 
 import configparser
 
@@ -39,27 +42,11 @@ try:
     if rates is None:
         raise Exception("No data received, error code =", mt5.last_error())
 
-    if len(rates) == 1:
-        rates = [rates[0]]
-
-    # DataFrameに変換
-    df = pd.DataFrame(rates,
-        columns=['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume'])
-
-    # タイムスタンプを変換
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-
-    # CSVファイルとして保存
-    csv_folder = 'csv'
-    if not os.path.exists(csv_folder):
-        os.makedirs(csv_folder)
-
-    from_date_str = utc_from.strftime("%Y%m%d")
-    to_date_str = utc_to.strftime("%Y%m%d")
-    csv_file = os.path.join(csv_folder, f'{symbol}_{timeframe}_{from_date_str}_to_{to_date_str}.csv')
-    df.to_csv(csv_file, index=False)
+    # 通貨ペア・時間足・月ごとのパーティションに追記する（同じ時刻のバーは上書き）
+    store = BarStore('bars')
+    store.write(symbol, timeframe, rates)
 
-    print(f"{csv_file} has been saved.")
+    print(f"{len(rates)} bars have been saved to {store.symbol_dir(symbol, timeframe)}.")
 
 except Exception as e:
     print("An error occurred:", str(e))
@@ -1,8 +1,10 @@
-from scipy.signal import find_peaks
-from ta.momentum import RSIIndicator
-from ta.volatility import AverageTrueRange
-from ta.trend import EMAIndicator
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import numpy as np
+from modules.indicators import EMA, RollingMean, RSI, ATR
+from modules.features import FeatureMatrix, pivot_features
 
 class TradingStrategy:
     def __init__(self, commission_rate=0.001, window=3000, threshold=0.05, lot_size=10000):
@@ -10,58 +12,86 @@ class TradingStrategy:
         self.window = window
         self.threshold = threshold
         self.lot_size = lot_size
+        self.features = None
+        self.features_source = None  # features を計算した df (ComputationCache.bind と同じく参照で比べる)
+
+    def prepare_features(self, df, dtype=np.float64):
+        """
+        全指標を配列演算で1回だけ計算して FeatureMatrix にまとめる
+        どの行もそのバーまでのデータだけで計算する（極値は確定したバーで記録する）
+        """
+        closes = df['close'].values.astype(float)
+        highs = df['high'].values.astype(float)
+        lows = df['low'].values.astype(float)
+        volumes = df['tick_volume'].values.astype(float)
 
-    def prepare_data(self, df):
         # Calculate moving averages
-        df['SMA20'] = df['close'].rolling(window=20).mean()
-        df["EMA20"] = EMAIndicator(df["close"], window=20, fillna=False).ema_indicator()
-        df["EMA200"] = EMAIndicator(df["close"], window=200, fillna=False).ema_indicator()
-        df["EMA1200"] = EMAIndicator(df["close"], window=1200, fillna=False).ema_indicator()
-
-        # degree
-        df["EMA25"] = EMAIndicator(df["close"], window=25, fillna=False).ema_indicator()
-        df["EMA100"] = EMAIndicator(df["close"], window=100, fillna=False).ema_indicator()
-        df['EMA25_degrees'] = self.calculate_gradient_degrees(df['EMA25'], 25)
-        df['EMA100_degrees'] = self.calculate_gradient_degrees(df['EMA100'], 25)
-
-        rsi_indicator = RSIIndicator(close=df['close'])
-        df['RSI'] = rsi_indicator.rsi()
-        average_true_range = AverageTrueRange(
-            high=df['high'],
-            low=df['low'],
-            close=df['close'],
-            window=210 # 15min * 14
-        )
-        df['ATR'] = average_true_range.average_true_range()
-        
+        ema25 = EMA(span=25, min_periods=25).compute(closes)
+        ema100 = EMA(span=100, min_periods=100).compute(closes)
+        columns = {
+            'close': closes,
+            'spread': df['spread'].values,
+            'tick_volume': volumes,
+            'SMA20': RollingMean(20).compute(closes),
+            'EMA20': EMA(span=20, min_periods=20).compute(closes),
+            'EMA200': EMA(span=200, min_periods=200).compute(closes),
+            'EMA1200': EMA(span=1200, min_periods=1200).compute(closes),
+            # degree
+            'EMA25': ema25,
+            'EMA100': ema100,
+            'EMA25_degrees': self.calculate_gradient_degrees(ema25, 25),
+            'EMA100_degrees': self.calculate_gradient_degrees(ema100, 25),
+            'RSI': RSI(window=14).compute(closes),
+            'ATR': ATR(window=210).compute(highs, lows, closes), # 15min * 14
+        }
+
+        # 直近50本の平均出来高 (50本に満たない間はあるだけの平均)
+        totals = np.r_[0., np.cumsum(volumes)]
+        end = np.arange(1, len(volumes) + 1)
+        start = np.maximum(end - 50, 0)
+        columns['volume_mean50'] = (totals[end] - totals[start]) / (end - start)
+
         # Detect peaks (maxima) and valleys (minima) in the close prices for the 5min data using a distance parameter
+        # 極値は distance 本後に確定したバーで記録し、ffill / linear もそのバーまでに確定した極値だけで求める
         distance_threshold = 5
-        peaks_resampled, _ = find_peaks(df['5min_close'], distance=distance_threshold)
-        valleys_resampled, _ = find_peaks(-df['5min_close'], distance=distance_threshold)
-
-        # Add the initial columns for maxima and minima
-        df['maxima'] = np.nan
-        df['minima'] = np.nan
-
-        # Assign the close prices to the maxima and minima columns
-        df.loc[df.index[peaks_resampled], 'maxima'] = df['5min_close'].iloc[peaks_resampled]
-        df.loc[df.index[valleys_resampled], 'minima'] = df['5min_close'].iloc[valleys_resampled]
-
-        # Forward fill (ffill) for maxima and minima
-        df['maxima_ffill'] = df['maxima'].fillna(method='ffill')
-        df['minima_ffill'] = df['minima'].fillna(method='ffill')
-
-        # Linear interpolation for maxima and minima
-        df['maxima_linear'] = df['maxima'].interpolate(method='linear')
-        df['minima_linear'] = df['minima'].interpolate(method='linear')
-
+        pivot_closes = df['5min_close'].values.astype(float) if '5min_close' in df.columns else closes
+        maxima, maxima_ffill, maxima_linear = pivot_features(pivot_closes, distance_threshold)
+        minima, minima_ffill, minima_linear = pivot_features(-pivot_closes, distance_threshold)
+        columns.update({
+            'maxima': maxima,
+            'minima': -minima,
+            'maxima_ffill': maxima_ffill,
+            'minima_ffill': -minima_ffill,
+            'maxima_linear': maxima_linear,
+            'minima_linear': -minima_linear,
+        })
+
+        self.features = FeatureMatrix.from_columns(columns, dtype)
+        self.features_source = df
+        return self.features
+
+    def features_for(self, df):
+        """
+        df の特徴量 (別の df や期間で呼ばれたら計算し直す)
+        """
+        if df is not self.features_source:
+            self.prepare_features(df)
+        return self.features
 
+    def prepare_data(self, df):
+        features = self.prepare_features(df)
+        for name in features.columns:
+            if name not in ('close', 'spread', 'tick_volume'):
+                df[name] = features[name]
         return df
     
-    def calculate_gradient_degrees(self, series, periods):
+    def calculate_gradient_degrees(self, values, periods):
+        values = np.asarray(values, dtype=float)
+
         # Δyの計算
-        delta_y = series - series.shift(periods)
-        delta_y = delta_y.fillna(0)
+        delta_y = np.zeros(len(values))
+        delta_y[periods:] = values[periods:] - values[:-periods]
+        delta_y = np.nan_to_num(delta_y, nan=0.)
 
         # Δxは期間
         delta_x = periods
@@ -74,16 +104,20 @@ class TradingStrategy:
 
     # trade logic
     def trade_conditions_ema(self, df, i, portfolio):
-        close = df.loc[i, 'close']
-        ema20 = df.loc[i, 'EMA20']
-        ema200 = df.loc[i, 'EMA200']
-        ema1200 = df.loc[i, 'EMA1200']
-        spread = df.loc[i, 'spread']
+        features = self.features_for(df)
+        f = features.values
+        c = features.index
+
+        close = f[i, c['close']]
+        ema20 = f[i, c['EMA20']]
+        ema200 = f[i, c['EMA200']]
+        ema1200 = f[i, c['EMA1200']]
+        spread = f[i, c['spread']]
 
-        prev_close = df.loc[i - 1, 'close'] if i > 0 else None
-        prev_ema20 = df.loc[i - 1, 'EMA20'] if i > 0 else None
-        prev_ema200 = df.loc[i - 1, 'EMA200'] if i > 0 else None
-        prev_ema1200 = df.loc[i - 1, 'EMA1200'] if i > 0 else None
+        prev_close = f[i - 1, c['close']] if i > 0 else None
+        prev_ema20 = f[i - 1, c['EMA20']] if i > 0 else None
+        prev_ema200 = f[i - 1, c['EMA200']] if i > 0 else None
+        prev_ema1200 = f[i - 1, c['EMA1200']] if i > 0 else None
 
         # スプレッドを通貨単位に変換（1銭 = 0.01円）
         spread_cost = spread * 0.01 * self.lot_size  # 0.5銭なら50円
@@ -127,8 +161,14 @@ class TradingStrategy:
         今日の出来高は直近50日間の平均値の3倍よりも多い
         翌日に寄り付きで成行売りする
         '''
-        close = df.loc[i, 'close']
-        spread = df.loc[i, 'spread']
+        features = self.features_for(df)
+        f = features.values
+        c = features.index
+        closes = f[:, c['close']]
+        volumes = f[:, c['tick_volume']]
+
+        close = f[i, c['close']]
+        spread = f[i, c['spread']]
 
         # スプレッドを通貨単位に変換（1銭 = 0.01円）
         spread_cost = spread * 0.01 * self.lot_size  # 0.5銭なら50円
@@ -147,20 +187,20 @@ class TradingStrategy:
                 return 'exit_short'
         elif (
                 i >= 4 and
-                df['close'][i - 3] < df['close'][i - 4] and
-                df['tick_volume'][i - 3] < df['tick_volume'][i - 4] and
-                df['close'][i - 1] < df['close'][i - 2] and
-                df['tick_volume'][i - 1] < df['tick_volume'][i - 2] and
-                df['tick_volume'][i] > 3 * df['tick_volume'].rolling(window=50, min_periods=1).mean()[i]
+                closes[i - 3] < closes[i - 4] and
+                volumes[i - 3] < volumes[i - 4] and
+                closes[i - 1] < closes[i - 2] and
+                volumes[i - 1] < volumes[i - 2] and
+                volumes[i] > 3 * f[i, c['volume_mean50']]
             ):
             return 'entry_long'
         elif (
                 i >= 4 and
-                df['close'][i - 3] > df['close'][i - 4] and
-                df['tick_volume'][i - 3] < df['tick_volume'][i - 4] and
-                df['close'][i - 1] > df['close'][i - 2] and
-                df['tick_volume'][i - 1] < df['tick_volume'][i - 2] and
-                df['tick_volume'][i] > 3 * df['tick_volume'].rolling(window=50, min_periods=1).mean()[i]
+                closes[i - 3] > closes[i - 4] and
+                volumes[i - 3] < volumes[i - 4] and
+                closes[i - 1] > closes[i - 2] and
+                volumes[i - 1] < volumes[i - 2] and
+                volumes[i] > 3 * f[i, c['volume_mean50']]
             ):
             return 'entry_short'
         else:
@@ -1,11 +1,18 @@
+import os
 import sys
-sys.path.append('d:\\dev\\mt5-python')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import pandas as pd
 import numpy as np
 from datetime import datetime, time, timedelta
 from modules import TradingStrategy
 from modules import TriangleStrategy
+from modules import TrendReversalBacktest
+from modules import TriangleBacktest
+from modules import BarStore
+from modules import Position, TradeLedger
+from modules import MultiStrategyBacktest
+from modules.multi_backtest import record_action
 
 import matplotlib.pyplot as plt
 
@@ -42,69 +49,51 @@ def filter_dataframe_by_date(df, start_date=None, end_date=None):
 
 # Initialize portfolio state
 def init_portfolio():
-    return {
-        'position': None,  # "long" or "short"
-        'entry_price': None,
-        'entry_point': 0,
-        'trailing_stop': 0,
-        'take_profit': None,
-        'stop_loss': None,
-        'profit': 0
-    }
+    return Position()
 
-def trade_logic(df, trade_conditions_func, pips):
+def trade_logic(df, trade_conditions_func, pips=None):
+    """
+    トレードの記録はエントリー・イグジットのときだけ ledger に追記する (メモリはバーの本数によらない)
+    Returns: pips / long_pips / short_pips はイグジットごとの獲得 pips、*_entries / *_exits はバーの位置
+    """
     df = df.reset_index(drop=True)
 
     closes = df['close'].values
     spreads = df['spread'].values
 
-    trade_results = {
-        'pips': [],
-        'long_pips': [],
-        'short_pips': [],
-        'buy_entries': [],
-        'buy_exits': [],
-        'sell_entries': [],
-        'sell_exits': []
-    }
-
+    ledger = TradeLedger()
     portfolio = init_portfolio()
 
     for i in range(0, len(df)):
-        pips = 0
-
         action = trade_conditions_func(df, i, portfolio, closes, spreads)
+        record_action(ledger, portfolio, i, action, closes[i])
 
-        if portfolio['position'] is not None:
-            if action == 'exit_long':
-                trade_results['pips'].append(portfolio['pips'])
-                trade_results['long_pips'].append(portfolio['pips'])
-                trade_results['buy_exits'].append(i)
-                portfolio = init_portfolio()
-
-            if action == 'exit_short':
-                trade_results['pips'].append(portfolio['pips'])
-                trade_results['short_pips'].append(portfolio['pips'])
-                trade_results['sell_exits'].append(i)
-                portfolio = init_portfolio()
+    return trade_results_from_ledger(ledger)
 
-            else:
-                trade_results['pips'].append(pips)
-        
-        elif action == 'entry_long':
-            trade_results['pips'].append(pips)
-            trade_results['buy_entries'].append(i)
-            portfolio['position'] = 'long'
+def trade_results_from_ledger(ledger):
+    long_exits = ledger.exits('exit_long')
+    short_exits = ledger.exits('exit_short')
+    return {
+        'pips': ledger.exits()['gained_pips'],
+        'long_pips': long_exits['gained_pips'],
+        'short_pips': short_exits['gained_pips'],
+        'buy_entries': ledger.entries('entry_long')['index'],
+        'buy_exits': long_exits['index'],
+        'sell_entries': ledger.entries('entry_short')['index'],
+        'sell_exits': short_exits['index'],
+        'ledger': ledger,
+    }
 
-        elif action == 'entry_short':
-            trade_results['pips'].append(pips)
-            trade_results['sell_entries'].append(i)
-            portfolio['position'] = 'short'
+def batch_trade_conditions(df, backtest):
+    # 全期間をまとめて計算し、trade_logic からは結果を1本ずつ返すだけにする
+    actions, exit_pips = backtest.run(df.reset_index(drop=True))
 
-        else:
-            trade_results['pips'].append(pips)
+    def trade_conditions_func(df, i, portfolio, closes, spreads):
+        if actions[i] in ('exit_long', 'exit_short'):
+            portfolio['pips'] = exit_pips[i]
+        return actions[i]
 
-    return trade_results
+    return trade_conditions_func
 
 
 # Backtest
@@ -147,11 +136,21 @@ settings_reversal_usdjpy = {
     'distance': 5,
 }
 
-file_name = './csv/USDJPY_1_20220801_to_20230801.csv'
 symbol = "USDJPY"
-df = pd.read_csv(file_name)
+timeframe = 1  # mt5.TIMEFRAME_M1
+
+
+def open_store(path='./bars', file_name='./csv/USDJPY_1_20220801_to_20230801.csv'):
+    store = BarStore(path)
+
+    # fetch-data.py で以前に保存した CSV があればバーストアに取り込む
+    if not store.partitions(symbol, timeframe) and os.path.exists(file_name):
+        store.write(symbol, timeframe, pd.read_csv(file_name))
+    return store
+
 
 if __name__ == '__main__':
+    store = open_store()
     st_triangle = TriangleStrategy(symbol=symbol, allow_long=True, allow_short=True, params=settings_triangle)
     st_reversal = TradingStrategy(params=settings_reversal_usdjpy)
 
@@ -160,16 +159,26 @@ if __name__ == '__main__':
     end_date = None
     start_date = "2022-08-01"
     end_date = "2022-11-01"
-    df = filter_dataframe_by_date(df, start_date, end_date)
+    # 必要な月のパーティションだけを読み込む
+    df = store.load(symbol, timeframe, start_date, end_date)
 
     trade_conditions = [
         # (st_triangle.trade_conditions_func, "trend line trade"),
-        (st_reversal.trade_logic_trend_reversal, "trend reversal")
+        # (batch_trade_conditions(df, TriangleBacktest(st_triangle)), "trend line trade (batch)"),
+        # (st_reversal.trade_logic_trend_reversal, "trend reversal"),
+        (batch_trade_conditions(df, TrendReversalBacktest(st_reversal)), "trend reversal (batch)")
     ]
 
     # Execute the trade logic
+    # 全ての戦略を1回のバーのループでまとめて実行する
+    # (パラメーターを変えて比べる場合は backtest.add_trend_reversal(params) で指標を共有する)
+    backtest = MultiStrategyBacktest()
     for trade_condition, description in trade_conditions:
-        result = trade_logic(df, trade_condition, st_triangle.base_spread_pips)
+        backtest.add(trade_condition, description)
+    ledgers = backtest.run(df)
+
+    for description, ledger in ledgers.items():
+        result = trade_results_from_ledger(ledger)
 
         # Plot using modified plot function
         plot_df(df, 
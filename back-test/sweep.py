@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from modules.bar_store import BarStore
+from modules.parameter_sweep import ParameterSweep, parameter_grid, random_search
+
+settings_reversal_usdjpy = {
+    'symbol': 'USDJPY',
+    'risk_reward_ratio': 1.0,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 500,
+    'distance': 7,
+    'candle_size_pips': 0.05,
+}
+
+# コメントに書いていた調整範囲
+grid_reversal_usdjpy = {
+    'df_sliced_period': [300, 400, 500],
+    'distance': [5, 6, 7],
+    'candle_size_pips': [0.04, 0.045, 0.05],
+}
+
+random_space_reversal_usdjpy = {
+    'df_sliced_period': (300, 500),
+    'distance': (5, 7),
+    'candle_size_pips': (0.04, 0.05),
+}
+
+if __name__ == '__main__':
+    start_date = "2022-08-01"
+    end_date = "2022-11-01"
+    df = BarStore('./bars').load("USDJPY", 1, start_date, end_date)
+
+    settings = parameter_grid(settings_reversal_usdjpy, grid_reversal_usdjpy)
+    # settings = random_search(settings_reversal_usdjpy, random_space_reversal_usdjpy, n_iter=50, seed=0)
+
+    current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+    output_path = f"./csv/sweep_trend_reversal_{current_time}.csv"
+
+    sweep = ParameterSweep('trend_reversal', rank_by='profit_factor')
+    results = sweep.run(df, settings, output_path)
+    print(results.head(20).to_string(index=False))
+    print(f"{output_path} has been saved.")
@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from modules.bar_store import BarStore
+from modules.parameter_sweep import parameter_grid
+from modules.walk_forward import WalkForward
+
+settings_reversal_usdjpy = {
+    'symbol': 'USDJPY',
+    'risk_reward_ratio': 1.0,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 500,
+    'distance': 7,
+    'candle_size_pips': 0.05,
+}
+
+grid_reversal_usdjpy = {
+    'df_sliced_period': [300, 400, 500],
+    'distance': [5, 6, 7],
+    'candle_size_pips': [0.04, 0.045, 0.05],
+}
+
+if __name__ == '__main__':
+    # 3か月で選んだ設定を次の1か月で使う
+    df = BarStore('./bars').load("USDJPY", 1, "2022-08-01", "2023-08-01")
+    settings = parameter_grid(settings_reversal_usdjpy, grid_reversal_usdjpy)
+
+    walk_forward = WalkForward('trend_reversal', in_sample='90D', out_of_sample='30D',
+                               rank_by='profit_factor', cache_dir='./cache/walk_forward')
+    windows, metrics = walk_forward.run(df, settings)
+
+    columns = ['out_of_sample_start', 'out_of_sample_end', 'df_sliced_period', 'distance', 'candle_size_pips',
+               'is_profit_factor', 'oos_profit_factor', 'oos_total_pips']
+    print(windows[[c for c in columns if c in windows.columns]].to_string(index=False))
+    for key, value in metrics.summary().items():
+        print(f"{key}: {value}")
+
+    current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+    output_path = f"./csv/walk_forward_trend_reversal_{current_time}.csv"
+    windows.to_csv(output_path, index=False)
+    print(f"{output_path} has been saved.")
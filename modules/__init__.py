@@ -1,2 +1,66 @@
-from .strategy import TradingStrategy
-from .resampler import ResampleData
\ No newline at end of file
+"""
+戦略・バックテスト・ライブ取引の部品
+
+`from modules import TradingStrategy` のように使う。
+各サブモジュールは名前を初めて参照したときに読み込むので、
+ライブ取引で使わないもの (バックテストの numba カーネル、scipy など) の読み込みで起動が遅くならない。
+"""
+import importlib
+
+# 名前: 定義しているサブモジュール
+_EXPORTS = {
+    'TradingStrategy': 'strategy',
+    'ResampleData': 'resampler',
+    'MultiTimeframeResampler': 'resampler',
+    'TriangleStrategy': 'triangle_strategy',
+    'PivotDetector': 'pivots',
+    'TrendReversalBacktest': 'reversal_backtest',
+    'EMA': 'indicators',
+    'WindowEMA': 'indicators',
+    'RollingMean': 'indicators',
+    'ATR': 'indicators',
+    'RSI': 'indicators',
+    'TriangleBacktest': 'triangle_backtest',
+    'BarStore': 'bar_store',
+    'BarFeed': 'bar_feed',
+    'FakeRateSource': 'bar_feed',
+    'BarCloseScheduler': 'scheduler',
+    'TickBacktest': 'tick_backtest',
+    'TICK_DTYPE': 'tick_backtest',
+    'ticks_from_mt5': 'tick_backtest',
+    'bars_from_ticks': 'tick_backtest',
+    'FeatureMatrix': 'features',
+    'Instrumentation': 'instrumentation',
+    'Position': 'ledger',
+    'TradeLedger': 'ledger',
+    'TradeMetrics': 'metrics',
+    'ComputationCache': 'computation_cache',
+    'OrderGateway': 'order_gateway',
+    'FakeBroker': 'order_gateway',
+    'TerminalCache': 'terminal_cache',
+    'SimulatedTerminal': 'mt5_simulator',
+    'SimulatedClock': 'mt5_simulator',
+    'MultiStrategyBacktest': 'multi_backtest',
+    'SharedIndicators': 'multi_backtest',
+    'PriceLevelIndex': 'price_levels',
+    'TrendLine': 'trendlines',
+    'RollingLineFit': 'trendlines',
+    'fit_line': 'trendlines',
+    'support_resistance': 'trendlines',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # 2回目からはモジュールの属性として直接見つかる
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
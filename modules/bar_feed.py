@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from .bar_store import BAR_COLUMNS
+
+# copy_rates_* が返す構造化配列と同じ並び
+RATES_DTYPE = np.dtype([(col, dtype) for col, dtype in BAR_COLUMNS.items()])
+
+
+class BarFeed:
+    """
+    直近 capacity 本のローソク足をリングバッファに保持し、MT5 からは前回より新しいバーだけを取得する
+
+    source は copy_rates_from_pos(symbol, timeframe, start_pos, count) を持つもの
+    （MetaTrader5 モジュールそのもの、またはテスト用の FakeRateSource）。
+
+    各列は capacity の2倍の配列に書き込み、直近 capacity 本が常に連続した範囲になるようにする。
+    frame() はその範囲をコピーせずに参照する DataFrame を返す（次の poll() までは内容が変わらない）。
+
+    copy_rates_from_pos の位置 0 は形成中の足なので、最後の行は確定していない (poll() のたびに上書きされる)。
+    判定には最後の行を除いた closed_frame() / closed_arrays() を使う。
+    """
+    def __init__(self, source, symbol, timeframe, capacity=500, fetch_count=10):
+        self.source = source
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.capacity = capacity
+        self.fetch_count = fetch_count
+
+        self.columns = {col: np.zeros(capacity * 2, dtype=dtype) for col, dtype in BAR_COLUMNS.items()}
+        self.head = 0   # 次に書き込む位置
+        self.size = 0   # 保持している本数
+        self.last_time = None
+        self.gaps = []  # (取得できていた最後の時刻, 補完した最初の時刻, 補完した本数)
+
+    def __len__(self):
+        return self.size
+
+    def poll(self):
+        """
+        新しいバーを取得してバッファに追加する
+        最後のバー（形成中の足）は毎回取り直して上書きする
+
+        Returns: 追加したバーの本数 (取得に失敗した場合は None)
+        """
+        if self.last_time is None:
+            rates = self.source.copy_rates_from_pos(self.symbol, self.timeframe, 0, self.capacity)
+            if rates is None:
+                return None
+            self._append(rates)
+            return len(rates)
+
+        count = self.fetch_count
+        while True:
+            rates = self.source.copy_rates_from_pos(self.symbol, self.timeframe, 0, count)
+            if rates is None:
+                return None
+            if len(rates) == 0:
+                return 0
+
+            times = rates['time']
+            if times[0] <= self.last_time:
+                break
+
+            # 前回の最後のバーまで届かない = 接続が切れていた間のバーがある
+            if count >= self.capacity or len(rates) < count:
+                # バッファより長く途切れた、または履歴がそこまで無い場合は取り直す
+                self.gaps.append((self.last_time, int(times[0]), len(rates)))
+                self._reset()
+                self._append(rates[-self.capacity:])
+                return len(rates)
+            count = min(count * 4, self.capacity)
+
+        new = rates[times >= self.last_time]
+        if len(new) and new['time'][0] == self.last_time:
+            self._overwrite_last(new[0])
+            new = new[1:]
+
+        if count > self.fetch_count and len(new) > 0:
+            self.gaps.append((self.last_time, int(new['time'][0]), len(new)))
+
+        self._append(new)
+        return len(new)
+
+    def arrays(self):
+        """
+        直近のバーを列ごとの配列（バッファのビュー）で返す
+        'time' は datetime64[s] として参照する
+        """
+        start = self.head - self.size
+        arrays = {col: values[start:self.head] for col, values in self.columns.items()}
+        arrays['time'] = arrays['time'].view('datetime64[s]')
+        return arrays
+
+    def frame(self):
+        return pd.DataFrame(self.arrays(), copy=False)
+
+    def closed_arrays(self):
+        """
+        確定した足だけを列ごとの配列で返す (形成中の最後の足を除く)
+        """
+        return {col: values[:-1] for col, values in self.arrays().items()}
+
+    def closed_frame(self):
+        return pd.DataFrame(self.closed_arrays(), copy=False)
+
+    def _append(self, rates):
+        n = len(rates)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            rates = rates[-self.capacity:]
+            n = self.capacity
+            self.head = 0
+            self.size = 0
+        elif self.head + n > len(self.columns['time']):
+            # 後半まで書き込んだら、保持しているバーを先頭に詰め直す
+            start = self.head - self.size
+            for values in self.columns.values():
+                values[:self.size] = values[start:self.head]
+            self.head = self.size
+
+        for col, values in self.columns.items():
+            values[self.head:self.head + n] = rates[col]
+        self.head += n
+        self.size = min(self.size + n, self.capacity)
+        self.last_time = int(rates['time'][-1])
+
+    def _overwrite_last(self, rate):
+        for col, values in self.columns.items():
+            values[self.head - 1] = rate[col]
+
+    def _reset(self):
+        self.head = 0
+        self.size = 0
+        self.last_time = None
+
+
+class FakeRateSource:
+    """
+    MetaTrader5 の代わりに手元のデータを返す（BarFeed を MT5 の無い環境で動かすため）
+
+    now 本目までが取得できるものとして、advance() で時間を進める。
+    connected を False にすると copy_rates_from_pos が None を返す（切断の再現）。
+    """
+    def __init__(self, rates, now=0):
+        self.rates = rates
+        self.now = now
+        self.connected = True
+        self.requests = []
+
+    @classmethod
+    def from_dataframe(cls, df, now=0):
+        rates = np.zeros(len(df), dtype=RATES_DTYPE)
+        for col in RATES_DTYPE.names:
+            if col not in df.columns:
+                continue
+            values = df[col].values
+            if col == 'time' and values.dtype.kind in 'OUM':
+                values = pd.to_datetime(df[col]).values.astype('datetime64[s]').astype(np.int64)
+            rates[col] = values
+        return cls(rates, now)
+
+    def advance(self, bars=1):
+        self.now = min(self.now + bars, len(self.rates))
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self.requests.append(count)
+        if not self.connected:
+            return None
+        end = max(self.now - start_pos, 0)
+        return self.rates[max(end - count, 0):end].copy()
+
+    def last_error(self):
+        return (1, 'Success') if self.connected else (-10004, 'No IPC connection')
@@ -0,0 +1,197 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# MT5 の copy_rates_* が返す列と型
+BAR_COLUMNS = {
+    'time': np.int64,   # UNIX 時間 (秒)
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'tick_volume': np.int64,
+    'spread': np.int32,
+    'real_volume': np.int64,
+}
+
+# 書き込み中のパーティションと、置き換えで退避した古いパーティションのディレクトリ名の接尾辞
+TMP_SUFFIX = '.tmp'
+OLD_SUFFIX = '.old'
+
+
+class BarStore:
+    """
+    ローソク足を通貨ペア・時間足ごとに月単位のパーティションで保存する
+
+    レイアウト: {root}/{symbol}/{timeframe}/{YYYY-MM}/{列名}.npy
+    各列は NumPy の .npy ファイルで、読み込み時はメモリマップするのでパースもコピーも不要。
+    追加するときは対象の月のパーティションだけを書き直し、同じ時刻のバーは新しい方で上書きする。
+    パーティションは {YYYY-MM}.tmp に全ての列を書いてからディレクトリごと置き換えるので、
+    書き込みが途中で止まっても古い列と新しい列が混ざったパーティションは残らない。
+    """
+    def __init__(self, root='bars'):
+        self.root = root
+
+    def symbol_dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol, str(timeframe))
+
+    def partitions(self, symbol, timeframe):
+        path = self.symbol_dir(symbol, timeframe)
+        if not os.path.isdir(path):
+            return []
+        names = set()
+        for name in os.listdir(path):
+            if not os.path.isdir(os.path.join(path, name)) or name.endswith(TMP_SUFFIX):
+                continue
+            # 置き換えの途中で止まった場合は .old の方を読む
+            names.add(name[:-len(OLD_SUFFIX)] if name.endswith(OLD_SUFFIX) else name)
+        return sorted(names)
+
+    def write(self, symbol, timeframe, rates):
+        """
+        rates: copy_rates_* の戻り値 (構造化配列) または同じ列を持つ DataFrame
+        """
+        columns = self._to_columns(rates)
+        if len(columns['time']) == 0:
+            return
+
+        months = columns['time'].astype('datetime64[s]').astype('datetime64[M]')
+        for month in np.unique(months):
+            mask = months == month
+            new = {col: values[mask] for col, values in columns.items()}
+            partition = str(month)
+
+            existing = self._read_partition(symbol, timeframe, partition, mmap_mode=None)
+            if existing is not None:
+                new = self._merge(existing, new)
+            self._write_partition(symbol, timeframe, partition, new)
+
+    def load_arrays(self, symbol, timeframe, start=None, end=None, columns=None):
+        """
+        start <= time <= end のバーを列ごとの配列で返す
+        1つのパーティションに収まる範囲はメモリマップのスライスをそのまま返す
+        """
+        columns = list(columns or BAR_COLUMNS)
+        start_sec = self._to_seconds(start) if start is not None else None
+        end_sec = self._to_seconds(end) if end is not None else None
+
+        chunks = []
+        for partition in self._partitions_in_range(symbol, timeframe, start_sec, end_sec):
+            data = self._read_partition(symbol, timeframe, partition, mmap_mode='r', columns=set(columns) | {'time'})
+            times = data['time']
+            lo = 0 if start_sec is None else np.searchsorted(times, start_sec, side='left')
+            hi = len(times) if end_sec is None else np.searchsorted(times, end_sec, side='right')
+            if hi > lo:
+                chunks.append({col: data[col][lo:hi] for col in columns})
+
+        if not chunks:
+            return {col: np.empty(0, dtype=BAR_COLUMNS[col]) for col in columns}
+        if len(chunks) == 1:
+            return chunks[0]
+        return {col: np.concatenate([chunk[col] for chunk in chunks]) for col in columns}
+
+    def load(self, symbol, timeframe, start=None, end=None, columns=None):
+        """
+        load_arrays と同じ範囲を DataFrame で返す ('time' は datetime64)
+        """
+        arrays = self.load_arrays(symbol, timeframe, start, end, columns)
+        df = pd.DataFrame(arrays)
+        if 'time' in df.columns:
+            df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df
+
+    def last_time(self, symbol, timeframe):
+        partitions = self.partitions(symbol, timeframe)
+        if not partitions:
+            return None
+        times = self._read_partition(symbol, timeframe, partitions[-1], mmap_mode='r', columns={'time'})['time']
+        return int(times[-1]) if len(times) else None
+
+    def _partitions_in_range(self, symbol, timeframe, start_sec, end_sec):
+        partitions = self.partitions(symbol, timeframe)
+        if start_sec is not None:
+            first = str(np.datetime64(start_sec, 's').astype('datetime64[M]'))
+            partitions = [p for p in partitions if p >= first]
+        if end_sec is not None:
+            last = str(np.datetime64(end_sec, 's').astype('datetime64[M]'))
+            partitions = [p for p in partitions if p <= last]
+        return partitions
+
+    def _read_partition(self, symbol, timeframe, partition, mmap_mode='r', columns=None):
+        path = os.path.join(self.symbol_dir(symbol, timeframe), partition)
+        if not os.path.isdir(path):
+            path += OLD_SUFFIX
+            if not os.path.isdir(path):
+                return None
+        data = {
+            col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode=mmap_mode)
+            for col in BAR_COLUMNS if columns is None or col in columns
+        }
+        lengths = {col: len(values) for col, values in data.items()}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"Corrupted bar partition {path}: column lengths differ {lengths}")
+        return data
+
+    def _write_partition(self, symbol, timeframe, partition, columns):
+        path = os.path.join(self.symbol_dir(symbol, timeframe), partition)
+        tmp_path = path + TMP_SUFFIX
+        old_path = path + OLD_SUFFIX
+
+        # 前回の置き換えが途中で止まっていたら元に戻す
+        if not os.path.isdir(path) and os.path.isdir(old_path):
+            os.rename(old_path, path)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        # 全ての列を一時ディレクトリに書いてから、パーティションのディレクトリごと置き換える
+        os.makedirs(tmp_path)
+        for col, values in columns.items():
+            with open(os.path.join(tmp_path, f"{col}.npy"), 'wb') as f:
+                np.save(f, np.ascontiguousarray(values, dtype=BAR_COLUMNS[col]))
+                f.flush()
+                os.fsync(f.fileno())
+
+        # ディレクトリは os.replace で上書きできないため、古い方を退避してから入れ替える
+        # (入れ替えの間に止まっても、古い方が .old として読める)
+        if os.path.isdir(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def _merge(self, existing, new):
+        merged = {col: np.concatenate([existing[col], new[col]]) for col in BAR_COLUMNS}
+
+        # 同じ時刻は後から追加した方を残す
+        reversed_times = merged['time'][::-1]
+        _, first_in_reversed = np.unique(reversed_times, return_index=True)
+        keep = len(reversed_times) - 1 - first_in_reversed
+        return {col: values[keep] for col, values in merged.items()}
+
+    def _to_columns(self, rates):
+        if isinstance(rates, pd.DataFrame):
+            get = lambda col: rates[col].values if col in rates.columns else None
+        else:
+            names = rates.dtype.names or ()
+            get = lambda col: rates[col] if col in names else None
+
+        times = get('time')
+        if times is None:
+            raise ValueError("rates must have a 'time' column")
+        if times.dtype.kind in 'OUM':
+            times = pd.to_datetime(times).values.astype('datetime64[s]').astype(np.int64)
+
+        columns = {'time': np.asarray(times, dtype=np.int64)}
+        for col, dtype in BAR_COLUMNS.items():
+            if col == 'time':
+                continue
+            values = get(col)
+            columns[col] = np.zeros(len(times), dtype=dtype) if values is None else np.asarray(values, dtype=dtype)
+
+        order = np.argsort(columns['time'], kind='stable')
+        return {col: values[order] for col, values in columns.items()}
+
+    def _to_seconds(self, value):
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        return int(pd.Timestamp(value).value // 10**9)
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class ComputationCache:
+    """
+    バーごとの極値・トレンドライン・水平線の計算結果を共有する LRU キャッシュ
+
+    キーは (計算の種類, パラメーター..., ウィンドウの終わりのバー位置, ウィンドウの長さ) とする。
+    同じバーの判定の中で同じ計算を何度呼んでも1回だけ計算する。
+
+    バーの位置はデータ (DataFrame) ごとの番号なので、bind() で別のデータに切り替わったら全て消す。
+    （ライブでは毎回新しい DataFrame を作るので、足が変わるたびに消える）
+    hits / misses / evictions で効いているかを確認できる。
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.source = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, source):
+        # 参照を持っておくことで、別のデータが同じ id を使い回すことはない
+        if source is not self.source:
+            self.entries.clear()
+            self.source = source
+
+    def get(self, key, compute):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return value
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.source = None
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'hit_rate': self.hits / calls if calls else 0,
+        }
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from .pivots import PeakTracker
+
+
+class FeatureMatrix:
+    """
+    バーごとの特徴量を1つの2次元配列 (行: バー, 列: 特徴量) にまとめたもの
+
+    1本のバーの特徴量は values[i] の連続した1行に並ぶので、バーごとの判定は行を読むだけでよい。
+    index[列名] で列の位置を引く。
+    """
+    def __init__(self, columns, dtype=np.float64):
+        self.columns = list(columns)
+        self.index = {name: k for k, name in enumerate(self.columns)}
+        self.dtype = dtype
+        self.values = None
+
+    @classmethod
+    def from_columns(cls, columns, dtype=np.float64):
+        """
+        columns: {列名: 同じ長さの配列}
+        """
+        matrix = cls(columns, dtype)
+        length = len(next(iter(columns.values()))) if columns else 0
+        matrix.values = np.empty((length, len(columns)), dtype=dtype)
+        for k, values in enumerate(columns.values()):
+            matrix.values[:, k] = values
+        return matrix
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def __getitem__(self, name):
+        return self.values[:, self.index[name]]
+
+    def row(self, i):
+        return self.values[i]
+
+    def to_dataframe(self, index=None):
+        return pd.DataFrame(self.values, columns=self.columns, index=index)
+
+
+def confirmed_pivots(values, distance):
+    """
+    find_peaks(values, distance=distance) の極値を、確定したバーで記録する (先読みしない)
+
+    各バーまでの値だけで極値を検出し、極値から distance 本経っても残っているものを確定とする。
+    Returns: (確定したバーの位置, 極値の位置) の配列
+    """
+    tracker = PeakTracker(distance, window=3 * distance)
+    version = None
+    kept = set()
+    confirmed_at = []
+    positions = []
+
+    for t, value in enumerate(np.asarray(values, dtype=float).tolist()):
+        tracker.update(value)
+        if tracker.version != version:
+            version = tracker.version
+            kept = set(tracker.positions().tolist())
+        if t - distance in kept:
+            confirmed_at.append(t)
+            positions.append(t - distance)
+
+    return np.array(confirmed_at, dtype=np.intp), np.array(positions, dtype=np.intp)
+
+
+def pivot_features(values, distance, length=None):
+    """
+    confirmed_pivots から、各バーの時点で分かっている極値の特徴量を作る
+    - marks: 極値が確定したバーにその値 (それ以外は NaN)
+    - last: 直近に確定した極値の値
+    - linear: 直近2つの確定した極値を通る直線をそのバーまで延ばした値
+    """
+    values = np.asarray(values, dtype=float)
+    length = len(values) if length is None else length
+    confirmed_at, positions = confirmed_pivots(values, distance)
+    pivot_values = values[positions]
+
+    marks = np.full(length, np.nan)
+    marks[confirmed_at] = pivot_values
+
+    # 各バーより前 (そのバーを含む) に確定した最後の極値の番号
+    latest = np.searchsorted(confirmed_at, np.arange(length), side='right') - 1
+    known = latest >= 0
+    last = np.full(length, np.nan)
+    last[known] = pivot_values[latest[known]]
+
+    linear = np.full(length, np.nan)
+    has_two = latest >= 1
+    k = latest[has_two]
+    x1, x0 = positions[k], positions[k - 1]
+    y1, y0 = pivot_values[k], pivot_values[k - 1]
+    slope = (y1 - y0) / (x1 - x0)
+    linear[has_two] = y1 + slope * (np.arange(length)[has_two] - x1)
+
+    return marks, last, linear
@@ -0,0 +1,254 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+class EMA:
+    """
+    pd.Series.ewm(span=span / alpha=alpha, min_periods=min_periods, adjust=False).mean() を1本ずつ更新する
+
+    pandas と同じ式で計算するので、全期間をまとめて計算した値と一致する。
+    """
+    def __init__(self, span=None, alpha=None, min_periods=0):
+        self.span = span
+        self.alpha_arg = alpha
+        self.min_periods = max(min_periods, 1)
+
+        # pandas と同じく重心 (com) を経由して alpha を求める
+        com = (span - 1) / 2 if span is not None else (1 - alpha) / alpha
+        self.alpha = 1. / (1. + com)
+        self.decay = 1. - self.alpha
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.weighted = math.nan
+
+    @property
+    def value(self):
+        return self.weighted if self.count >= self.min_periods else math.nan
+
+    def update(self, x):
+        if self.count == 0:
+            self.weighted = x
+        elif self.weighted != x:
+            self.weighted = (self.decay * self.weighted + self.alpha * x) / (self.decay + self.alpha)
+        self.count += 1
+        return self.value
+
+    def compute(self, values):
+        series = pd.Series(values, dtype=float)
+        if self.span is not None:
+            ewm = series.ewm(span=self.span, min_periods=self.min_periods, adjust=False)
+        else:
+            ewm = series.ewm(alpha=self.alpha_arg, min_periods=self.min_periods, adjust=False)
+        return ewm.mean().values
+
+    def get_state(self):
+        return {'count': self.count, 'weighted': self.weighted}
+
+    def set_state(self, state):
+        self.count = state['count']
+        self.weighted = state['weighted']
+
+
+class WindowEMA:
+    """
+    直近 window 本だけで計算した EMA（ウィンドウ先頭の値で初期化）を1本ずつ更新する
+
+    pd.Series(closes[-window:]).ewm(span=span, adjust=False).mean().values[-1] に相当する。
+    全期間の EMA に、ウィンドウ先頭での初期値との差を減衰させて足すことで O(1) で求める。
+    """
+    def __init__(self, span, window):
+        self.window = window
+        self.ema = EMA(span=span)
+        self.start_decay = self.ema.decay ** (window - 1)
+        self.reset()
+
+    def reset(self):
+        self.ema.reset()
+        self.history = deque(maxlen=self.window)  # (値, 全期間の EMA)
+
+    @property
+    def value(self):
+        if not self.history:
+            return math.nan
+
+        ema = self.ema.weighted
+        if self.ema.count > self.window:
+            first_value, first_ema = self.history[0]
+            ema += self.start_decay * (first_value - first_ema)
+        return ema
+
+    def update(self, x):
+        self.history.append((x, self.ema.update(x)))
+        return self.value
+
+    def compute(self, values):
+        values = np.asarray(values, dtype=float)
+        ema = np.array(self.ema.compute(values))
+        starts = np.arange(self.window, len(values)) - self.window + 1
+        ema[self.window:] += self.start_decay * (values[starts] - ema[starts])
+        return ema
+
+    def get_state(self):
+        return {'ema': self.ema.get_state(), 'history': [list(item) for item in self.history]}
+
+    def set_state(self, state):
+        self.ema.set_state(state['ema'])
+        self.history = deque((tuple(item) for item in state['history']), maxlen=self.window)
+
+
+class RollingMean:
+    """
+    直近 period 本の単純平均を1本ずつ更新する
+
+    累積和の差で求めるので更新は O(1)。np.cumsum を使った compute() と同じ値になる。
+    """
+    def __init__(self, period):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.
+        self.totals = deque([0.], maxlen=self.period + 1)
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return math.nan
+        return (self.totals[-1] - self.totals[0]) / self.period
+
+    def update(self, x):
+        self.total += x
+        self.totals.append(self.total)
+        self.count += 1
+        return self.value
+
+    def compute(self, values):
+        totals = np.concatenate([[0.], np.cumsum(np.asarray(values, dtype=float))])
+        mean = np.full(len(totals) - 1, np.nan)
+        mean[self.period - 1:] = (totals[self.period:] - totals[:-self.period]) / self.period
+        return mean
+
+    def get_state(self):
+        return {'count': self.count, 'total': self.total, 'totals': list(self.totals)}
+
+    def set_state(self, state):
+        self.count = state['count']
+        self.total = state['total']
+        self.totals = deque(state['totals'], maxlen=self.period + 1)
+
+
+class ATR:
+    """
+    ta.volatility.AverageTrueRange(window=window) を1本ずつ更新する
+
+    ta と同じく、最初の window 本は True Range の平均で初期化し、それまでは 0 を返す。
+    """
+    def __init__(self, window=14):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.prev_close = math.nan
+        self.true_ranges = []
+        self.atr = 0.
+
+    @property
+    def value(self):
+        return self.atr
+
+    def update(self, high, low, close):
+        if math.isnan(self.prev_close):
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        self.count += 1
+
+        if self.count < self.window:
+            self.true_ranges.append(true_range)
+        elif self.count == self.window:
+            self.true_ranges.append(true_range)
+            self.atr = np.array(self.true_ranges).sum() / self.window
+            self.true_ranges = []
+        else:
+            self.atr = (self.atr * (self.window - 1) + true_range) / float(self.window)
+        return self.atr
+
+    def compute(self, highs, lows, closes):
+        highs = np.asarray(highs, dtype=float)
+        lows = np.asarray(lows, dtype=float)
+        prev_closes = np.r_[np.nan, np.asarray(closes, dtype=float)[:-1]]
+        true_ranges = np.fmax(highs - lows, np.fmax(np.abs(highs - prev_closes), np.abs(lows - prev_closes)))
+
+        # ta と同じ漸化式なので1本ずつ計算する
+        atr = np.zeros(len(true_ranges))
+        if len(true_ranges) < self.window:
+            return atr
+        value = true_ranges[:self.window].sum() / self.window
+        atr[self.window - 1] = value
+        window = self.window
+        for i, true_range in enumerate(true_ranges[window:].tolist(), window):
+            value = (value * (window - 1) + true_range) / float(window)
+            atr[i] = value
+        return atr
+
+    def get_state(self):
+        return {'count': self.count, 'prev_close': self.prev_close, 'true_ranges': list(self.true_ranges), 'atr': self.atr}
+
+    def set_state(self, state):
+        self.count = state['count']
+        self.prev_close = state['prev_close']
+        self.true_ranges = list(state['true_ranges'])
+        self.atr = state['atr']
+
+
+class RSI:
+    """
+    ta.momentum.RSIIndicator(window=window) を1本ずつ更新する
+    """
+    def __init__(self, window=14):
+        self.window = window
+        self.up = EMA(alpha=1 / window, min_periods=window)
+        self.down = EMA(alpha=1 / window, min_periods=window)
+        self.reset()
+
+    def reset(self):
+        self.up.reset()
+        self.down.reset()
+        self.prev_close = math.nan
+
+    @property
+    def value(self):
+        up, down = self.up.value, self.down.value
+        if math.isnan(down):
+            return math.nan
+        if down == 0:
+            return 100.
+        return 100 - (100 / (1 + up / down))
+
+    def update(self, close):
+        diff = close - self.prev_close
+        self.prev_close = close
+        self.up.update(diff if diff > 0 else 0.)
+        self.down.update(-diff if diff < 0 else -0.)
+        return self.value
+
+    def compute(self, closes):
+        diff = np.diff(np.asarray(closes, dtype=float), prepend=np.nan)
+        up = self.up.compute(np.where(diff > 0, diff, 0.))
+        down = self.down.compute(np.where(diff < 0, -diff, 0.))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(down == 0, 100., 100 - (100 / (1 + up / down)))
+
+    def get_state(self):
+        return {'up': self.up.get_state(), 'down': self.down.get_state(), 'prev_close': self.prev_close}
+
+    def set_state(self, state):
+        self.up.set_state(state['up'])
+        self.down.set_state(state['down'])
+        self.prev_close = state['prev_close']
@@ -0,0 +1,216 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+import numpy as np
+import pandas as pd
+
+
+class RollingHistogram:
+    """
+    直近 size 回の計測値 (秒) をリングバッファに持ち、パーセンタイルを返す
+    記録は配列への代入だけなので、ホットパスでも使える
+    """
+    def __init__(self, size=1000):
+        self.values = np.zeros(size)
+        self.count = 0
+        self.total = 0.
+
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+        self.total += seconds
+
+    def recent(self):
+        return self.values[:min(self.count, len(self.values))]
+
+    def percentiles(self, qs=(50, 90, 99)):
+        recent = self.recent()
+        if len(recent) == 0:
+            return [np.nan] * len(qs)
+        return np.percentile(recent, qs).tolist()
+
+
+class Timer:
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.record(self.name, time.perf_counter() - self.start)
+
+
+class SamplingProfiler:
+    """
+    別スレッドから対象スレッドのスタックを一定間隔で記録する
+    iteration の間だけ記録し、遅かった iteration のものだけを残す
+    """
+    def __init__(self, interval=0.001, depth=8):
+        self.interval = interval
+        self.depth = depth
+        self.active = {}  # スレッド ID: Counter(スタック)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def begin(self, thread_id):
+        with self.lock:
+            self.active[thread_id] = Counter()
+
+    def end(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, samples in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._stack(frame)] += 1
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.depth:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+
+class Instrumentation:
+    """
+    ライブループの各区間の時間と回数を記録する
+
+    - timer(name): with で囲んだ区間の時間を記録する
+    - wrap(obj, method, name): インスタンスのメソッドを計測付きに差し替える
+    - count(name): 回数を数える
+    - iteration(): 1回のループ全体。profile_threshold (秒) を指定すると、
+      それより遅かった回のスタックのサンプルを slow_iterations に残す
+    - report(): report_interval 秒ごとに区間ごとのパーセンタイルを表示する
+    """
+    def __init__(self, history=1000, report_interval=60, profile_threshold=None, profile_interval=0.001):
+        self.history = history
+        self.report_interval = report_interval
+        self.histograms = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.last_report = time.monotonic()
+
+        self.profile_threshold = profile_threshold
+        self.profiler = SamplingProfiler(profile_interval) if profile_threshold is not None else None
+        self.slow_iterations = deque(maxlen=20)
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = RollingHistogram(self.history)
+            histogram.add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def wrap(self, obj, method, name=None):
+        func = getattr(obj, method)
+        name = name or method
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+        return timed
+
+    def iteration(self, name='iteration'):
+        return Iteration(self, name)
+
+    def summary(self):
+        with self.lock:
+            rows = []
+            for name, histogram in self.histograms.items():
+                p50, p90, p99 = histogram.percentiles()
+                recent = histogram.recent()
+                rows.append({
+                    'name': name,
+                    'count': histogram.count,
+                    'p50_ms': p50 * 1000,
+                    'p90_ms': p90 * 1000,
+                    'p99_ms': p99 * 1000,
+                    'max_ms': recent.max() * 1000 if len(recent) else np.nan,
+                    'total_s': histogram.total,
+                })
+            return pd.DataFrame(rows, columns=['name', 'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'total_s'])
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_interval:
+            return False
+        self.last_report = now
+
+        print("===== Latency (recent {} samples) =====".format(self.history))
+        print(self.summary().to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        if self.counters:
+            print("- Counters: " + ", ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+        print("=======================================")
+        return True
+
+    def print_slow_iterations(self, top=10):
+        """
+        前回表示してから記録した遅い iteration のスタックを、多くサンプルされた順に表示する
+        """
+        while self.slow_iterations:
+            slow = self.slow_iterations.popleft()
+            print(f"===== Slow {slow['name']}: {slow['seconds'] * 1000:.1f}ms ({slow['samples']} samples) =====")
+            for stack, hits in slow['stacks'].most_common(top):
+                print(f"{hits:5d}  {' > '.join(stack[-3:])}")
+
+
+class Iteration:
+    __slots__ = ('instrumentation', 'name', 'start', 'thread_id')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        if self.instrumentation.profiler is not None:
+            self.instrumentation.profiler.begin(self.thread_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        ins = self.instrumentation
+        ins.record(self.name, seconds)
+
+        if ins.profiler is not None:
+            samples = ins.profiler.end(self.thread_id)
+            if seconds >= ins.profile_threshold:
+                ins.count(f"slow_{self.name}")
+                ins.slow_iterations.append({
+                    'name': self.name,
+                    'time': time.time(),
+                    'seconds': seconds,
+                    'samples': sum(samples.values()),
+                    'stacks': samples,
+                })
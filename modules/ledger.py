@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+ACTIONS = ('entry_long', 'entry_short', 'exit_long', 'exit_short')
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+TRADE_DTYPE = np.dtype([
+    ('index', 'i8'),
+    ('action', 'i1'),  # ACTIONS の番号
+    ('entry_price', 'f8'),
+    ('reversal_price', 'f8'),
+    ('take_profit_price', 'f8'),
+    ('stop_loss_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('gained_pips', 'f8'),
+])
+
+
+class Position:
+    """
+    保有中のポジション (portfolio)
+
+    今までの portfolio の辞書と同じく portfolio['take_profit'] のように読み書きできる。
+    決まった属性だけを __slots__ に持つので、辞書より小さく、イグジットしたら reset() で使い回せる。
+    """
+    __slots__ = ('position', 'entry_price', 'entry_point', 'trailing_stop', 'take_profit', 'stop_loss',
+                 'profit', 'pips', 'reversal_price', 'start_idx', 'end_idx')
+
+    def __init__(self, **values):
+        self.reset()
+        for key, value in values.items():
+            self[key] = value
+
+    def reset(self):
+        self.position = None  # "long" or "short"
+        self.entry_price = None
+        self.entry_point = 0
+        self.trailing_stop = 0
+        self.take_profit = None
+        self.stop_loss = None
+        self.profit = 0
+        self.pips = 0
+        self.reversal_price = None
+        self.start_idx = None
+        self.end_idx = None
+        return self
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def copy(self):
+        position = Position.__new__(Position)
+        for key in self.__slots__:
+            setattr(position, key, getattr(self, key))
+        return position
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self):
+        return f"Position({self.to_dict()})"
+
+
+class TradeLedger:
+    """
+    エントリー・イグジットの記録を NumPy の構造化配列に追記する
+
+    配列は足りなくなったら2倍に広げるので、追記は償却 O(1)。
+    メモリはバーの本数ではなく取引の回数に比例する。DataFrame には to_dataframe() で必要なときだけ変換する。
+    """
+    def __init__(self, capacity=1024):
+        self.records = np.zeros(capacity, dtype=TRADE_DTYPE)
+        self.size = 0
+
+    def append(self, index, action, entry_price, reversal_price, take_profit_price, stop_loss_price,
+               exit_price=0., gained_pips=0.):
+        if self.size == len(self.records):
+            self.records = np.resize(self.records, max(2 * len(self.records), 1))
+        self.records[self.size] = (
+            index, ACTION_CODES[action],
+            np.nan if entry_price is None else entry_price,
+            np.nan if reversal_price is None else reversal_price,
+            np.nan if take_profit_price is None else take_profit_price,
+            np.nan if stop_loss_price is None else stop_loss_price,
+            exit_price, gained_pips,
+        )
+        self.size += 1
+
+    def clear(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getitem__(self, name):
+        """
+        列の配列 (コピーしない)
+        """
+        return self.records[name][:self.size]
+
+    def view(self):
+        return self.records[:self.size]
+
+    def actions(self):
+        return np.array(ACTIONS, dtype=object)[self['action']]
+
+    def entries(self, action=None):
+        """
+        エントリーの記録だけを返す (action を指定した場合はその向きだけ)
+        """
+        codes = self['action']
+        mask = codes < ACTION_CODES['exit_long'] if action is None else codes == ACTION_CODES[action]
+        return self.view()[mask]
+
+    def exits(self, action=None):
+        """
+        イグジットの記録だけを返す (action を指定した場合はその向きだけ)
+        """
+        codes = self['action']
+        mask = codes >= ACTION_CODES['exit_long'] if action is None else codes == ACTION_CODES[action]
+        return self.view()[mask]
+
+    def to_dataframe(self):
+        df = pd.DataFrame(self.view())
+        df['action'] = self.actions()
+        return df
@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+from .ledger import ACTION_CODES
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def max_drawdown(equity):
+    """
+    Returns: (最大ドローダウン, 最大ドローダウンの期間 (本数), 高値を更新していない最長の期間 (本数))
+    """
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return 0., 0, 0
+    peak = np.maximum.accumulate(np.maximum(equity, 0))  # 開始時点の 0 も高値とする
+    drawdown = peak - equity
+    positions = np.arange(len(equity))
+    # 各時点の直前に高値を付けた位置
+    last_peak = np.maximum.accumulate(np.where(drawdown == 0, positions, -1))
+    underwater = positions - last_peak
+    deepest = int(np.argmax(drawdown))
+    return float(drawdown[deepest]), int(underwater[deepest]), int(underwater.max())
+
+
+def sharpe_ratio(returns, periods_per_year=None):
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) < 2:
+        return np.nan
+    std = returns.std(ddof=1)
+    ratio = returns.mean() / std if std > 0 else np.nan
+    return ratio * np.sqrt(periods_per_year) if periods_per_year else ratio
+
+
+def sortino_ratio(returns, periods_per_year=None):
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) < 2:
+        return np.nan
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    if downside == 0:
+        # 負けた期間が無い
+        return np.inf if returns.mean() > 0 else np.nan
+    ratio = returns.mean() / downside
+    return ratio * np.sqrt(periods_per_year) if periods_per_year else ratio
+
+
+def rolling_win_rate(pips, window=20):
+    """
+    直近 window 回のトレードの勝率 (window 回に満たない間は NaN)
+    """
+    wins = np.r_[0, np.cumsum(np.asarray(pips) > 0)]
+    rate = np.full(len(pips), np.nan)
+    if len(pips) >= window:
+        rate[window - 1:] = (wins[window:] - wins[:-window]) / window
+    return rate
+
+
+class TradeMetrics:
+    """
+    トレードの記録とバーのデータから成績の指標をまとめて計算する (ループを使わない)
+
+    - summary(): 取引回数・合計 pips・プロフィットファクター・勝率・期待値・最大ドローダウン・
+      シャープレシオ・ソルティノレシオ・保有率など
+    - equity(): バーごとの損益 (pips) の累計 (保有中は終値で評価する)
+    - trades(): トレードごとの損益と MAE/MFE (保有中に逆行・順行した最大の pips)
+    - rolling_win_rate(window) / by_hour() / by_weekday()
+
+    df (time, high, low, close) を渡さない場合は、トレード単位の指標だけを計算する。
+    """
+    def __init__(self, entry_index, exit_index, side, entry_price, pips, df=None, pip_value=0.01,
+                 periods_per_year=252):
+        self.entry_index = np.asarray(entry_index, dtype=np.int64)
+        self.exit_index = np.asarray(exit_index, dtype=np.int64)
+        self.side = np.asarray(side, dtype=np.int8)  # 1: long, -1: short
+        self.entry_price = np.asarray(entry_price, dtype=float)
+        self.pips = np.asarray(pips, dtype=float)
+        self.pip_value = pip_value
+        self.periods_per_year = periods_per_year
+
+        self.n_bars = None
+        self.times = self.highs = self.lows = self.closes = None
+        if df is not None:
+            self.n_bars = len(df)
+            self.highs = df['high'].values
+            self.lows = df['low'].values
+            self.closes = df['close'].values
+            if 'time' in df.columns:
+                self.times = pd.to_datetime(df['time']).values
+
+    @classmethod
+    def from_actions(cls, actions, exit_pips, df=None, **kwargs):
+        """
+        バックテストの run() が返す (actions, exit_pips) から作る
+        エントリー価格はエントリーしたバーの終値とする
+        """
+        actions = np.asarray(actions, dtype=object)
+        entries = np.flatnonzero((actions == 'entry_long') | (actions == 'entry_short'))
+        exits = np.flatnonzero((actions == 'exit_long') | (actions == 'exit_short'))
+        entries = entries[:len(exits)]  # 最後に保有中のトレードは数えない
+        side = np.where(actions[entries] == 'entry_long', 1, -1)
+        entry_price = df['close'].values[entries] if df is not None else np.full(len(entries), np.nan)
+        return cls(entries, exits, side, entry_price, np.asarray(exit_pips, dtype=float)[exits], df, **kwargs)
+
+    @classmethod
+    def from_ledger(cls, ledger, df=None, **kwargs):
+        """
+        TradeLedger から作る
+        """
+        entries = ledger.entries()
+        exits = ledger.exits()
+        entries = entries[:len(exits)]
+        side = np.where(entries['action'] == ACTION_CODES['entry_long'], 1, -1)
+        return cls(entries['index'], exits['index'], side, entries['entry_price'], exits['gained_pips'], df, **kwargs)
+
+    def __len__(self):
+        return len(self.pips)
+
+    def equity(self, mark_to_market=True):
+        """
+        バーごとの損益 (pips) の累計
+        mark_to_market: 保有中のトレードをそのバーの終値で評価する（False の場合はイグジットしたバーで確定した分だけ）
+        """
+        n = self.n_bars
+        equity = np.cumsum(np.bincount(self.exit_index, weights=self.pips, minlength=n))
+        if not mark_to_market or len(self) == 0:
+            return equity
+
+        # エントリーのバーから、イグジットの前のバーまで保有している (トレードは重ならない)
+        held_side = np.cumsum(np.bincount(self.entry_index, weights=self.side, minlength=n)
+                              - np.bincount(self.exit_index, weights=self.side, minlength=n))
+        held_entry = np.cumsum(np.bincount(self.entry_index, weights=self.entry_price, minlength=n)
+                               - np.bincount(self.exit_index, weights=self.entry_price, minlength=n))
+        held_entry[held_side == 0] = 0  # 累計の丸め誤差を残さない
+
+        return equity + held_side * (self.closes - held_entry) / self.pip_value
+
+    def exposure(self):
+        """
+        ポジションを持っていたバーの割合
+        """
+        if not self.n_bars:
+            return np.nan
+        return float((self.exit_index - self.entry_index).sum() / self.n_bars)
+
+    def excursions(self):
+        """
+        Returns: (MAE, MFE) エントリーの次のバーからイグジットのバーまでの高値・安値で、逆行・順行した最大の pips
+        """
+        if len(self) == 0:
+            return np.zeros(0), np.zeros(0)
+        # 各トレードの [エントリー+1, イグジット] を reduceat でまとめて求める (トレードは重ならない)
+        bounds = np.empty(2 * len(self), dtype=np.int64)
+        bounds[0::2] = self.entry_index + 1
+        bounds[1::2] = self.exit_index + 1
+        highs = np.append(self.highs, -np.inf)
+        lows = np.append(self.lows, np.inf)
+        highest = np.maximum.reduceat(highs, bounds)[0::2]
+        lowest = np.minimum.reduceat(lows, bounds)[0::2]
+
+        is_long = self.side == 1
+        adverse = np.where(is_long, self.entry_price - lowest, highest - self.entry_price) / self.pip_value
+        favorable = np.where(is_long, highest - self.entry_price, self.entry_price - lowest) / self.pip_value
+        return np.maximum(adverse, 0), np.maximum(favorable, 0)
+
+    def trades(self):
+        df = pd.DataFrame({
+            'entry_index': self.entry_index,
+            'exit_index': self.exit_index,
+            'side': np.where(self.side == 1, 'long', 'short'),
+            'entry_price': self.entry_price,
+            'pips': self.pips,
+            'bars_held': self.exit_index - self.entry_index,
+        })
+        if self.times is not None:
+            df.insert(0, 'entry_time', self.times[self.entry_index])
+            df.insert(1, 'exit_time', self.times[self.exit_index])
+        if self.highs is not None:
+            df['mae_pips'], df['mfe_pips'] = self.excursions()
+        return df
+
+    def rolling_win_rate(self, window=20):
+        return rolling_win_rate(self.pips, window)
+
+    def daily_returns(self, equity=None):
+        """
+        日ごとの損益 (pips)。時刻が無い場合は None
+        """
+        if self.times is None or self.n_bars == 0:
+            return None
+        equity = self.equity() if equity is None else equity
+        days = self.times.astype('datetime64[D]')
+        last_of_day = np.r_[np.flatnonzero(days[1:] != days[:-1]), self.n_bars - 1]
+        return np.diff(np.r_[0., equity[last_of_day]])
+
+    def _breakdown(self, keys, labels):
+        trades = np.bincount(keys, minlength=len(labels))
+        wins = np.bincount(keys, weights=self.pips > 0, minlength=len(labels))
+        pips = np.bincount(keys, weights=self.pips, minlength=len(labels))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'trades': trades,
+                'total_pips': pips,
+                'mean_pips': np.where(trades > 0, pips / trades, np.nan),
+                'win_rate': np.where(trades > 0, wins / trades, np.nan),
+            }, index=labels)
+
+    def _entry_times(self):
+        if self.times is None:
+            raise ValueError("by_hour / by_weekday need bar times: pass df with a 'time' column")
+        return pd.DatetimeIndex(self.times[self.entry_index])
+
+    def by_hour(self):
+        """
+        エントリーした時刻 (時) ごとの取引回数・損益・勝率
+        df に time の列が無い場合は ValueError
+        """
+        hours = self._entry_times().hour.values
+        return self._breakdown(hours, np.arange(24))
+
+    def by_weekday(self):
+        """
+        エントリーした曜日ごとの取引回数・損益・勝率
+        df に time の列が無い場合は ValueError
+        """
+        weekdays = self._entry_times().weekday.values
+        return self._breakdown(weekdays, WEEKDAYS)
+
+    def summary(self):
+        pips = self.pips
+        wins = pips[pips > 0]
+        losses = pips[pips < 0]
+        is_long = self.side == 1
+        long_pips = pips[is_long]
+        short_pips = pips[~is_long]
+        total_win = wins.sum()
+        total_loss = -losses.sum()
+
+        result = {
+            'total_trades': len(pips),
+            'total_pips': float(pips.sum()),
+            'profit_factor': float(total_win / total_loss) if total_loss != 0 else 0,
+            'long_trades': len(long_pips),
+            'long_win_rate': float((long_pips > 0).mean()) if len(long_pips) else 0,
+            'short_trades': len(short_pips),
+            'short_win_rate': float((short_pips > 0).mean()) if len(short_pips) else 0,
+            'win_rate': float(len(wins) / len(pips)) if len(pips) else 0,
+            'average_win': float(wins.mean()) if len(wins) else 0,
+            'average_loss': float(losses.mean()) if len(losses) else 0,
+            'expectancy': float(pips.mean()) if len(pips) else 0,
+        }
+
+        if self.n_bars is None:
+            # バーが無い場合はトレードごとの累計で計算する
+            drawdown, duration, longest = max_drawdown(np.cumsum(pips))
+            returns, periods_per_year = pips, None
+        else:
+            equity = self.equity()
+            drawdown, duration, longest = max_drawdown(equity)
+            returns = self.daily_returns(equity)
+            periods_per_year = self.periods_per_year
+            if returns is None:
+                returns, periods_per_year = pips, None
+            result['exposure'] = self.exposure()
+
+        result['max_drawdown'] = drawdown
+        result['max_drawdown_duration'] = duration
+        result['longest_underwater'] = longest
+        result['sharpe_ratio'] = float(sharpe_ratio(returns, periods_per_year))
+        result['sortino_ratio'] = float(sortino_ratio(returns, periods_per_year))
+        return result
@@ -0,0 +1,474 @@
+import itertools
+import sys
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from .bar_feed import RATES_DTYPE, FakeRateSource
+from .order_gateway import (TRADE_RETCODE_REQUOTE, TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE, TRADE_RETCODE_ERROR,
+                            TRADE_RETCODE_PRICE_OFF, TRADE_RETCODE_DONE_PARTIAL, TRADE_RETCODE_TIMEOUT,
+                            TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_TOO_MANY_REQUESTS, TRADE_RETCODE_CONNECTION)
+from .scheduler import TIMEFRAME_SECONDS
+from .tick_backtest import TICK_DTYPE
+
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+# MetaTrader5 の時間足の定数
+TIMEFRAMES = {
+    'M1': 1, 'M2': 2, 'M3': 3, 'M4': 4, 'M5': 5, 'M6': 6, 'M10': 10, 'M12': 12, 'M15': 15, 'M20': 20, 'M30': 30,
+    'H1': 16385, 'H2': 16386, 'H3': 16387, 'H4': 16388, 'H6': 16390, 'H8': 16392, 'H12': 16396,
+    'D1': 16408, 'W1': 32769, 'MN1': 49153,
+}
+
+
+class SimulatedClock:
+    """
+    待ち時間だけを飛ばす時計
+
+    sleep() は実際には待たずに時刻を進め、それ以外の処理にかかった時間はそのまま時刻に足される。
+    BarCloseScheduler の clock / sleep に渡すと、足の確定を待たずに次の足の処理が始まる。
+    """
+    def __init__(self, start):
+        self._state = (float(start), time.perf_counter())  # (基準の時刻, その時点の perf_counter)
+
+    def time(self):
+        base, mark = self._state
+        return base + time.perf_counter() - mark
+
+    def sleep(self, seconds):
+        self._state = (self.time() + max(seconds, 0), time.perf_counter())
+
+    def set(self, now):
+        self._state = (float(now), time.perf_counter())
+
+
+class SimulatedTerminal:
+    """
+    保存したバー（とティック）から MetaTrader5 モジュールと同じ関数を返すオフラインの端末
+
+    - initialize / shutdown / last_error / copy_rates_from_pos / symbol_info / symbol_info_tick /
+      order_send / positions_get / orders_get / order_get / history_deals_get / account_info
+    - 時刻は clock (SimulatedClock) で進めるので、ライブのコードを CPU の速さのまま過去のデータで動かせる
+    - install() で sys.modules['MetaTrader5'] を置き換えると、`import MetaTrader5 as mt5` しているコードも
+      そのまま動く（置き換えるのは trading.py などを import する前）
+
+    約定:
+    - 成行注文は latency 秒後のティックで約定する。注文の price との差が deviation を超えていたらリクオートにする
+    - spread (ポイント) を bid/ask の差に上乗せし、slippage (ポイント) までの不利な滑りを乱数で加える
+    - SL/TP・指値・逆指値は、前回の呼び出しから現在までの価格で判定し、その価格で約定したものとする
+      (ティックが無い場合は確定した足の高値・安値で判定し、SL と TP の両方に届いた足は SL とする)
+
+    ティックが無い通貨ペアは、形成中の足の始値を bid とし、足の spread を ask との差とする。
+    copy_rates_from_pos は add_symbol で渡した時間足だけに対応する。
+    """
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_PENDING = 5
+    TRADE_ACTION_SLTP = 6
+    TRADE_ACTION_MODIFY = 7
+    TRADE_ACTION_REMOVE = 8
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    ORDER_TYPE_BUY_LIMIT = 2
+    ORDER_TYPE_SELL_LIMIT = 3
+    ORDER_TYPE_BUY_STOP = 4
+    ORDER_TYPE_SELL_STOP = 5
+    POSITION_TYPE_BUY = 0
+    POSITION_TYPE_SELL = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    DEAL_REASON_CLIENT = 0
+    DEAL_REASON_SL = 4
+    DEAL_REASON_TP = 5
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    TRADE_RETCODE_REQUOTE = TRADE_RETCODE_REQUOTE
+    TRADE_RETCODE_PLACED = TRADE_RETCODE_PLACED
+    TRADE_RETCODE_DONE = TRADE_RETCODE_DONE
+    TRADE_RETCODE_DONE_PARTIAL = TRADE_RETCODE_DONE_PARTIAL
+    TRADE_RETCODE_ERROR = TRADE_RETCODE_ERROR
+    TRADE_RETCODE_TIMEOUT = TRADE_RETCODE_TIMEOUT
+    TRADE_RETCODE_INVALID = TRADE_RETCODE_INVALID
+    TRADE_RETCODE_INVALID_VOLUME = TRADE_RETCODE_INVALID_VOLUME
+    TRADE_RETCODE_INVALID_STOPS = TRADE_RETCODE_INVALID_STOPS
+    TRADE_RETCODE_PRICE_CHANGED = TRADE_RETCODE_PRICE_CHANGED
+    TRADE_RETCODE_PRICE_OFF = TRADE_RETCODE_PRICE_OFF
+    TRADE_RETCODE_TOO_MANY_REQUESTS = TRADE_RETCODE_TOO_MANY_REQUESTS
+    TRADE_RETCODE_CONNECTION = TRADE_RETCODE_CONNECTION
+    TRADE_RETCODE_POSITION_CLOSED = TRADE_RETCODE_POSITION_CLOSED
+
+    def __init__(self, start=None, spread=0, slippage=0, latency=0.0, balance=1000000., contract_size=100000,
+                 seed=0):
+        self.clock = SimulatedClock(start or 0)
+        self.spread = spread
+        self.slippage = slippage
+        self.latency = latency
+        self.balance = balance
+        self.contract_size = contract_size
+        self.rng = np.random.default_rng(seed)
+
+        self.symbols = {}
+        self.positions = {}  # ticket: SimpleNamespace
+        self.orders = {}  # 待機中の指値・逆指値
+        self.deals = []
+        self.error = (1, 'Success')
+        self.connected = False
+        self._tickets = itertools.count(1)
+        self._checked = None  # SL/TP などを判定し終えた時刻
+        self._lock = threading.RLock()
+
+        for name, value in TIMEFRAMES.items():
+            setattr(self, f'TIMEFRAME_{name}', value)
+
+    def add_symbol(self, symbol, bars, ticks=None, timeframe='M1', point=0.001, digits=3):
+        """
+        bars: copy_rates_* と同じ列の構造化配列または DataFrame
+        ticks: TICK_DTYPE の配列 (省略可)
+        """
+        if isinstance(bars, pd.DataFrame):
+            bars = FakeRateSource.from_dataframe(bars).rates
+        self.symbols[symbol] = SimpleNamespace(
+            name=symbol, rates=np.asarray(bars, dtype=RATES_DTYPE), times=np.asarray(bars['time'], dtype=np.int64),
+            ticks=None if ticks is None else np.asarray(ticks, dtype=TICK_DTYPE),
+            timeframe=TIMEFRAMES[timeframe], period=TIMEFRAME_SECONDS[timeframe],
+            point=point, digits=digits)
+        if self._checked is None or self.clock.time() < bars['time'][0]:
+            # 最初のバーから始める (start を指定した場合はそこから)
+            self.clock.set(max(self.clock.time(), int(bars['time'][0])))
+            self._checked = self.clock.time()
+        return self
+
+    def install(self):
+        """
+        以降の `import MetaTrader5` がこの端末を返すようにする
+        """
+        sys.modules['MetaTrader5'] = self
+        return self
+
+    # 時刻
+    def time(self):
+        return self.clock.time()
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    def end_time(self):
+        return max(int(s.times[-1]) + s.period for s in self.symbols.values())
+
+    # 接続
+    def initialize(self, *args, **kwargs):
+        self.connected = True
+        self.error = (1, 'Success')
+        return True
+
+    def login(self, *args, **kwargs):
+        return True
+
+    def shutdown(self):
+        self.connected = False
+        return True
+
+    def last_error(self):
+        return self.error
+
+    def account_info(self):
+        with self._lock:
+            self._sync()
+            profit = sum(self._profit(p) for p in self.positions.values())
+            return SimpleNamespace(balance=self.balance, equity=self.balance + profit, profit=profit,
+                                   currency='JPY', leverage=25)
+
+    def symbol_info(self, symbol):
+        info = self.symbols.get(symbol)
+        if info is None:
+            return self._fail(-1, f'Unknown symbol {symbol}')
+        return SimpleNamespace(name=symbol, point=info.point, digits=info.digits, spread=self.spread,
+                               trade_contract_size=self.contract_size, visible=True)
+
+    def symbol_select(self, symbol, enable=True):
+        return symbol in self.symbols
+
+    # 価格
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        if not self.connected:
+            return self._fail(-10004, 'No IPC connection')
+        info = self.symbols.get(symbol)
+        if info is None:
+            return self._fail(-1, f'Unknown symbol {symbol}')
+        if timeframe != info.timeframe:
+            return self._fail(-2, 'Invalid params')
+
+        now = self.clock.time()
+        end = int(np.searchsorted(info.times, int(now), side='right')) - start_pos
+        rates = info.rates[max(end - count, 0):max(end, 0)].copy()
+        # 最後の足が形成中なら、現在までの値にする
+        if start_pos == 0 and len(rates) and rates['time'][-1] + info.period > now:
+            rates[-1] = self._forming_bar(info, rates[-1], now)
+        return rates
+
+    def symbol_info_tick(self, symbol):
+        if not self.connected:
+            return self._fail(-10004, 'No IPC connection')
+        info = self.symbols.get(symbol)
+        if info is None:
+            return self._fail(-1, f'Unknown symbol {symbol}')
+        bid, ask, time_msc = self._quote(info, self.clock.time())
+        if bid is None:
+            return self._fail(-1, 'No prices')
+        return SimpleNamespace(time=time_msc // 1000, time_msc=time_msc, bid=bid, ask=ask, last=0.,
+                               volume=0, flags=0)
+
+    # 取引
+    def order_send(self, request):
+        with self._lock:
+            self._sync()
+            action = request.get('action')
+            if not self.connected:
+                return self._result(TRADE_RETCODE_CONNECTION, request)
+            if request.get('symbol') not in self.symbols and action in (self.TRADE_ACTION_DEAL, self.TRADE_ACTION_PENDING):
+                return self._result(TRADE_RETCODE_INVALID, request)
+
+            if action == self.TRADE_ACTION_DEAL:
+                return self._deal(request)
+            if action == self.TRADE_ACTION_PENDING:
+                ticket = next(self._tickets)
+                self.orders[ticket] = SimpleNamespace(
+                    ticket=ticket, symbol=request['symbol'], type=request['type'], volume_current=request['volume'],
+                    price_open=request['price'], sl=request.get('sl', 0.), tp=request.get('tp', 0.),
+                    magic=request.get('magic', 0), comment=request.get('comment', ''),
+                    time_setup=int(self.clock.time()))
+                return self._result(TRADE_RETCODE_DONE, request, order=ticket, price=request['price'])
+            if action == self.TRADE_ACTION_REMOVE:
+                if self.orders.pop(request.get('order'), None) is None:
+                    return self._result(TRADE_RETCODE_INVALID, request)
+                return self._result(TRADE_RETCODE_DONE, request, order=request['order'])
+            if action == self.TRADE_ACTION_SLTP:
+                position = self.positions.get(request.get('position'))
+                if position is None:
+                    return self._result(TRADE_RETCODE_POSITION_CLOSED, request)
+                position.sl = request.get('sl', 0.)
+                position.tp = request.get('tp', 0.)
+                return self._result(TRADE_RETCODE_DONE, request)
+            return self._result(TRADE_RETCODE_INVALID, request)
+
+    def positions_get(self, symbol=None, ticket=None, group=None):
+        with self._lock:
+            self._sync()
+            positions = [p for p in self.positions.values()
+                         if (symbol is None or p.symbol == symbol) and (ticket is None or p.ticket == ticket)]
+            for position in positions:
+                position.price_current = self._close_price(position, self.clock.time())
+                position.profit = self._profit(position)
+            return tuple(SimpleNamespace(**vars(p)) for p in positions)
+
+    def positions_total(self):
+        with self._lock:
+            self._sync()
+            return len(self.positions)
+
+    def orders_get(self, symbol=None, ticket=None, group=None):
+        with self._lock:
+            self._sync()
+            return tuple(SimpleNamespace(**vars(o)) for o in self.orders.values()
+                         if (symbol is None or o.symbol == symbol) and (ticket is None or o.ticket == ticket))
+
+    def order_get(self, ticket):
+        orders = self.orders_get(ticket=ticket)
+        return orders[0] if orders else None
+
+    def history_deals_get(self, *args, **kwargs):
+        with self._lock:
+            self._sync()
+            return tuple(SimpleNamespace(**deal) for deal in self.deals)
+
+    def deals_frame(self):
+        """
+        約定の履歴を DataFrame で返す (time は datetime)
+        """
+        df = pd.DataFrame(self.deals)
+        if len(df):
+            df['time'] = pd.to_datetime(df['time_msc'], unit='ms')
+        return df
+
+    # 内部
+    def _fail(self, code, message):
+        self.error = (code, message)
+        return None
+
+    def _result(self, retcode, request, order=0, deal=0, price=0., volume=0.):
+        return SimpleNamespace(retcode=retcode, deal=deal, order=order, volume=volume, price=price,
+                               bid=0., ask=0., comment='', request_id=0, request=request)
+
+    def _quote(self, info, now):
+        """
+        now の時点の (bid, ask, 時刻 (ミリ秒))
+        (searchsorted に float を渡すと配列全体が変換されるので、時刻は整数にしてから探す)
+        """
+        spread = self.spread * info.point
+        if info.ticks is not None:
+            k = int(np.searchsorted(info.ticks['time_msc'], int(now * 1000), side='right')) - 1
+            if k < 0:
+                return None, None, None
+            tick = info.ticks[k]
+            return float(tick['bid']), float(tick['ask']) + spread, int(tick['time_msc'])
+
+        k = int(np.searchsorted(info.times, int(now), side='right')) - 1
+        if k < 0:
+            return None, None, None
+        bar = info.rates[k]
+        # 足が確定していれば (休場中など) 終値、形成中なら始値
+        bid = float(bar['close'] if bar['time'] + info.period <= now else bar['open'])
+        return bid, bid + bar['spread'] * info.point + spread, int(now * 1000)
+
+    def _forming_bar(self, info, bar, now):
+        bar = bar.copy()
+        if info.ticks is not None:
+            times = info.ticks['time_msc']
+            lo = np.searchsorted(times, bar['time'] * 1000, side='left')
+            hi = np.searchsorted(times, int(now * 1000), side='right')
+            bids = info.ticks['bid'][lo:hi]
+            if len(bids):
+                bar['open'], bar['high'], bar['low'], bar['close'] = bids[0], bids.max(), bids.min(), bids[-1]
+                bar['tick_volume'] = len(bids)
+                return bar
+        bar['high'] = bar['low'] = bar['close'] = bar['open']
+        bar['tick_volume'] = 1
+        return bar
+
+    def _deal(self, request):
+        info = self.symbols[request['symbol']]
+        fill_time = self.clock.time() + self.latency
+        bid, ask, time_msc = self._quote(info, fill_time)
+        if bid is None:
+            return self._result(TRADE_RETCODE_PRICE_OFF, request)
+        if request.get('volume', 0) <= 0:
+            return self._result(TRADE_RETCODE_INVALID_VOLUME, request)
+
+        is_buy = request['type'] == self.ORDER_TYPE_BUY
+        market = ask if is_buy else bid
+        if 'price' in request and abs(market - request['price']) > request.get('deviation', 0) * info.point + 1e-9:
+            return self._result(TRADE_RETCODE_REQUOTE, request)
+
+        slip = int(self.rng.integers(0, self.slippage + 1)) * info.point if self.slippage else 0.
+        price = round(market + slip if is_buy else market - slip, info.digits)
+
+        if request.get('position'):
+            position = self.positions.get(request['position'])
+            if position is None:
+                return self._result(TRADE_RETCODE_POSITION_CLOSED, request)
+            deal = self._close(position, price, time_msc, self.DEAL_REASON_CLIENT)
+            return self._result(TRADE_RETCODE_DONE, request, deal=deal, price=price, volume=position.volume)
+
+        ticket = next(self._tickets)
+        self.positions[ticket] = SimpleNamespace(
+            ticket=ticket, identifier=ticket, symbol=info.name, type=request['type'], volume=request['volume'],
+            price_open=price, price_current=price, sl=request.get('sl', 0.), tp=request.get('tp', 0.),
+            magic=request.get('magic', 0), comment=request.get('comment', ''),
+            time=time_msc // 1000, time_msc=time_msc, profit=0., checked=fill_time)
+        deal = self._record(ticket, info.name, request['type'], self.DEAL_ENTRY_IN, request['volume'], price,
+                            time_msc, 0., self.DEAL_REASON_CLIENT, request.get('magic', 0))
+        return self._result(TRADE_RETCODE_DONE, request, order=ticket, deal=deal, price=price,
+                            volume=request['volume'])
+
+    def _close(self, position, price, time_msc, reason):
+        profit = self._profit(position, price)
+        self.balance += profit
+        del self.positions[position.ticket]
+        close_type = self.ORDER_TYPE_SELL if position.type == self.ORDER_TYPE_BUY else self.ORDER_TYPE_BUY
+        return self._record(position.ticket, position.symbol, close_type, self.DEAL_ENTRY_OUT, position.volume,
+                            price, time_msc, profit, reason, position.magic)
+
+    def _record(self, position_id, symbol, deal_type, entry, volume, price, time_msc, profit, reason, magic):
+        ticket = next(self._tickets)
+        self.deals.append({
+            'ticket': ticket, 'position_id': position_id, 'symbol': symbol, 'type': deal_type, 'entry': entry,
+            'volume': volume, 'price': price, 'time_msc': int(time_msc), 'profit': profit, 'reason': reason,
+            'magic': magic,
+        })
+        return ticket
+
+    def _close_price(self, position, now):
+        bid, ask, _ = self._quote(self.symbols[position.symbol], now)
+        return bid if position.type == self.ORDER_TYPE_BUY else ask
+
+    def _profit(self, position, price=None):
+        price = position.price_current if price is None else price
+        direction = 1 if position.type == self.ORDER_TYPE_BUY else -1
+        return direction * (price - position.price_open) * position.volume * self.contract_size
+
+    def _path(self, info, start, end):
+        """
+        start より後、end までの価格の推移
+        Returns: (時刻 (ミリ秒), bid の安値, bid の高値, ask の安値, ask の高値)
+        ティックが無い場合はその間に確定した足を使う
+        """
+        spread = self.spread * info.point
+        if info.ticks is not None:
+            ticks = info.ticks
+            lo, hi = np.searchsorted(ticks['time_msc'], [int(start * 1000), int(end * 1000)], side='right')
+            bids = ticks['bid'][lo:hi]
+            asks = ticks['ask'][lo:hi] + spread
+            return ticks['time_msc'][lo:hi], bids, bids, asks, asks
+
+        closes = info.times + info.period
+        lo, hi = np.searchsorted(closes, [int(start), int(end)], side='right')
+        rates = info.rates[lo:hi]
+        bar_spread = rates['spread'] * info.point + spread
+        return (closes[lo:hi] * 1000, rates['low'], rates['high'],
+                rates['low'] + bar_spread, rates['high'] + bar_spread)
+
+    def _sync(self):
+        """
+        前回から現在までの価格で、指値・逆指値の約定と SL/TP を判定する
+        """
+        now = self.clock.time()
+        if self._checked is None or now <= self._checked:
+            return
+        start, self._checked = self._checked, now
+
+        for order in list(self.orders.values()):
+            times, bid_low, bid_high, ask_low, ask_high = self._path(self.symbols[order.symbol], start, now)
+            hit = {
+                self.ORDER_TYPE_BUY_LIMIT: ask_low <= order.price_open,
+                self.ORDER_TYPE_BUY_STOP: ask_high >= order.price_open,
+                self.ORDER_TYPE_SELL_LIMIT: bid_high >= order.price_open,
+                self.ORDER_TYPE_SELL_STOP: bid_low <= order.price_open,
+            }[order.type]
+            if not hit.any():
+                continue
+            k = int(np.argmax(hit))
+            del self.orders[order.ticket]
+            is_buy = order.type in (self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_BUY_STOP)
+            position_type = self.ORDER_TYPE_BUY if is_buy else self.ORDER_TYPE_SELL
+            self.positions[order.ticket] = SimpleNamespace(
+                ticket=order.ticket, identifier=order.ticket, symbol=order.symbol, type=position_type,
+                volume=order.volume_current, price_open=order.price_open, price_current=order.price_open,
+                sl=order.sl, tp=order.tp, magic=order.magic, comment=order.comment,
+                time=int(times[k]) // 1000, time_msc=int(times[k]), profit=0., checked=times[k] / 1000)
+            self._record(order.ticket, order.symbol, position_type, self.DEAL_ENTRY_IN, order.volume_current,
+                         order.price_open, times[k], 0., self.DEAL_REASON_CLIENT, order.magic)
+
+        for position in list(self.positions.values()):
+            if not position.sl and not position.tp:
+                continue
+            times, bid_low, bid_high, ask_low, ask_high = self._path(
+                self.symbols[position.symbol], max(start, position.checked), now)
+            if position.type == self.ORDER_TYPE_BUY:
+                hit_sl = (bid_low <= position.sl) if position.sl else np.zeros(len(times), dtype=bool)
+                hit_tp = (bid_high >= position.tp) if position.tp else np.zeros(len(times), dtype=bool)
+            else:
+                hit_sl = (ask_high >= position.sl) if position.sl else np.zeros(len(times), dtype=bool)
+                hit_tp = (ask_low <= position.tp) if position.tp else np.zeros(len(times), dtype=bool)
+            hit = hit_sl | hit_tp
+            if not hit.any():
+                continue
+            k = int(np.argmax(hit))
+            if hit_sl[k]:
+                self._close(position, position.sl, times[k], self.DEAL_REASON_SL)
+            else:
+                self._close(position, position.tp, times[k], self.DEAL_REASON_TP)
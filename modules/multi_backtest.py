@@ -0,0 +1,175 @@
+import pandas as pd
+from .computation_cache import ComputationCache
+from .indicators import WindowEMA, RollingMean
+from .ledger import Position, TradeLedger
+from .metrics import TradeMetrics
+from .pivots import PivotDetector
+from .strategy import TradingStrategy
+from .triangle_strategy import TriangleStrategy
+
+
+class SharedIndicators:
+    """
+    複数の TradingStrategy で同じ設定の指標を共有し、バーごとに1回だけ更新する
+
+    - 極値 (PivotDetector) は (distance, df_sliced_period) ごと、EMA は df_sliced_period ごとに1つ作り、
+      平均実体は全ての戦略で1つを使う
+    - attach() した戦略の update_indicators() は、そのバーで最初に呼ばれたときだけ全ての指標を更新する
+    - 極値・トレンドラインなどの計算結果の cache も共有する (キーに計算のパラメーターが入っているので混ざらない)
+    """
+    def __init__(self, cache_size=4096):
+        self.cache = ComputationCache(maxsize=cache_size)
+        self.pivot_detectors = {}
+        self.emas = {}
+        self.candle_bodies = {}
+        self.use_pivot_detector = False
+        self.bar_count = 0
+        self.arrays_source = None
+        self.arrays = None
+        self.window = 1  # 作り直すときに読み直す本数 (一番長い df_sliced_period)
+
+    def attach(self, strategy):
+        if isinstance(strategy, TradingStrategy):
+            distance, window = strategy.distance, strategy.df_sliced_period
+            if (distance, window) not in self.pivot_detectors:
+                self.pivot_detectors[(distance, window)] = PivotDetector(distance, window)
+            if window not in self.emas:
+                self.emas[window] = WindowEMA(span=100, window=window)
+            if 20 not in self.candle_bodies:
+                self.candle_bodies[20] = RollingMean(20)
+
+            strategy.pivot_detector = self.pivot_detectors[(distance, window)]
+            strategy.ema100 = self.emas[window]
+            strategy.avg_candle_body = self.candle_bodies[20]
+            strategy.shared_indicators = self
+            self.use_pivot_detector = self.use_pivot_detector or strategy.use_pivot_detector
+            self.window = max(self.window, window)
+        strategy.cache = self.cache
+        return strategy
+
+    def update(self, df, i):
+        if i == self.bar_count - 1:
+            # このバーは他の戦略が更新済み
+            return
+
+        if i == self.bar_count:
+            start = i
+        else:
+            start = max(0, i - self.window + 1)
+            for detector in self.pivot_detectors.values():
+                detector.reset(start)
+            for indicator in list(self.emas.values()) + list(self.candle_bodies.values()):
+                indicator.reset()
+
+        if df is not self.arrays_source:
+            self.arrays = (df['open'].values, df['high'].values, df['low'].values, df['close'].values)
+            self.arrays_source = df
+        opens, highs, lows, closes = self.arrays
+        for j in range(start, i + 1):
+            if self.use_pivot_detector:
+                for detector in self.pivot_detectors.values():
+                    detector.update(highs[j], lows[j])
+            for ema in self.emas.values():
+                ema.update(closes[j])
+            body = abs(closes[j] - opens[j])
+            for mean in self.candle_bodies.values():
+                mean.update(body)
+        self.bar_count = i + 1
+
+
+def record_action(ledger, portfolio, i, action, close):
+    """
+    step_backtest の trade_logic と同じく、エントリー・イグジットを ledger に記録して portfolio を更新する
+    """
+    if action in ('exit_long', 'exit_short') and portfolio['position'] is not None:
+        ledger.append(i, action, portfolio['entry_price'], portfolio['reversal_price'],
+                      portfolio['take_profit'], portfolio['stop_loss'], close, portfolio['pips'])
+        portfolio.reset()
+
+    # ステップ実行の戦略はエントリーしたバーで position を自分で設定する
+    elif action in ('entry_long', 'entry_short'):
+        ledger.append(i, action, close, portfolio['reversal_price'],
+                      portfolio['take_profit'], portfolio['stop_loss'])
+        portfolio['position'] = 'long' if action == 'entry_long' else 'short'
+
+
+class MultiStrategyBacktest:
+    """
+    複数の戦略・設定を1回のバーのループでまとめてバックテストする
+
+    各バーで全ての設定の trade_conditions_func(df, i, portfolio, closes, spreads) を順に呼ぶ。
+    df の並べ直しや closes/spreads の取り出しは1回だけで、add_trend_reversal / add_triangle で追加した戦略は
+    SharedIndicators で指標と計算結果を共有する。
+    ポートフォリオとトレードの記録 (TradeLedger) は設定ごとに持つ。
+
+    使い方:
+        backtest = MultiStrategyBacktest()
+        for params in parameter_grid(base, grid):
+            backtest.add_trend_reversal(params)
+        ledgers = backtest.run(df)
+        print(backtest.summary(df))
+    """
+    def __init__(self, cache_size=4096):
+        self.shared = SharedIndicators(cache_size)
+        self.names = []
+        self.funcs = []
+        self.strategies = []
+        self.ledgers = {}
+
+    def add(self, trade_conditions_func, name=None, strategy=None):
+        """
+        ステップ実行の関数をそのまま追加する (指標は共有しない)
+        """
+        name = name or f"strategy_{len(self.names)}"
+        if name in self.names:
+            raise ValueError(f"Duplicate strategy name: {name}")
+        self.names.append(name)
+        self.funcs.append(trade_conditions_func)
+        self.strategies.append(strategy)
+        return strategy
+
+    def add_trend_reversal(self, params, name=None):
+        strategy = self.shared.attach(TradingStrategy(params=params))
+        return self.add(strategy.trade_logic_trend_reversal, name or f"trend_reversal_{len(self.names)}", strategy)
+
+    def add_triangle(self, params, symbol='USDJPY', allow_long=True, allow_short=True, name=None):
+        strategy = self.shared.attach(TriangleStrategy(symbol=symbol, allow_long=allow_long,
+                                                       allow_short=allow_short, params=params))
+        return self.add(strategy.trade_conditions_func, name or f"triangle_{len(self.names)}", strategy)
+
+    def run(self, df):
+        """
+        Returns: {名前: TradeLedger}
+        """
+        df = df.reset_index(drop=True)
+        closes = df['close'].values
+        spreads = df['spread'].values
+
+        funcs = self.funcs
+        ledgers = [TradeLedger() for _ in funcs]
+        portfolios = [Position() for _ in funcs]
+
+        for i in range(len(df)):
+            close = closes[i]
+            for func, ledger, portfolio in zip(funcs, ledgers, portfolios):
+                action = func(df, i, portfolio, closes, spreads)
+                if action is not None:
+                    record_action(ledger, portfolio, i, action, close)
+
+        self.ledgers = dict(zip(self.names, ledgers))
+        return self.ledgers
+
+    def summary(self, df=None):
+        """
+        設定ごとの成績 (TradeMetrics.summary()) を1行ずつ並べた DataFrame
+        """
+        rows = []
+        for name, strategy in zip(self.names, self.strategies):
+            ledger = self.ledgers.get(name)
+            if ledger is None:
+                continue
+            pip_value = getattr(strategy, 'pip_value', 0.01)
+            metrics = TradeMetrics.from_ledger(ledger, df.reset_index(drop=True) if df is not None else None,
+                                               pip_value=pip_value)
+            rows.append({'name': name, **metrics.summary()})
+        return pd.DataFrame(rows)
@@ -0,0 +1,296 @@
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+import numpy as np
+
+# MetaTrader5 の order_send のリターンコード
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_PLACED = 10008
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_DONE_PARTIAL = 10010
+TRADE_RETCODE_ERROR = 10011
+TRADE_RETCODE_TIMEOUT = 10012
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_TOO_MANY_REQUESTS = 10024
+TRADE_RETCODE_CONNECTION = 10031
+
+# 同じ注文を送り直せば通る可能性があるもの
+RETRYABLE_RETCODES = {
+    TRADE_RETCODE_REQUOTE,
+    TRADE_RETCODE_TIMEOUT,
+    TRADE_RETCODE_PRICE_CHANGED,
+    TRADE_RETCODE_PRICE_OFF,
+    TRADE_RETCODE_TOO_MANY_REQUESTS,
+    TRADE_RETCODE_CONNECTION,
+}
+SUCCESS_RETCODES = {TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE, TRADE_RETCODE_DONE_PARTIAL}
+
+
+class OrderTicket:
+    """
+    gateway に渡した1つの注文の状態
+    wait() で送信が終わる (成功・失敗・リトライの上限) まで待てる
+    """
+    def __init__(self, client_id, request, callback=None):
+        self.client_id = client_id
+        self.request = request
+        self.callback = callback
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.submitted_at = time.perf_counter()
+        self.latency = None  # 最後に送ってから応答が返るまでの秒数
+        self.total_latency = None  # submit から完了までの秒数
+        self.done = threading.Event()
+
+    @property
+    def ok(self):
+        return self.result is not None and self.result.retcode in SUCCESS_RETCODES
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.result
+
+    def __repr__(self):
+        retcode = getattr(self.result, 'retcode', None)
+        return f"OrderTicket({self.client_id}, retcode={retcode}, attempts={self.attempts}, error={self.error})"
+
+
+class OrderGateway:
+    """
+    注文をキューに入れ、専用のスレッドから mt5.order_send で送る
+
+    - 判定のループは submit() で注文を渡すだけで、送信や応答を待たない
+    - リクオート・価格変更・接続エラーなどは待ち時間を倍にしながら max_retries 回まで送り直す
+      (成行注文は送り直す前に最新の価格に更新する)
+    - 同じ client_id の注文は2回送らない（同じシグナルを2回処理しても1回だけ発注する）
+    - 送ってから応答が返るまでの時間を latency に記録する (instrumentation があればそちらにも記録する)
+
+    lock を渡すと、他のスレッドと共有している MT5 の呼び出しと同じロックで送る。
+    """
+    def __init__(self, mt5, lock=None, max_retries=3, backoff=0.05, max_backoff=1.0, dedup_size=10000,
+                 instrumentation=None):
+        self.mt5 = mt5
+        self.lock = lock or threading.Lock()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dedup_size = dedup_size
+        self.instrumentation = instrumentation
+
+        self.tickets = OrderedDict()  # client_id: OrderTicket (古いものから消す)
+        self.latency = deque(maxlen=1000)
+        self.sent = 0
+        self.retries = 0
+        self.duplicates = 0
+        self.failed = 0
+        self._ids = itertools.count()
+        self._queue = queue.Queue()
+        self._tickets_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request, client_id=None, callback=None):
+        """
+        注文をキューに入れて OrderTicket を返す
+        client_id が送信済み (または送信中) の場合は送らずに同じ OrderTicket を返す
+        callback(ticket) は送信が終わったときに gateway のスレッドから呼ばれる
+        """
+        with self._tickets_lock:
+            if client_id is None:
+                client_id = f"auto-{next(self._ids)}"
+            elif client_id in self.tickets:
+                self.duplicates += 1
+                return self.tickets[client_id]
+
+            ticket = OrderTicket(client_id, dict(request), callback)
+            self.tickets[client_id] = ticket
+            while len(self.tickets) > self.dedup_size:
+                self.tickets.popitem(last=False)
+
+        self._queue.put(ticket)
+        return ticket
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def drain(self):
+        """
+        キューに入っている注文を全て送り終えるまで待つ
+        """
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """
+        キューに残っている注文を送り終えてからスレッドを止める
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            ticket = self._queue.get()
+            if ticket is None:
+                self._queue.task_done()
+                break
+            try:
+                self._send(ticket)
+            except Exception as e:
+                ticket.error = str(e)
+            finally:
+                self._finish(ticket)
+                self._queue.task_done()
+
+    def _send(self, ticket):
+        mt5 = self.mt5
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.retries += 1
+                time.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+                self._refresh_price(ticket.request)
+
+            ticket.attempts += 1
+            start = time.perf_counter()
+            with self.lock:
+                try:
+                    result = mt5.order_send(ticket.request)
+                    error = None if result is not None else mt5.last_error()
+                except Exception as e:
+                    result, error = None, str(e)
+            ticket.latency = time.perf_counter() - start
+            self.latency.append(ticket.latency)
+            self.sent += 1
+            if self.instrumentation is not None:
+                self.instrumentation.record('order_send', ticket.latency)
+
+            ticket.result = result
+            ticket.error = error
+            # order_send が None を返すのは端末との接続の問題なので送り直す
+            if result is not None and result.retcode not in RETRYABLE_RETCODES:
+                return
+
+    def _refresh_price(self, request):
+        if request.get('action') != getattr(self.mt5, 'TRADE_ACTION_DEAL', 1) or 'symbol' not in request:
+            return
+        with self.lock:
+            tick = self.mt5.symbol_info_tick(request['symbol'])
+        if tick is not None:
+            is_buy = request.get('type') == getattr(self.mt5, 'ORDER_TYPE_BUY', 0)
+            request['price'] = tick.ask if is_buy else tick.bid
+
+    def _finish(self, ticket):
+        ticket.total_latency = time.perf_counter() - ticket.submitted_at
+        if not ticket.ok:
+            self.failed += 1
+        if self.instrumentation is not None:
+            self.instrumentation.record('order_total', ticket.total_latency)
+            if not ticket.ok:
+                self.instrumentation.count('orders_failed')
+        ticket.done.set()
+        if ticket.callback is not None:
+            try:
+                ticket.callback(ticket)
+            except Exception as e:
+                print(f"Order callback failed ({ticket.client_id}): {e}")
+
+    def stats(self):
+        latency = np.array(self.latency) * 1000
+        return {
+            'sent': self.sent,
+            'retries': self.retries,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+            'pending': self.pending(),
+            'p50_ms': np.percentile(latency, 50) if len(latency) else np.nan,
+            'p99_ms': np.percentile(latency, 99) if len(latency) else np.nan,
+        }
+
+
+class FakeBroker:
+    """
+    オフラインのテスト用に mt5 の注文まわりの関数を真似る
+
+    - symbol_info_tick / order_send / positions_get / last_error
+    - retcodes: 先頭から順に order_send が返すリターンコード（使い切ったら成功）
+      None を入れると order_send が None を返す (端末との接続エラー)
+    - latency: order_send の応答までの秒数
+    成行注文は現在の bid/ask と注文の price の差が deviation (ポイント) を超えるとリクオートにする。
+    """
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_REMOVE = 8
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_IOC = 1
+    TRADE_RETCODE_REQUOTE = TRADE_RETCODE_REQUOTE
+    TRADE_RETCODE_DONE = TRADE_RETCODE_DONE
+    TRADE_RETCODE_PRICE_OFF = TRADE_RETCODE_PRICE_OFF
+    TRADE_RETCODE_CONNECTION = TRADE_RETCODE_CONNECTION
+
+    def __init__(self, prices=None, retcodes=None, latency=0.0, point=0.001):
+        self.prices = dict(prices or {'USDJPY': (150.000, 150.003)})  # symbol: (bid, ask)
+        self.retcodes = deque(retcodes or [])
+        self.latency = latency
+        self.point = point
+        self.requests = []
+        self.positions = {}
+        self.error = (1, 'Success')
+        self._tickets = itertools.count(1)
+
+    def set_price(self, symbol, bid, ask):
+        self.prices[symbol] = (bid, ask)
+
+    def symbol_info_tick(self, symbol):
+        if symbol not in self.prices:
+            return None
+        bid, ask = self.prices[symbol]
+        return SimpleNamespace(bid=bid, ask=ask, time_msc=int(time.time() * 1000))
+
+    def last_error(self):
+        return self.error
+
+    def positions_get(self, symbol=None, ticket=None):
+        positions = [p for p in self.positions.values()
+                     if (symbol is None or p.symbol == symbol) and (ticket is None or p.ticket == ticket)]
+        return tuple(positions)
+
+    def order_send(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        self.requests.append(dict(request))
+
+        if self.retcodes:
+            retcode = self.retcodes.popleft()
+            if retcode is None:
+                self.error = (-10004, 'No IPC connection')
+                return None
+        else:
+            retcode = None
+        self.error = (1, 'Success')
+        if retcode is None and request.get('action') == self.TRADE_ACTION_DEAL:
+            retcode = self._deal(request)
+        elif retcode is None:
+            retcode = TRADE_RETCODE_DONE
+        return SimpleNamespace(retcode=retcode, request=request, price=request.get('price'),
+                               volume=request.get('volume'), order=0, deal=0, comment='')
+
+    def _deal(self, request):
+        bid, ask = self.prices[request['symbol']]
+        is_buy = request['type'] == self.ORDER_TYPE_BUY
+        market = ask if is_buy else bid
+        if abs(market - request['price']) > request.get('deviation', 0) * self.point + 1e-12:
+            return TRADE_RETCODE_REQUOTE
+
+        if 'position' in request:
+            self.positions.pop(request['position'], None)
+        else:
+            ticket = next(self._tickets)
+            self.positions[ticket] = SimpleNamespace(
+                ticket=ticket, symbol=request['symbol'], type=request['type'], volume=request['volume'],
+                price_open=market, sl=request.get('sl', 0), tp=request.get('tp', 0), profit=0.,
+                magic=request.get('magic', 0))
+        return TRADE_RETCODE_DONE
@@ -0,0 +1,192 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from .strategy import TradingStrategy
+from .triangle_strategy import TriangleStrategy
+from .reversal_backtest import TrendReversalBacktest
+from .triangle_backtest import TriangleBacktest
+from .metrics import TradeMetrics
+
+PRICE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread']
+
+
+def build_trend_reversal(params):
+    return TrendReversalBacktest(TradingStrategy(params=params))
+
+
+def build_triangle(params):
+    params = dict(params)
+    symbol = params.pop('symbol', 'USDJPY')
+    allow_long = params.pop('allow_long', True)
+    allow_short = params.pop('allow_short', True)
+    return TriangleBacktest(TriangleStrategy(symbol, allow_long, allow_short, params=params))
+
+
+STRATEGIES = {
+    'trend_reversal': build_trend_reversal,
+    'triangle': build_triangle,
+}
+
+
+def parameter_grid(base_params, grid):
+    """
+    grid の各値の組み合わせを base_params に上書きした設定のリストを返す
+    例: {'distance': [5, 6, 7], 'df_sliced_period': [300, 400, 500]}
+    """
+    keys = list(grid)
+    return [dict(base_params, **dict(zip(keys, values))) for values in itertools.product(*grid.values())]
+
+
+def random_search(base_params, space, n_iter, seed=None):
+    """
+    space からランダムに選んだ設定を n_iter 個返す
+    - リスト: その中から選ぶ
+    - (下限, 上限) のタプル: int なら randint、float なら一様分布
+    """
+    rng = random.Random(seed)
+    settings = []
+    for _ in range(n_iter):
+        params = dict(base_params)
+        for key, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    params[key] = rng.randint(low, high)
+                else:
+                    params[key] = rng.uniform(low, high)
+            else:
+                params[key] = rng.choice(values)
+        settings.append(params)
+    return settings
+
+
+def summarize_trades(actions, exit_pips, df=None, pip_value=0.01):
+    """
+    バックテストノートブックの summarize_trade_results と同じ集計値に、
+    ドローダウン・シャープレシオなどの TradeMetrics の指標を加えて返す
+    """
+    return TradeMetrics.from_actions(actions, exit_pips, df, pip_value=pip_value).summary()
+
+
+class SharedPriceData:
+    """
+    価格データの列を1つの共有メモリにまとめて置き、ワーカープロセスからコピーせずに参照する
+    """
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.layout = layout
+        self.owner = owner
+
+    @classmethod
+    def create(cls, df, columns=PRICE_COLUMNS):
+        arrays = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            values = df[col].values
+            if values.dtype == object:
+                # CSV から読んだ時刻の文字列は datetime64 にして渡す
+                values = pd.to_datetime(df[col]).values
+            arrays[col] = np.ascontiguousarray(values)
+
+        layout = []
+        offset = 0
+        for col, values in arrays.items():
+            layout.append((col, values.dtype.str, offset, len(values)))
+            offset += values.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        data = cls(shm, layout, owner=True)
+        shared = data.arrays()
+        for col, values in arrays.items():
+            shared[col][:] = values
+        del shared
+        return data
+
+    @classmethod
+    def attach(cls, name, layout):
+        return cls(shared_memory.SharedMemory(name=name), layout, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def arrays(self):
+        return {
+            col: np.ndarray((length,), dtype=np.dtype(dtype), buffer=self.shm.buf, offset=offset)
+            for col, dtype, offset, length in self.layout
+        }
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.arrays(), copy=False)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ワーカープロセスごとに1回だけ共有メモリに接続する
+_worker = {}
+
+
+def _init_worker(name, layout):
+    data = SharedPriceData.attach(name, layout)
+    _worker['data'] = data
+    _worker['df'] = data.to_dataframe()
+
+
+def _run_task(strategy_name, params):
+    backtest = STRATEGIES[strategy_name](params)
+    actions, exit_pips = backtest.run(_worker['df'])
+    return summarize_trades(actions, exit_pips, _worker['df'], backtest.strategy.pip_value)
+
+
+class ParameterSweep:
+    """
+    パラメーターの組み合わせごとのバックテストを全コアで並列に実行する
+
+    価格データは共有メモリに1回だけ書き込み、各タスクには設定値だけを渡す。
+    結果は rank_by の降順に並べた表 (DataFrame) で返し、output_path があれば CSV に保存する。
+    """
+    def __init__(self, strategy_name, max_workers=None, rank_by='profit_factor'):
+        if strategy_name not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy_name}. Choose from {list(STRATEGIES)}")
+        self.strategy_name = strategy_name
+        self.max_workers = max_workers or os.cpu_count()
+        self.rank_by = rank_by
+
+    def run(self, df, settings, output_path=None):
+        data = SharedPriceData.create(df.reset_index(drop=True))
+        rows = [None] * len(settings)
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(data.name, data.layout)) as executor:
+                futures = {
+                    executor.submit(_run_task, self.strategy_name, params): k
+                    for k, params in enumerate(settings)
+                }
+                for future in as_completed(futures):
+                    k = futures[future]
+                    try:
+                        rows[k] = dict(settings[k], **future.result())
+                    except Exception as e:
+                        rows[k] = dict(settings[k], error=str(e))
+        finally:
+            data.close()
+
+        results = self.rank(pd.DataFrame(rows))
+        if output_path:
+            results.to_csv(output_path, index=False)
+        return results
+
+    def rank(self, results):
+        if self.rank_by in results.columns:
+            results = results.sort_values(self.rank_by, ascending=False, kind='stable', na_position='last')
+        results = results.reset_index(drop=True)
+        results.insert(0, 'rank', range(1, len(results) + 1))
+        return results
@@ -0,0 +1,237 @@
+import heapq
+import math
+import numpy as np
+
+# scipy.signal.find_peaks が distance で間引いた後に適用する条件
+AFTER_DISTANCE = ('prominence', 'width', 'wlen', 'rel_height')
+
+
+def find_peaks(x, distance=None, **kwargs):
+    """
+    scipy.signal.find_peaks と同じ (scipy.signal の読み込みは重いので、初めて呼ばれたときに読み込む)
+
+    distance による間引きで同じ高さの極大値が distance 以内に並んだ場合は、常に右側を優先する。
+    scipy は高さを np.argsort で並べるため、同じ高さの順番が配列の長さや CPU によって変わるが、
+    ここでは PeakTracker・TriangleBacktest のカーネルと同じ順番に揃える。
+    distance 以外の条件は scipy で計算し、scipy と同じく height などは distance の前、
+    prominence / width は distance の後に適用する。
+    """
+    from scipy.signal import find_peaks as scipy_find_peaks
+    x = np.asarray(x)
+    peaks, properties = scipy_find_peaks(x, **kwargs)
+    if distance is None or len(peaks) < 2:
+        return peaks, properties
+    if distance < 1:
+        raise ValueError('`distance` must be greater or equal to 1')
+
+    before = {key: value for key, value in kwargs.items() if key not in AFTER_DISTANCE}
+    if len(before) == len(kwargs):
+        keep = select_by_distance(peaks, x[peaks], distance)
+    else:
+        # prominence / width は極大値ごとに x だけで決まるので、
+        # distance で間引いた極大値のうち、条件を満たすものを残せば scipy と同じになる
+        candidates, _ = scipy_find_peaks(x, **before)
+        selected = candidates[select_by_distance(candidates, x[candidates], distance)]
+        keep = np.isin(peaks, selected)
+    return peaks[keep], {key: values[keep] for key, values in properties.items()}
+
+
+def select_by_distance(peaks, heights, distance):
+    """
+    高い極大値から順に、distance 未満の距離にある極大値を外す (TriangleBacktest の find_peaks_distance と同じ手順)
+    同じ高さは安定ソートで右側が後ろに並ぶので、右側から先に残る
+    distance が整数でない場合は scipy と同じく切り上げる
+    Returns: 残す極大値の bool 配列
+    """
+    count = len(peaks)
+    distance = math.ceil(distance)
+    if distance <= 1 or count < 2:
+        return np.ones(count, dtype=bool)
+
+    positions = peaks.tolist()
+    kept = [True] * count
+    for j in np.argsort(heights, kind='mergesort')[::-1].tolist():
+        if not kept[j]:
+            continue
+        position = positions[j]
+        m = j - 1
+        while m >= 0 and position - positions[m] < distance:
+            kept[m] = False
+            m -= 1
+        m = j + 1
+        while m < count and positions[m] - position < distance:
+            kept[m] = False
+            m += 1
+    return np.array(kept)
+
+
+class PeakTracker:
+    """
+    find_peaks(x, distance=distance) をスライディングウィンドウ上でストリーミング計算する
+
+    1本ずつ値を受け取り、右側の値が下がった時点で極大値の候補を確定させる。
+    distance による間引きは候補が追加・削除されたときに近傍だけ再評価するため、
+    1本あたりのコストはウィンドウ長に依存しない（償却 O(distance)）。
+
+    同じ高さの候補が distance 以内に並んだ場合は右側を優先する
+    （find_peaks が安定ソートで並べたときと同じ結果）。
+    """
+    def __init__(self, distance, window=None):
+        self.distance = max(int(distance), 1)
+        self.window = window
+        self.reset()
+
+    def reset(self, start=0):
+        self.count = start        # 次に受け取るバーの絶対インデックス
+        self.start = start        # ウィンドウ先頭の絶対インデックス
+        self.version = 0          # 極大値の集合が変わるたびに増える
+        self._last = None
+        self._rise_start = None   # 上昇から始まったプラトーの左端
+        self._positions = []
+        self._lefts = []
+        self._heights = []
+        self._kept = []
+        self._base = 0            # リスト先頭要素の候補番号
+        self._head = 0            # ウィンドウ内の最初の候補番号
+        self._dirty = []
+
+    def update(self, value):
+        i = self.count
+        last = self._last
+
+        if last is not None:
+            if value > last:
+                self._rise_start = i
+            elif value < last and self._rise_start is not None:
+                left = self._rise_start
+                self._push((left + i - 1) // 2, left, last)
+                self._rise_start = None
+
+        self._last = value
+        self.count = i + 1
+
+        if self.window is not None:
+            self._slide(max(self.start, i - self.window + 1))
+        self._resolve()
+
+    def peaks(self):
+        return self.positions() - self.start
+
+    def positions(self):
+        offset = self._head - self._base
+        return np.array(
+            [p for p, kept in zip(self._positions[offset:], self._kept[offset:]) if kept],
+            dtype=np.intp
+        )
+
+    def is_peak(self, position):
+        """
+        position (絶対インデックス) が現在の極大値か
+        直近の位置を調べる場合は末尾の数個の候補を見るだけで済む
+        """
+        base = self._base
+        for k in range(len(self._positions) - 1, self._head - base - 1, -1):
+            p = self._positions[k]
+            if p <= position:
+                return p == position and self._kept[k]
+        return False
+
+    def _push(self, pos, left, height):
+        k = self._base + len(self._positions)
+        self._positions.append(pos)
+        self._lefts.append(left)
+        self._heights.append(height)
+        self._kept.append(False)
+        heapq.heappush(self._dirty, (-height, -pos, k))
+
+    def _slide(self, start):
+        self.start = start
+        end = self._base + len(self._positions)
+
+        # 左端の値がウィンドウから外れた候補は極大値ではなくなる
+        while self._head < end and self._lefts[self._head - self._base] - 1 < start:
+            k = self._head
+            self._head += 1
+            if self._kept[k - self._base]:
+                self._kept[k - self._base] = False
+                self.version += 1
+                self._mark_lower_neighbors(k)
+
+        offset = self._head - self._base
+        if offset > 64 and offset * 2 > len(self._positions):
+            del self._positions[:offset], self._lefts[:offset], self._heights[:offset], self._kept[:offset]
+            self._base = self._head
+
+    def _neighbors(self, k):
+        base = self._base
+        pos = self._positions[k - base]
+        end = base + len(self._positions)
+
+        j = k - 1
+        while j >= self._head and pos - self._positions[j - base] < self.distance:
+            yield j
+            j -= 1
+        j = k + 1
+        while j < end and self._positions[j - base] - pos < self.distance:
+            yield j
+            j += 1
+
+    def _higher(self, a, b):
+        base = self._base
+        ha, hb = self._heights[a - base], self._heights[b - base]
+        return ha > hb or (ha == hb and self._positions[a - base] > self._positions[b - base])
+
+    def _mark_lower_neighbors(self, k):
+        base = self._base
+        for j in self._neighbors(k):
+            if self._higher(k, j):
+                heapq.heappush(self._dirty, (-self._heights[j - base], -self._positions[j - base], j))
+
+    def _resolve(self):
+        # 優先度の高い候補から順に評価するので、評価時点で上位の状態は確定している
+        base = self._base
+        while self._dirty:
+            _, _, k = heapq.heappop(self._dirty)
+            if k < self._head:
+                continue
+
+            kept = not any(self._kept[j - base] and self._higher(j, k) for j in self._neighbors(k))
+            if kept != self._kept[k - base]:
+                self._kept[k - base] = kept
+                self.version += 1
+                self._mark_lower_neighbors(k)
+
+
+class PivotDetector:
+    """
+    高値・安値の極大値・極小値をストリーミングで検出する
+
+    pivots() は直近 window 本に対して
+    find_peaks(highs, distance=distance) / find_peaks(-lows, distance=distance)
+    を実行した結果と同じインデックス（ウィンドウ先頭からの位置）を返す。
+    """
+    def __init__(self, distance, window=None):
+        self.highs = PeakTracker(distance, window)
+        self.lows = PeakTracker(distance, window)
+
+    @property
+    def count(self):
+        return self.highs.count
+
+    @property
+    def version(self):
+        return (self.highs.version, self.lows.version)
+
+    def reset(self, start=0):
+        self.highs.reset(start)
+        self.lows.reset(start)
+
+    def update(self, high, low):
+        self.highs.update(high)
+        self.lows.update(-low)
+
+    def pivots(self):
+        return self.highs.peaks(), self.lows.peaks()
+
+    def positions(self):
+        return self.highs.positions(), self.lows.positions()
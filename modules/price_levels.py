@@ -0,0 +1,103 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+from .pivots import PeakTracker
+
+
+class PriceLevelIndex:
+    """
+    水平線（極値が集まる価格帯）を固定幅のビンでスライディングウィンドウ上に数える
+
+    - 極大値・極小値は distance 本後に確定したもの (features.confirmed_pivots と同じ規則) を1回だけ追加し、
+      ウィンドウ (直近 window 本) から外れたら取り除く
+    - ビンは価格を bucket の幅で区切った固定の区間なので、バーが進んでもビンの境界は変わらない
+    - threshold 個以上の極値が入ったビンの下端を水平線とし、並べたまま持っておく
+    - near() は価格の近くに水平線があるかを二分探索で答える (O(log 水平線の数))
+
+    np.histogram(bins=極値の数) で毎回ビンを作り直す方法と違い、
+    ウィンドウ内の極値の最大・最小が変わっても水平線の位置は動かない。
+    """
+    def __init__(self, bucket, threshold, window, distance):
+        if bucket <= 0:
+            raise ValueError(f"bucket must be positive: {bucket}")
+        self.bucket = bucket
+        self.threshold = threshold
+        self.window = window
+        self.distance = max(int(distance), 1)
+        self.reset()
+
+    def reset(self, start=0):
+        # 極値の確定には distance 本後まで、間引きの判定には前後 distance 本が必要
+        self.highs = PeakTracker(self.distance, window=3 * self.distance)
+        self.lows = PeakTracker(self.distance, window=3 * self.distance)
+        self.highs.reset(start)
+        self.lows.reset(start)
+        self.count = start
+        self.recent = deque(maxlen=self.distance + 1)  # (高値, 安値)
+        self.counts = {}  # ビンの番号: 極値の数
+        self.levels = []  # threshold 以上のビンの番号 (昇順)
+        self.pivots = deque()  # (極値のバー位置, ビンの番号)
+
+    def bucket_of(self, price):
+        # 割り算の丸めでビンの境界にある価格が下のビンに入らないようにする
+        return math.floor(price / self.bucket + 1e-9)
+
+    def update(self, high, low):
+        t = self.count
+        self.highs.update(high)
+        self.lows.update(-low)
+        self.recent.append((high, low))
+        self.count = t + 1
+
+        # distance 本前の極値を確定する
+        if len(self.recent) > self.distance:
+            position = t - self.distance
+            high_then, low_then = self.recent[0]
+            if self.highs.is_peak(position):
+                self._add(position, high_then)
+            if self.lows.is_peak(position):
+                self._add(position, low_then)
+
+        # ウィンドウから外れた極値を取り除く
+        start = t - self.window + 1
+        while self.pivots and self.pivots[0][0] < start:
+            _, bucket = self.pivots.popleft()
+            self._remove(bucket)
+
+    def near(self, price, distance, above=True):
+        """
+        above=True: price 以上 price + distance 以下に水平線があるか
+        above=False: price - distance 以上 price 以下に水平線があるか
+        """
+        low, high = (price, price + distance) if above else (price - distance, price)
+        levels = self.levels
+        k = bisect_left(levels, self.bucket_of(low) - 1)
+        while k < len(levels):
+            line = levels[k] * self.bucket
+            if line > high:
+                break
+            if line >= low:
+                return True
+            k += 1
+        return False
+
+    def lines(self):
+        return np.array(self.levels, dtype=float) * self.bucket
+
+    def _add(self, position, price):
+        bucket = self.bucket_of(price)
+        self.pivots.append((position, bucket))
+        count = self.counts.get(bucket, 0) + 1
+        self.counts[bucket] = count
+        if count == self.threshold:
+            insort(self.levels, bucket)
+
+    def _remove(self, bucket):
+        count = self.counts[bucket] - 1
+        if count == self.threshold - 1:
+            del self.levels[bisect_left(self.levels, bucket)]
+        if count:
+            self.counts[bucket] = count
+        else:
+            del self.counts[bucket]
@@ -1,38 +1,107 @@
+import numpy as np
 import pandas as pd
 
+class MultiTimeframeResampler:
+    """
+    1分足から複数の上位足 (5分足・15分足・1時間足など) を作る
+
+    各1分足の行には、その時点までにできている上位足の値を並べる (先読みしない)。
+    上位足がまだ確定していない行は {prefix}partial が True になる。
+    1分足の終了時刻が上位足の区切りと一致した行で確定とする（1分足が欠けていても時刻だけで判定する）。
+
+    - compute: 全期間の配列をまとめて計算する（元の配列はコピーしない）
+    - update: ライブ用に1本ずつ O(1) で更新する
+    """
+    def __init__(self, periods=None, bar_seconds=60):
+        # prefix: 上位足の秒数
+        self.periods = periods or {'5min_': 300, '15min_': 900, '1h_': 3600}
+        self.bar_seconds = bar_seconds
+        self.reset()
+
+    def reset(self):
+        self.state = {prefix: None for prefix in self.periods}
+
+    def compute(self, times, opens, highs, lows, closes, volumes):
+        """
+        times: 1分足の開始時刻 (UNIX 時間の秒)
+        Returns: {prefix + 列名: 1分足と同じ長さの配列}
+        """
+        times = np.asarray(times)
+        volume_total = np.cumsum(volumes)
+        result = {}
+        for prefix, period in self.periods.items():
+            bucket = times // period
+            is_start = np.r_[True, bucket[1:] != bucket[:-1]]
+            starts = np.flatnonzero(is_start)
+            group = np.cumsum(is_start) - 1
+
+            # 上位足が始まってからの累計
+            volume_before = (volume_total - volumes)[starts]
+
+            result[f"{prefix}time"] = (bucket * period).astype('datetime64[s]')
+            result[f"{prefix}open"] = np.asarray(opens)[starts][group]
+            result[f"{prefix}high"] = pd.Series(highs).groupby(group).cummax().values
+            result[f"{prefix}low"] = pd.Series(lows).groupby(group).cummin().values
+            result[f"{prefix}close"] = closes
+            result[f"{prefix}tick_volume"] = volume_total - volume_before[group]
+            result[f"{prefix}partial"] = (times + self.bar_seconds) % period != 0
+        return result
+
+    def update(self, time, open, high, low, close, volume):
+        """
+        1分足を1本追加して、その時点の上位足の値を返す
+        """
+        result = {}
+        for prefix, period in self.periods.items():
+            bucket = time // period
+            state = self.state[prefix]
+            if state is None or state['bucket'] != bucket:
+                state = {'bucket': bucket, 'open': open, 'high': high, 'low': low, 'tick_volume': 0}
+                self.state[prefix] = state
+            else:
+                state['high'] = max(state['high'], high)
+                state['low'] = min(state['low'], low)
+            state['tick_volume'] += volume
+
+            result[f"{prefix}time"] = np.datetime64(int(bucket * period), 's')
+            result[f"{prefix}open"] = state['open']
+            result[f"{prefix}high"] = state['high']
+            result[f"{prefix}low"] = state['low']
+            result[f"{prefix}close"] = close
+            result[f"{prefix}tick_volume"] = state['tick_volume']
+            result[f"{prefix}partial"] = (time + self.bar_seconds) % period != 0
+        return result
+
 class ResampleData:
-    def __init__(self, df: pd.DataFrame, resample_period: str = '5T', prefix: str = '5min_'):
+    """
+    1分足の DataFrame に上位足の列 ({prefix}open など) を追加する
+
+    各行には、その1分足の時点までにできている上位足の値が入る（確定前は {prefix}partial が True）。
+    渡された DataFrame は変更しない。
+    """
+    def __init__(self, df: pd.DataFrame, resample_period: str = '5min', prefix: str = '5min_'):
         self.df = df
         self.resample_period = resample_period
         self.prefix = prefix
-        
+
     def resample_data(self):
-        # Convert the 'time' column to datetime type and set it as the index
-        self.df['time'] = pd.to_datetime(self.df['time'])
-        self.df.set_index('time', inplace=True)
-
-        df_resampled = self.df.resample(self.resample_period).agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'tick_volume': 'sum'
-        })
-        
-        # Rename columns based on the provided prefix
-        df_resampled.columns = [f"{self.prefix}{col}" for col in df_resampled.columns]
-        return df_resampled
-    
-    def fill_missing_values(self, df_merged):
-        df_merged[f"{self.prefix}open"].ffill(inplace=True)
-        df_merged[f"{self.prefix}high"].ffill(inplace=True)
-        df_merged[f"{self.prefix}low"].ffill(inplace=True)
-        df_merged[f"{self.prefix}close"].ffill(inplace=True)
-        df_merged[f"{self.prefix}tick_volume"].ffill(inplace=True)
-        return df_merged
-    
+        period = int(pd.Timedelta(pd.tseries.frequencies.to_offset(self.resample_period)).total_seconds())
+        times = pd.to_datetime(self.df['time']).values.astype('datetime64[s]').astype(np.int64)
+        resampler = MultiTimeframeResampler({self.prefix: period})
+        return resampler.compute(
+            times,
+            self.df['open'].values,
+            self.df['high'].values,
+            self.df['low'].values,
+            self.df['close'].values,
+            self.df['tick_volume'].values,
+        )
+
     def merge_data(self):
-        df_resampled = self.resample_data()
-        df_merged = self.df.join(df_resampled, how='left')
-        df_filled = self.fill_missing_values(df_merged)
-        return df_filled
\ No newline at end of file
+        columns = self.resample_data()
+        del columns[f"{self.prefix}time"]
+
+        df_merged = self.df.assign(time=pd.to_datetime(self.df['time'])).set_index('time')
+        for col, values in columns.items():
+            df_merged[col] = values
+        return df_merged
@@ -0,0 +1,213 @@
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .pivots import PivotDetector
+from .ledger import Position
+
+class TrendReversalBacktest:
+    """
+    TradingStrategy.trade_logic_trend_reversal を全期間まとめて実行するバックテスト
+
+    EMA フィルター・ローソク足の実体/ヒゲ・直近20本の平均実体（strategy の指標と同じ計算）・
+    極値から求めるトレンド転換ラインを配列演算で先に計算し、ループではポジションと
+    strategy.conditions の状態遷移だけを回す。
+    エントリー・イグジットと strategy.trade_results はステップ実行
+    （use_pivot_detector=True）と同じになる。
+    """
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    def candle_features(self, opens, highs, lows, closes):
+        body = np.abs(closes - opens)
+        wick = np.maximum(highs - np.maximum(opens, closes), np.minimum(opens, closes) - lows)
+        avg_body = self.strategy.avg_candle_body.compute(body)
+        return body, wick, avg_body
+
+    def reversal_lines(self, highs, lows):
+        """
+        各バーのウィンドウについて update_trend_reversal_line(_short) の結果と
+        define_trend_reversal_line(_short) が成立するか（5回連続の切り下げ/切り上げ）を求める
+        """
+        detector = PivotDetector(self.strategy.distance, self.strategy.df_sliced_period)
+        version = None
+        rows = []
+        for i in range(len(highs)):
+            detector.update(highs[i], lows[i])
+            if detector.version != version:
+                version = detector.version
+                pivots_high, pivots_low = detector.positions()
+                row = self._lines_from_pivots(highs[pivots_high], lows[pivots_low])
+            rows.append(row)
+
+        names = [
+            'long_line', 'last_min_value', 'lowest_price', 'long_defined', 'has_valleys',
+            'short_line', 'last_max_value', 'highest_price', 'short_defined', 'has_peaks',
+        ]
+        return dict(zip(names, map(list, zip(*rows))))
+
+    def _lines_from_pivots(self, high_values, low_values):
+        min_length = min(len(high_values), len(low_values))
+        highs_head = high_values[:min_length]
+        lows_head = low_values[:min_length]
+        descending = (highs_head[1:] < highs_head[:-1]) & (lows_head[1:] < lows_head[:-1])
+        ascending = (highs_head[1:] > highs_head[:-1]) & (lows_head[1:] > lows_head[:-1])
+
+        long_line = last_min_value = lowest_price = math.nan
+        if len(low_values):
+            k = int(np.argmin(low_values))
+            if k < len(high_values):
+                long_line, last_min_value, lowest_price = high_values[k], low_values[-1], low_values[k]
+
+        short_line = last_max_value = highest_price = math.nan
+        if len(high_values):
+            k = int(np.argmax(high_values))
+            if k < len(low_values):
+                short_line, last_max_value, highest_price = low_values[k], high_values[-1], high_values[k]
+
+        return (
+            long_line, last_min_value, lowest_price, self._has_run(descending), len(low_values) > 0,
+            short_line, last_max_value, highest_price, self._has_run(ascending), len(high_values) > 0,
+        )
+
+    def _has_run(self, flags, length=5):
+        if len(flags) < length:
+            return False
+        return bool(sliding_window_view(flags, length).all(axis=1).any())
+
+    def run(self, df):
+        """
+        Returns:
+        - actions: 各バーのアクション ('entry_long' など、無ければ None)
+        - exit_pips: イグジットしたバーの獲得 pips (それ以外は 0)
+        """
+        st = self.strategy
+        opens = df['open'].values.astype(float)
+        highs = df['high'].values.astype(float)
+        lows = df['low'].values.astype(float)
+        closes = df['close'].values.astype(float)
+        spreads = df['spread'].values
+
+        ema = st.ema100.compute(closes).tolist()
+        body, wick, avg_body = (a.tolist() for a in self.candle_features(opens, highs, lows, closes))
+        lines = self.reversal_lines(highs, lows)
+        closes = closes.tolist()
+        spreads = spreads.tolist()
+
+        n = len(closes)
+        actions = [None] * n
+        exit_pips = [0] * n
+        portfolio = Position()
+        conditions = st.init_conditions()
+
+        for i in range(n):
+            close = closes[i]
+            spread_pips = spreads[i] * st.pip_value
+
+            if st.base_spread_pips > 0 and spread_pips >= st.base_spread_pips * 2:
+                continue
+
+            # Exit
+            if portfolio['position'] == 'long':
+                if close >= portfolio['take_profit'] or close <= portfolio['stop_loss']:
+                    pips = (close - portfolio['entry_price']) * (1 / st.pip_value) - spread_pips
+                    self._record(i, 'exit_long', portfolio, conditions['trend_reversal_line'], close, pips)
+                    actions[i], exit_pips[i] = 'exit_long', pips
+                    portfolio.reset()
+                    conditions = st.init_conditions()
+
+            elif portfolio['position'] == 'short':
+                if close <= portfolio['take_profit'] or close >= portfolio['stop_loss']:
+                    pips = (portfolio['entry_price'] - close) * (1 / st.pip_value) + spread_pips
+                    self._record(i, 'exit_short', portfolio, conditions['trend_reversal_line_short'], close, pips)
+                    actions[i], exit_pips[i] = 'exit_short', pips
+                    portfolio.reset()
+                    conditions = st.init_conditions()
+
+            # Entry
+            elif self._is_long_entry(i, conditions, lines, close, ema, body, wick, avg_body):
+                portfolio.position = 'long'
+                portfolio.entry_price = close
+                portfolio.take_profit = close + (st.stop_loss_pips * st.risk_reward_ratio)
+                portfolio.stop_loss = conditions['last_min_value'] - st.stop_loss_pips
+                self._record(i, 'entry_long', portfolio, conditions['trend_reversal_line'], 0, 0)
+                actions[i] = 'entry_long'
+
+            elif self._is_short_entry(i, conditions, lines, close, ema, body, wick, avg_body):
+                portfolio.position = 'short'
+                portfolio.entry_price = close
+                portfolio.take_profit = close - (st.stop_loss_pips * st.risk_reward_ratio)
+                portfolio.stop_loss = conditions['last_max_value'] + st.stop_loss_pips
+                self._record(i, 'entry_short', portfolio, conditions['trend_reversal_line_short'], 0, 0)
+                actions[i] = 'entry_short'
+
+        st.conditions = conditions
+        return actions, exit_pips
+
+    def _is_long_entry(self, i, conditions, lines, close, ema, body, wick, avg_body):
+        trend_reversal_line = None
+
+        if conditions['last_min_value'] == 0 and conditions['last_max_value'] == 0:
+            if lines['long_defined'][i]:
+                trend_reversal_line = self._apply_long_line(i, conditions, lines)
+        elif conditions['lowest_price'] > close:
+            if not lines['has_valleys'][i]:
+                raise ValueError(f"No valleys in the window at index {i}")
+            trend_reversal_line = self._apply_long_line(i, conditions, lines)
+
+        if trend_reversal_line is None and conditions['trend_reversal_line'] == 0:
+            return False
+
+        if trend_reversal_line is not None:
+            conditions['trend_reversal_line'] = trend_reversal_line
+
+        if close <= ema[i]:
+            return False
+
+        return (close > conditions['trend_reversal_line'] and
+                body[i] > avg_body[i] and
+                wick[i] <= (0.2 * body[i]) and
+                body[i] >= self.strategy.candle_size_pips)
+
+    def _is_short_entry(self, i, conditions, lines, close, ema, body, wick, avg_body):
+        trend_reversal_line = None
+
+        if conditions['last_min_value'] == 0 and conditions['last_max_value'] == 0:
+            if lines['short_defined'][i]:
+                trend_reversal_line = self._apply_short_line(i, conditions, lines)
+        elif conditions['highest_price'] < close:
+            if not lines['has_peaks'][i]:
+                raise ValueError(f"No peaks in the window at index {i}")
+            trend_reversal_line = self._apply_short_line(i, conditions, lines)
+
+        if trend_reversal_line is None and conditions['trend_reversal_line_short'] == 0:
+            return False
+
+        if trend_reversal_line is not None:
+            conditions['trend_reversal_line_short'] = trend_reversal_line
+
+        if close >= ema[i]:
+            return False
+
+        return (close < conditions['trend_reversal_line_short'] and
+                body[i] > avg_body[i] and
+                wick[i] <= (0.2 * body[i]) and
+                body[i] >= self.strategy.candle_size_pips)
+
+    def _apply_long_line(self, i, conditions, lines):
+        if math.isnan(lines['long_line'][i]):
+            return None
+        conditions['last_min_value'] = lines['last_min_value'][i]
+        conditions['lowest_price'] = lines['lowest_price'][i]
+        return lines['long_line'][i]
+
+    def _apply_short_line(self, i, conditions, lines):
+        if math.isnan(lines['short_line'][i]):
+            return None
+        conditions['last_max_value'] = lines['last_max_value'][i]
+        conditions['highest_price'] = lines['highest_price'][i]
+        return lines['short_line'][i]
+
+    def _record(self, i, action, portfolio, reversal_price, exit_price, gained_pips):
+        self.strategy.trade_results.append(
+            i, action, portfolio['entry_price'], reversal_price,
+            portfolio['take_profit'], portfolio['stop_loss'], exit_price, gained_pips)
@@ -0,0 +1,87 @@
+import time
+from collections import deque
+
+# 時間足ごとの秒数
+TIMEFRAME_SECONDS = {
+    'M1': 60,
+    'M5': 300,
+    'M15': 900,
+    'M30': 1800,
+    'H1': 3600,
+    'H4': 14400,
+    'D1': 86400,
+}
+
+
+class BarCloseScheduler:
+    """
+    使っている時間足のいずれかの足が確定した直後（offset 秒後）まで待つ
+
+    固定の sleep と違って処理時間の分だけ起床がずれていくことがなく、毎回同じタイミングで判定できる。
+    起床した時刻と足の確定時刻との差（遅延）を記録する。
+
+    - timeframes: 'M1' などの時間足の名前のリスト
+    - offset: 足の確定から起床までの秒数（新しい足の最初のティックを待つ余裕）
+    - shift: 足の区切りを UTC からずらす秒数（H4/D1 をサーバー時間の0時に合わせる場合など）
+    - max_sleep: 1回の sleep の上限の秒数（None の場合は残り時間をまとめて待つ）
+    """
+    def __init__(self, timeframes=('M1',), offset=0.5, shift=0, history=1000, clock=time.time, sleep=time.sleep,
+                 max_sleep=1.0):
+        self.periods = {name: TIMEFRAME_SECONDS[name] for name in timeframes}
+        self.offset = offset
+        self.shift = shift
+        self.clock = clock
+        self.sleep = sleep
+        self.max_sleep = max_sleep
+
+        self.last_close = None
+        self.lateness = deque(maxlen=history)  # 足の確定時刻から起床までの秒数
+        self.missed = 0  # 処理が長引いて待てなかった足の確定の回数
+
+    def next_close(self, now=None):
+        """
+        now より後に（offset を含めて）来る最初の足の確定時刻
+        """
+        now = self.clock() if now is None else now
+        base = now - self.offset - self.shift
+        return min((base // period + 1) * period for period in self.periods.values()) + self.shift
+
+    def closed_timeframes(self, bar_close):
+        return [name for name, period in self.periods.items() if (bar_close - self.shift) % period == 0]
+
+    def wait(self):
+        """
+        次の足の確定まで待つ
+
+        Returns:
+        - time: 確定した足の終了時刻 (UNIX 時間)
+        - timeframes: その時刻に足が確定した時間足
+        - lateness: 足の確定時刻から起床までの秒数
+        """
+        bar_close = self.next_close()
+        target = bar_close + self.offset
+
+        # 長い sleep は誤差やスリープ復帰でずれるので、残り時間を測り直しながら待つ
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                break
+            self.sleep(remaining if self.max_sleep is None else min(remaining, self.max_sleep))
+
+        lateness = self.clock() - bar_close
+        self.lateness.append(lateness)
+
+        if self.last_close is not None:
+            step = min(self.periods.values())
+            self.missed += max(int(round((bar_close - self.last_close) / step)) - 1, 0)
+        self.last_close = bar_close
+
+        return {
+            'time': bar_close,
+            'timeframes': self.closed_timeframes(bar_close),
+            'lateness': lateness,
+        }
+
+    def __iter__(self):
+        while True:
+            yield self.wait()
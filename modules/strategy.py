@@ -1,6 +1,8 @@
 import numpy as np
-import pandas as pd
-from scipy.signal import find_peaks
+from .pivots import PivotDetector, find_peaks
+from .indicators import WindowEMA, RollingMean
+from .ledger import TradeLedger
+from .computation_cache import ComputationCache
 
 class TradingStrategy:
     """
@@ -11,6 +13,9 @@ class TradingStrategy:
         df_sliced_period: 計算に使うデータ期間の範囲
         distance: 極大値・極小値の間にあるローソク足の最低距離
         candle_size_pips: 大陽線・大陰線の基準とする最低値幅
+        use_pivot_detector: 極大値・極小値をストリーミングで計算する（False の場合は毎回 find_peaks を実行）
+
+    1本のバーの判定で使う極値は cache に入れ、ロング・ショートの判定と各トレンド転換ラインの計算で共有する
     """
     def __init__(self, params=None):
         # Setting values
@@ -19,18 +24,29 @@ class TradingStrategy:
         self.stop_loss_pips = 0.10   # 10 pips
         self.base_spread_pips = 0.03 # 3 pips
         self.df_sliced_period = 500
-        self.distance = 7,
-        self.candle_size_pips: 0.05
+        self.distance = 7
+        self.candle_size_pips = 0.05
+        self.use_pivot_detector = True
 
         if params:
             for key, value in params.items():
                 setattr(self, key, value)
 
         self.pip_value = 0.01 if 'JPY' in self.symbol else 0.0001
-        self.trade_results = []
+        self.trade_results = TradeLedger()
 
         # Set up
         self.conditions = self.init_conditions()
+        self.pivot_detector = PivotDetector(self.distance, self.df_sliced_period)
+        self.cache = ComputationCache()
+        self.window = None  # 判定中のウィンドウ (終わりのバー位置, 長さ)。None の間はキャッシュしない
+        self.ema100 = WindowEMA(span=100, window=self.df_sliced_period)
+        self.avg_candle_body = RollingMean(20)
+        self.bar_count = 0
+        self.last_bar_time = None  # 最後に指標に追加したバーの時刻 ('time' 列がある場合)
+        self.shared_indicators = None  # SharedIndicators で他の戦略と指標を共有する場合に設定される
+        self.arrays_source = None
+        self.arrays = None
 
     def init_conditions(self):
         return {
@@ -43,9 +59,57 @@ class TradingStrategy:
         }
 
     def get_trade_results(self):
-        return self.trade_results
+        return self.trade_results.to_dataframe()
+
+    def bar_arrays(self, df):
+        # 同じ DataFrame の列は1回だけ取り出す (バックテストでは全てのバーで同じ df が渡される)
+        if df is not self.arrays_source:
+            self.arrays = (df['open'].values, df['high'].values, df['low'].values, df['close'].values)
+            self.arrays_source = df
+        return self.arrays
     
+    def update_indicators(self, df, i):
+        # エントリー判定で使う極値・EMA・平均実体はここで1本ずつ更新する
+        # 1本ずつ追加できない場合（足が飛んだ、バックテストのやり直し）はウィンドウから作り直す
+        if self.shared_indicators is not None:
+            self.shared_indicators.update(df, i)
+            return
+
+        # ライブでは直近 N 本の df が毎回作り直され i は変わらないので、位置ではなく1本前の足の時刻で続きかを判断する
+        # (ウィンドウの本数が df_sliced_period に満たない間は、位置も続いている場合だけ)
+        times = df['time'].values if 'time' in df.columns else None
+        if times is not None:
+            incremental = (i > 0 and self.last_bar_time is not None and times[i - 1] == self.last_bar_time
+                           and (i == self.bar_count or i + 1 >= self.df_sliced_period))
+        else:
+            incremental = i == self.bar_count
+
+        if incremental:
+            start = i
+        else:
+            start = max(0, i - self.df_sliced_period + 1)
+            self.pivot_detector.reset(start)
+            self.ema100.reset()
+            self.avg_candle_body.reset()
+
+        opens, highs, lows, closes = self.bar_arrays(df)
+        for j in range(start, i + 1):
+            if self.use_pivot_detector:
+                self.pivot_detector.update(highs[j], lows[j])
+            self.ema100.update(closes[j])
+            self.avg_candle_body.update(abs(closes[j] - opens[j]))
+        self.bar_count = i + 1
+        self.last_bar_time = times[i] if times is not None else None
+
     def zigzag_calculate(self, highs, lows):
+        if self.window is None:
+            return self.find_pivots(highs, lows)
+        # 同じバーの中で何度呼ばれても検出済みの極値を使う
+        return self.cache.get(
+            ('pivots', self.distance, self.use_pivot_detector) + self.window,
+            lambda: self.pivot_detector.pivots() if self.use_pivot_detector else self.find_pivots(highs, lows))
+
+    def find_pivots(self, highs, lows):
         peaks, _ = find_peaks(highs, distance=self.distance)
         valleys, _ = find_peaks(-lows, distance=self.distance)
         return peaks, valleys
@@ -133,14 +197,13 @@ class TradingStrategy:
             trend_reversal_line is not None):
             self.conditions['trend_reversal_line'] = trend_reversal_line
 
-        ema100 = pd.Series(closes).ewm(span=100, adjust=False).mean().values
-        if use_ema_filter and closes[-1] <= ema100[-1]:
+        if use_ema_filter and closes[-1] <= self.ema100.value:
             return False
 
         candle_body = abs(closes[-1] - opens[-1])
         candle_wick = max(highs[-1] - max(opens[-1], closes[-1]), min(opens[-1], closes[-1]) - lows[-1])
         
-        avg_candle_body_last_20 = sum([abs(closes[i] - opens[i]) for i in range(-20, 0)]) / 20
+        avg_candle_body_last_20 = self.avg_candle_body.value
         
         if (closes[-1] > self.conditions['trend_reversal_line'] and
             candle_body > avg_candle_body_last_20 and
@@ -165,14 +228,13 @@ class TradingStrategy:
             trend_reversal_line is not None):
             self.conditions['trend_reversal_line_short'] = trend_reversal_line
 
-        ema100 = pd.Series(closes).ewm(span=100, adjust=False).mean().values
-        if use_ema_filter and closes[-1] >= ema100[-1]:
+        if use_ema_filter and closes[-1] >= self.ema100.value:
             return False
 
         candle_body = abs(closes[-1] - opens[-1])
         candle_wick = max(highs[-1] - max(opens[-1], closes[-1]), min(opens[-1], closes[-1]) - lows[-1])
         
-        avg_candle_body_last_20 = sum([abs(closes[i] - opens[i]) for i in range(-20, 0)]) / 20
+        avg_candle_body_last_20 = self.avg_candle_body.value
         
         if (closes[-1] < self.conditions['trend_reversal_line_short'] and
             candle_body > avg_candle_body_last_20 and
@@ -186,6 +248,8 @@ class TradingStrategy:
         close = closes[i]
         spread_pips = spreads[i] * self.pip_value
 
+        self.update_indicators(df, i)
+
         if self.base_spread_pips > 0 and spread_pips >= self.base_spread_pips * 2:
             # print(f"Warning: Spread is unusually high at {df.iloc[i]['spread']}pips. Skipping trade at index {i}.")
             return None
@@ -196,16 +260,9 @@ class TradingStrategy:
                 portfolio['pips'] = (close - portfolio['entry_price']) * (1 / self.pip_value) - spread_pips
 
                 action = 'exit_long'
-                self.trade_results.append({
-                    'index': i,
-                    'action': action,
-                    'entry_price': portfolio['entry_price'],
-                    'reversal_price': self.conditions['trend_reversal_line'],
-                    'take_profit_price': portfolio['take_profit'],
-                    'stop_loss_price': portfolio['stop_loss'],
-                    'exit_price': close,
-                    'gained_pips': portfolio['pips']
-                })
+                self.trade_results.append(
+                    i, action, portfolio['entry_price'], self.conditions['trend_reversal_line'],
+                    portfolio['take_profit'], portfolio['stop_loss'], close, portfolio['pips'])
                 self.conditions = self.init_conditions()
                 return action
 
@@ -214,32 +271,30 @@ class TradingStrategy:
                 portfolio['pips'] = (portfolio['entry_price'] - close) * (1 / self.pip_value) + spread_pips
 
                 action = 'exit_short'
-                self.trade_results.append({
-                    'index': i,
-                    'action': action,
-                    'entry_price': portfolio['entry_price'],
-                    'reversal_price': self.conditions['trend_reversal_line_short'],
-                    'take_profit_price': portfolio['take_profit'],
-                    'stop_loss_price': portfolio['stop_loss'],
-                    'exit_price': close,
-                    'gained_pips': portfolio['pips']
-                })
+                self.trade_results.append(
+                    i, action, portfolio['entry_price'], self.conditions['trend_reversal_line_short'],
+                    portfolio['take_profit'], portfolio['stop_loss'], close, portfolio['pips'])
                 self.conditions = self.init_conditions()
                 return action
 
         # Entry
         else:
-            if i < self.df_sliced_period:
-                df_sliced = df.iloc[:i+1]
-            else:
-                df_sliced = df.iloc[i-self.df_sliced_period+1:i+1]
-
-            opens_sliced = df_sliced['open'].values
-            closes_sliced = df_sliced['close'].values
-            highs_sliced = df_sliced['high'].values
-            lows_sliced = df_sliced['low'].values
-            
-            if self.is_long_entry_condition(opens_sliced, highs_sliced, lows_sliced, closes_sliced, True):
+            start = max(0, i - self.df_sliced_period + 1)
+            opens, highs, lows, closes = self.bar_arrays(df)
+            opens_sliced = opens[start:i+1]
+            closes_sliced = closes[start:i+1]
+            highs_sliced = highs[start:i+1]
+            lows_sliced = lows[start:i+1]
+
+            self.cache.bind(df)
+            self.window = (i, len(closes_sliced))
+            try:
+                is_long_entry = self.is_long_entry_condition(opens_sliced, highs_sliced, lows_sliced, closes_sliced, True)
+                is_short_entry = not is_long_entry and self.is_short_entry_condition(opens_sliced, highs_sliced, lows_sliced, closes_sliced, True)
+            finally:
+                self.window = None
+
+            if is_long_entry:
 
                 portfolio['take_profit'] = close + (self.stop_loss_pips * self.risk_reward_ratio)
                 portfolio['stop_loss'] = self.conditions['last_min_value'] - self.stop_loss_pips
@@ -248,19 +303,12 @@ class TradingStrategy:
                 portfolio['position'] = 'long'
 
                 action = 'entry_long'
-                self.trade_results.append({
-                    'index': i,
-                    'action': action,
-                    'entry_price': close,
-                    'reversal_price': self.conditions['trend_reversal_line'],
-                    'take_profit_price': portfolio['take_profit'],
-                    'stop_loss_price': portfolio['stop_loss'],
-                    'exit_price': 0,
-                    'gained_pips': 0
-                })
+                self.trade_results.append(
+                    i, action, close, self.conditions['trend_reversal_line'],
+                    portfolio['take_profit'], portfolio['stop_loss'], 0, 0)
                 return action
             
-            elif self.is_short_entry_condition(opens_sliced, highs_sliced, lows_sliced, closes_sliced, True):
+            elif is_short_entry:
 
 
                 portfolio['take_profit'] = close - (self.stop_loss_pips * self.risk_reward_ratio)
@@ -270,15 +318,8 @@ class TradingStrategy:
                 portfolio['position'] = 'short'
 
                 action = 'entry_short'
-                self.trade_results.append({
-                    'index': i,
-                    'action': action,
-                    'entry_price': close,
-                    'reversal_price': self.conditions['trend_reversal_line_short'],
-                    'take_profit_price': portfolio['take_profit'],
-                    'stop_loss_price': portfolio['stop_loss'],
-                    'exit_price': 0,
-                    'gained_pips': 0
-                })
+                self.trade_results.append(
+                    i, action, close, self.conditions['trend_reversal_line_short'],
+                    portfolio['take_profit'], portfolio['stop_loss'], 0, 0)
                 return action
           
\ No newline at end of file
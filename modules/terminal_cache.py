@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class TerminalCache:
+    """
+    MT5 端末の状態 (通貨ペアごとの最新のティックと保有中のポジション) をまとめて取得して持っておく
+
+    - refresh() で監視中の通貨ペアのティックと全ポジションを1回のロックでまとめて取得する
+      (ライブでは足ごとに1回呼ぶ)
+    - tick() / positions() / position() はキャッシュから返す
+      取得してから max_age 秒を超えていたら、そのときに取得し直す
+    - 発注・決済の後は invalidate() でポジションを古いものとして扱い、次に使うときに取得し直す
+
+    ポジションはチケット・通貨ペア・マジックナンバーで引けるようにしておく。
+    """
+    def __init__(self, mt5, lock=None, symbols=(), tick_max_age=1.0, positions_max_age=5.0, instrumentation=None):
+        self.mt5 = mt5
+        self.lock = lock or threading.Lock()
+        self.symbols = list(dict.fromkeys(symbols))
+        self.tick_max_age = tick_max_age
+        self.positions_max_age = positions_max_age
+        self.instrumentation = instrumentation
+
+        self.ticks = {}  # symbol: (取得した時刻, tick)
+        self.by_ticket = {}
+        self.by_symbol = {}
+        self.by_magic = {}
+        self.positions_time = None  # None: 未取得または invalidate() 済み
+        self.generation = 0  # invalidate() の回数
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self._state_lock = threading.Lock()
+
+    def watch(self, symbol):
+        if symbol not in self.symbols:
+            self.symbols.append(symbol)
+
+    def refresh(self):
+        """
+        監視中の通貨ペアのティックと全ポジションを取得し直す
+        """
+        start = time.perf_counter()
+        generation = self.generation
+        with self.lock:
+            ticks = {symbol: self.mt5.symbol_info_tick(symbol) for symbol in self.symbols}
+            positions = self.mt5.positions_get()
+        self.queries += len(ticks) + 1
+        self._store_ticks(ticks)
+        if positions is not None:
+            self._store_positions(positions, generation)
+        if self.instrumentation is not None:
+            self.instrumentation.record('terminal_refresh', time.perf_counter() - start)
+        return positions is not None
+
+    def invalidate(self):
+        """
+        発注・決済などでポジションが変わったときに呼ぶ
+        """
+        with self._state_lock:
+            self.generation += 1
+            self.positions_time = None
+
+    def tick(self, symbol, max_age=None):
+        """
+        最新のティック (取得できなかった場合は None)
+        """
+        max_age = self.tick_max_age if max_age is None else max_age
+        cached = self.ticks.get(symbol)
+        if cached is not None and time.monotonic() - cached[0] <= max_age:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        self.watch(symbol)
+        with self.lock:
+            tick = self.mt5.symbol_info_tick(symbol)
+        self.queries += 1
+        self._store_ticks({symbol: tick})
+        return tick
+
+    def positions(self, symbol=None, magic=None, max_age=None):
+        """
+        保有中のポジション (symbol・magic を指定するとそれに一致するものだけ)
+        """
+        if not self._ensure_positions(max_age):
+            return None
+        if symbol is None and magic is None:
+            return list(self.by_ticket.values())
+        if magic is None:
+            return list(self.by_symbol.get(symbol, ()))
+        if symbol is None:
+            return list(self.by_magic.get(magic, ()))
+        return [p for p in self.by_symbol.get(symbol, ()) if p.magic == magic]
+
+    def position(self, ticket, max_age=None):
+        if not self._ensure_positions(max_age):
+            return None
+        return self.by_ticket.get(ticket)
+
+    def _ensure_positions(self, max_age=None):
+        max_age = self.positions_max_age if max_age is None else max_age
+        fetched = self.positions_time
+        if fetched is not None and time.monotonic() - fetched <= max_age:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        generation = self.generation
+        with self.lock:
+            positions = self.mt5.positions_get()
+        self.queries += 1
+        if positions is None:
+            return False
+        self._store_positions(positions, generation)
+        return True
+
+    def _store_ticks(self, ticks):
+        now = time.monotonic()
+        with self._state_lock:
+            for symbol, tick in ticks.items():
+                if tick is None:
+                    self.ticks.pop(symbol, None)
+                else:
+                    self.ticks[symbol] = (now, tick)
+
+    def _store_positions(self, positions, generation):
+        by_ticket = {}
+        by_symbol = defaultdict(list)
+        by_magic = defaultdict(list)
+        for position in positions:
+            by_ticket[position.ticket] = position
+            by_symbol[position.symbol].append(position)
+            by_magic[position.magic].append(position)
+
+        # 読む側のスレッドが途中の状態を見ないよう、作り終えてから差し替える
+        with self._state_lock:
+            self.by_ticket = by_ticket
+            self.by_symbol = dict(by_symbol)
+            self.by_magic = dict(by_magic)
+            # 取得している間に invalidate() された場合は、次に使うときにもう一度取得する
+            if generation == self.generation:
+                self.positions_time = time.monotonic()
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {
+            'queries': self.queries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / calls if calls else 0,
+            'positions': len(self.by_ticket),
+        }
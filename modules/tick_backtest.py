@@ -0,0 +1,223 @@
+import math
+import numpy as np
+import pandas as pd
+from .ledger import Position
+
+# copy_ticks_range の戻り値のうちバックテストに使う列だけを持つ (1ティック24バイト)
+TICK_DTYPE = np.dtype([('time_msc', np.int64), ('bid', np.float64), ('ask', np.float64)])
+
+
+def ticks_from_mt5(ticks):
+    """
+    copy_ticks_range / copy_ticks_from の戻り値（または同じ列の DataFrame）を TICK_DTYPE に詰め直す
+    bid/ask が変わらないティック（約定だけのティックなど）は落とす
+    """
+    if isinstance(ticks, pd.DataFrame):
+        get = lambda col: ticks[col].values
+        names = ticks.columns
+    else:
+        get = lambda col: ticks[col]
+        names = ticks.dtype.names
+
+    if 'time_msc' in names:
+        times = get('time_msc')
+        if times.dtype.kind == 'M':
+            times = times.astype('datetime64[ms]').astype(np.int64)
+    else:
+        times = get('time').astype(np.int64) * 1000
+
+    compact = np.empty(len(times), dtype=TICK_DTYPE)
+    compact['time_msc'] = times
+    compact['bid'] = get('bid')
+    compact['ask'] = get('ask')
+
+    changed = np.ones(len(compact), dtype=bool)
+    changed[1:] = (np.diff(compact['bid']) != 0) | (np.diff(compact['ask']) != 0)
+    return compact[changed]
+
+
+def bars_from_ticks(ticks, point, period=60):
+    """
+    ティックから bid のローソク足を作る (MT5 と同じく、ティックの無い時間のバーは作らない)
+    spread はバーの中の最小スプレッド (ポイント単位)
+    """
+    bar_times = ticks['time_msc'] // (period * 1000) * period
+    starts = np.flatnonzero(np.r_[True, bar_times[1:] != bar_times[:-1]])
+    bids = ticks['bid']
+    spreads = np.rint((ticks['ask'] - bids) / point).astype(np.int64)
+
+    return pd.DataFrame({
+        'time': pd.to_datetime(bar_times[starts], unit='s'),
+        'open': bids[starts],
+        'high': np.maximum.reduceat(bids, starts),
+        'low': np.minimum.reduceat(bids, starts),
+        'close': bids[np.r_[starts[1:] - 1, len(bids) - 1]],
+        'tick_volume': np.diff(np.r_[starts, len(bids)]),
+        'spread': np.minimum.reduceat(spreads, starts),
+    })
+
+
+def first_cross(prices, start, take_profit, stop_loss, is_long, chunk=4096):
+    """
+    start 以降で最初に take_profit か stop_loss に届いたティックの位置を返す (届かなければ -1)
+    少ない本数から順に広げながら配列演算で探す
+    """
+    n = len(prices)
+    while start < n:
+        end = min(start + chunk, n)
+        window = prices[start:end]
+        if is_long:
+            hit = np.flatnonzero((window >= take_profit) | (window <= stop_loss))
+        else:
+            hit = np.flatnonzero((window <= take_profit) | (window >= stop_loss))
+        if len(hit):
+            return start + int(hit[0])
+        start = end
+        chunk *= 2
+    return -1
+
+
+class TickBacktest:
+    """
+    エントリーはバーの確定時に戦略の関数で判定し、イグジットはティックで判定するバックテスト
+
+    trade_conditions_func は strategy.trade_logic_trend_reversal や
+    TriangleStrategy.trade_conditions_func など、step_backtest.trade_logic に渡すものと同じ関数。
+
+    - エントリー: 判定したバーの終了時刻以降の最初のティック（ロングは ask、ショートは bid）で約定
+    - イグジット: その後 take_profit / stop_loss を最初に越えたティック（ロングは bid、ショートは ask）で約定
+    ポジションを持っている間も指標を更新するため戦略の関数は毎バー呼ぶが、
+    終値でのイグジットが起きないように take_profit / stop_loss を外した portfolio を渡す。
+
+    関数はエントリーのときに portfolio の take_profit / stop_loss を設定すること。
+    strategy はイグジットを記録する戦略 (trade_results / init_conditions / pip_value を持つもの) で、
+    省略した場合は戦略のメソッドならそのオブジェクトを使う。
+    普通の関数で strategy が無い場合は pip_value を渡す。
+    """
+    def __init__(self, trade_conditions_func, bar_seconds=60, strategy=None, pip_value=None):
+        self.trade_conditions_func = trade_conditions_func
+        self.strategy = strategy if strategy is not None else getattr(trade_conditions_func, '__self__', None)
+        if pip_value is None:
+            pip_value = getattr(self.strategy, 'pip_value', None)
+        if pip_value is None:
+            raise ValueError("pip_value is required when trade_conditions_func is not a strategy method")
+        self.pip_value = pip_value
+        self.bar_seconds = bar_seconds
+        self.fills = []
+
+    def run(self, df, ticks):
+        """
+        df: ローソク足 ('time' はバーの開始時刻)
+        ticks: TICK_DTYPE の配列 (時刻順)
+
+        Returns:
+        - actions: 各バーのアクション ('entry_long' など、無ければ None)
+        - exit_pips: イグジットしたバーの獲得 pips (それ以外は 0)
+        """
+        df = df.reset_index(drop=True)
+        closes = df['close'].values
+        spreads = df['spread'].values
+        bar_starts = self._bar_seconds(df['time']) * 1000
+        bar_ends = bar_starts + self.bar_seconds * 1000
+        tick_times = ticks['time_msc']
+
+        actions = [None] * len(df)
+        exit_pips = [0] * len(df)
+        portfolio = Position()
+        exit_bar = -1
+        fill = None
+
+        for i in range(len(df)):
+            if portfolio['position'] is None:
+                action = self.trade_conditions_func(df, i, portfolio, closes, spreads)
+                if action not in ('entry_long', 'entry_short'):
+                    continue
+                if portfolio['take_profit'] is None or portfolio['stop_loss'] is None:
+                    raise ValueError(f"{action} at bar {i} did not set take_profit / stop_loss")
+
+                # TriangleStrategy のように position を設定しない関数もあるので、
+                # trade_logic / record_action と同じくエントリーのアクションから設定する
+                portfolio['position'] = 'long' if action == 'entry_long' else 'short'
+                fill = self._open(portfolio, ticks, np.searchsorted(tick_times, bar_ends[i], side='left'))
+                if fill is None:
+                    # ティックが無い期間はこれ以上判定できない
+                    portfolio.reset()
+                    break
+                actions[i] = action
+                exit_bar = self._exit_bar(fill, bar_starts, i)
+                continue
+
+            self.trade_conditions_func(df, i, self._hold(portfolio), closes, spreads)
+            if i == exit_bar:
+                actions[i] = 'exit_long' if portfolio['position'] == 'long' else 'exit_short'
+                exit_pips[i] = fill['gained_pips']
+                self._close(i, portfolio, fill)
+                portfolio.reset()
+
+        return actions, exit_pips
+
+    def _open(self, portfolio, ticks, start):
+        if start >= len(ticks):
+            return None
+
+        is_long = portfolio['position'] == 'long'
+        entry_price = ticks['ask'][start] if is_long else ticks['bid'][start]
+        exit_prices = ticks['bid'] if is_long else ticks['ask']
+
+        k = first_cross(exit_prices, start + 1, portfolio['take_profit'], portfolio['stop_loss'], is_long)
+        fill = {
+            'entry_time_msc': int(ticks['time_msc'][start]),
+            'entry_price': float(entry_price),
+            'exit_time_msc': None,
+            'exit_price': None,
+            'reason': None,
+            'gained_pips': 0,
+        }
+        if k >= 0:
+            exit_price = float(exit_prices[k])
+            move = exit_price - entry_price if is_long else entry_price - exit_price
+            reached_target = exit_price >= portfolio['take_profit'] if is_long else exit_price <= portfolio['take_profit']
+            fill.update({
+                'exit_time_msc': int(ticks['time_msc'][k]),
+                'exit_price': exit_price,
+                'reason': 'take_profit' if reached_target else 'stop_loss',
+                'gained_pips': float(move * (1 / self.pip_value)),
+            })
+        self.fills.append(fill)
+        return fill
+
+    def _exit_bar(self, fill, bar_starts, entry_bar):
+        if fill['exit_time_msc'] is None:
+            return -1
+        # バーが欠けている時間に約定した場合も、エントリーの次のバーより前にはしない
+        exit_bar = int(np.searchsorted(bar_starts, fill['exit_time_msc'], side='right')) - 1
+        return max(exit_bar, entry_bar + 1)
+
+    def _hold(self, portfolio):
+        held = portfolio.copy()
+        if portfolio['position'] == 'long':
+            held.take_profit, held.stop_loss = math.inf, -math.inf
+        else:
+            held.take_profit, held.stop_loss = -math.inf, math.inf
+        return held
+
+    def _close(self, i, portfolio, fill):
+        """
+        戦略の関数がイグジットしたときと同じ記録と状態のリセットを行う
+        """
+        st = self.strategy
+        if st is None:
+            return
+        if hasattr(st, 'trade_results'):
+            st.trade_results.append(
+                i, 'exit_long' if portfolio['position'] == 'long' else 'exit_short',
+                fill['entry_price'], portfolio['reversal_price'], portfolio['take_profit'], portfolio['stop_loss'],
+                fill['exit_price'], fill['gained_pips'])
+        if hasattr(st, 'init_conditions'):
+            st.conditions = st.init_conditions()
+
+    def _bar_seconds(self, times):
+        times = times.values
+        if times.dtype.kind in 'OUM':
+            return pd.to_datetime(times).values.astype('datetime64[s]').astype(np.int64)
+        return times.astype(np.int64)
@@ -1,7 +1,11 @@
-from scipy.signal import find_peaks
 import numpy as np
 from datetime import datetime
-import trendln
+from .trendlines import support_resistance
+
+try:
+    import trendln
+except ImportError:
+    trendln = None
 
 class TradingStrategy:
     """
@@ -30,12 +34,17 @@ class TradingStrategy:
     8. ストップロス
         エントリーポイントの直近の安値（極小値）よりも少し下の位置に、損切りのためのストップロス注文を設定（ストップ狩りを回避するため）
         上昇トレンドラインの起点となっている安値（極小値）のうち、最も近い極小値を直近安値と定義
+
+    fast=True の場合は trendln.calc_support_resistance の代わりに trendlines.support_resistance を使う
+    (find_peaks(distance=distance) の極値のうち直近 num 個に当てはめた直線だけを返す。trendln は不要)
     """
-    def __init__(self, allow_short=False, risk_reward_ratio=2.0):
+    def __init__(self, allow_short=False, risk_reward_ratio=2.0, fast=False, distance=5):
         self.last_pivots_high = []
         self.last_pivots_low = []
         self.allow_short = allow_short
         self.risk_reward_ratio = risk_reward_ratio
+        self.fast = fast
+        self.distance = distance
 
     def prepare_data(self, df):
         df["EMA50"] = df["5min_close"].ewm(span=50, adjust=False).mean()
@@ -72,7 +81,12 @@ class TradingStrategy:
         prices_low = df_last_n['5min_low'].values
 
         # Calculate support and resistance trendlines using trendln
-        (minimaIdxs, pmin, mintrend, minwindows), (maximaIdxs, pmax, maxtrend, maxwindows) = trendln.calc_support_resistance((prices_low, prices_high), accuracy=8)
+        if self.fast:
+            (minimaIdxs, pmin, mintrend, minwindows), (maximaIdxs, pmax, maxtrend, maxwindows) = support_resistance(prices_low, prices_high, distance=self.distance, num=num)
+        else:
+            if trendln is None:
+                raise ImportError("trendln is required unless fast=True")
+            (minimaIdxs, pmin, mintrend, minwindows), (maximaIdxs, pmax, maxtrend, maxwindows) = trendln.calc_support_resistance((prices_low, prices_high), accuracy=8)
 
         # Update the last pivots
         self.last_pivots_high = maximaIdxs
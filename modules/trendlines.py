@@ -0,0 +1,221 @@
+from collections import deque
+import numpy as np
+from .pivots import find_peaks
+
+
+def fit_line(xs, ys):
+    """
+    最小二乗法で直線を当てはめる (np.polyfit(xs, ys, 1) と同じ結果、誤差は丸め程度)
+    Returns: (slope, intercept)
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    x_mean = xs.mean()
+    y_mean = ys.mean()
+    dx = xs - x_mean
+    denominator = (dx * dx).sum()
+    slope = (dx * (ys - y_mean)).sum() / denominator if denominator else 0.0
+    return slope, y_mean - slope * x_mean
+
+
+class TrendLine:
+    """
+    slope * x + intercept の直線 (x はウィンドウ先頭からの位置)
+
+    slope * np.arange(length) + intercept の配列の代わりに使う。
+    trendline[-1] のように添字で読んだ位置だけを計算し、配列が必要な場合 (描画など) は np.asarray(trendline) で作る。
+    """
+    __slots__ = ('slope', 'intercept', 'length')
+
+    def __init__(self, slope, intercept, length):
+        self.slope = slope
+        self.intercept = intercept
+        self.length = length
+
+    def value_at(self, x):
+        return self.slope * x + self.intercept
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.slope * np.arange(self.length)[index] + self.intercept
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f"Trend line index out of range: {index}")
+        return self.value_at(index)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.slope * np.arange(self.length) + self.intercept
+        return values if dtype is None else values.astype(dtype)
+
+    def __repr__(self):
+        return f"TrendLine(slope={self.slope}, intercept={self.intercept}, length={self.length})"
+
+
+class RollingLineFit:
+    """
+    直近 size 個の極値 (バー位置, 価格) に当てはめた直線を、合計値を持ったまま更新する
+
+    - 極値の追加・削除は Σx, Σy, Σx², Σxy を足し引きするだけ (1点あたり O(1))
+    - sync() は検出済みの極値の並びと比べて、増えた・消えた極値の分だけ足し引きする
+    - line(origin) は origin を 0 とした位置での (slope, intercept) を返すので、配列を作らずに任意の位置の値が分かる
+
+    バー位置は絶対インデックスのままだと Σx² が大きくなり桁落ちするため、
+    基準の位置 (x0, y0) からの差で合計し、入れ替わりが多くなったら基準を取り直して丸め誤差も捨てる。
+    """
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"size must be positive: {size}")
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.points = deque()
+        self.x0 = 0
+        self.y0 = 0.0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.points)
+
+    def positions(self):
+        return [x for x, _ in self.points]
+
+    def push(self, x, y):
+        # 右端に極値を追加し、size を超えたら左端を外す
+        if not self.points:
+            self.x0, self.y0 = x, y
+        self.points.append((x, y))
+        self._add(x, y, 1)
+        if len(self.points) > self.size:
+            self.pop_left()
+
+    def pop(self):
+        x, y = self.points.pop()
+        self._add(x, y, -1)
+        return x, y
+
+    def push_left(self, x, y):
+        if not self.points:
+            self.x0, self.y0 = x, y
+        self.points.appendleft((x, y))
+        self._add(x, y, 1)
+
+    def pop_left(self):
+        x, y = self.points.popleft()
+        self._add(x, y, -1)
+        return x, y
+
+    def sync(self, positions, prices):
+        """
+        positions (昇順のバー位置) の最後の size 個に合わせる
+        prices は positions と同じ添字で価格を返す配列 (prices[k] が positions[k] の価格)
+        """
+        first = max(0, len(positions) - self.size)
+        target = [int(x) for x in positions[first:]]
+        if not target:
+            self.reset()
+            return
+        present = set(target)
+
+        # 右端で消えた極値 (間引きで消えたもの) と、ウィンドウ・size から外れた左端の極値を外す
+        while self.points and (self.points[-1][0] > target[-1] or self.points[-1][0] not in present):
+            self.pop()
+        while self.points and self.points[0][0] < target[0]:
+            self.pop_left()
+
+        # 残った極値が target の連続した並びでなければ (途中の極値が消えた場合) 作り直す
+        k = target.index(self.points[0][0]) if self.points and self.points[0][0] in present else 0
+        if [x for x, _ in self.points] != target[k:k + len(self.points)]:
+            self.reset()
+            k = 0
+
+        # 左側に空いた分と右側の新しい極値を足す
+        end = k + len(self.points)
+        for j in range(k - 1, -1, -1):
+            self.push_left(target[j], float(prices[first + j]))
+        for j in range(end, len(target)):
+            self.push(target[j], float(prices[first + j]))
+
+    def line(self, origin=0):
+        """
+        Returns: (slope, intercept) x は origin からの位置
+        """
+        n = len(self.points)
+        if n == 0:
+            raise IndexError("No points to fit the trend line")
+        self._rebase_if_needed()
+        mean_x = self.sum_x / n
+        mean_y = self.sum_y / n
+        variance = self.sum_xx - self.sum_x * mean_x
+        slope = (self.sum_xy - self.sum_x * mean_y) / variance if n > 1 and variance > 0 else 0.0
+        return slope, self.y0 + mean_y + slope * (origin - self.x0 - mean_x)
+
+    def value_at(self, x):
+        slope, intercept = self.line(x)
+        return intercept
+
+    def residuals(self):
+        """
+        当てはめた直線からの残差の二乗和
+        """
+        slope, intercept = self.line()
+        return sum((y - (slope * x + intercept)) ** 2 for x, y in self.points)
+
+    def _add(self, x, y, sign):
+        dx = x - self.x0
+        dy = y - self.y0
+        self.sum_x += sign * dx
+        self.sum_y += sign * dy
+        self.sum_xx += sign * dx * dx
+        self.sum_xy += sign * dx * dy
+        self.changes += 1
+
+    def _rebase_if_needed(self):
+        if self.changes <= 4 * self.size:
+            return
+        points = list(self.points)
+        self.reset()
+        for x, y in points:
+            self.push(x, y)
+        self.changes = 0
+
+
+def support_resistance(prices_low, prices_high, distance=5, num=2):
+    """
+    trendln.calc_support_resistance((prices_low, prices_high)) と同じ形の結果を返す高速版
+
+    極値は find_peaks(distance=distance) で求め、トレンドラインは直近 num 個の極値に当てはめた1本だけを返す。
+    trendln のように全ての極値の組み合わせからトレンドラインを探すことはしない。
+
+    Returns:
+        ((minimaIdxs, pmin, mintrend, minwindows), (maximaIdxs, pmax, maxtrend, maxwindows))
+        - pmin / pmax: 全ての極値に当てはめた直線の (slope, intercept)
+        - mintrend / maxtrend: [(極値の位置のリスト, (slope, intercept, 残差の二乗和, nan, nan, nan))]
+          (極値が2個未満の場合は空のリスト)
+        - minwindows / maxwindows: [[0]] (trendln の窓は1つだけとして扱う)
+    """
+    prices_low = np.asarray(prices_low, dtype=np.float64)
+    prices_high = np.asarray(prices_high, dtype=np.float64)
+    minima, _ = find_peaks(-prices_low, distance=distance)
+    maxima, _ = find_peaks(prices_high, distance=distance)
+    return _trend_result(minima, prices_low, num), _trend_result(maxima, prices_high, num)
+
+
+def _trend_result(idxs, prices, num):
+    if len(idxs) < 2:
+        return idxs, (np.nan, np.nan), [], []
+
+    overall = fit_line(idxs, prices[idxs])
+    fit = RollingLineFit(max(num, 2))
+    fit.sync(idxs, prices[idxs])
+    slope, intercept = fit.line()
+    trend = [(fit.positions(), (slope, intercept, fit.residuals(), np.nan, np.nan, np.nan))]
+    return idxs, overall, trend, [[0]]
@@ -0,0 +1,302 @@
+import numpy as np
+from .ledger import Position
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+ACTIONS = (None, 'entry_long', 'exit_long', 'entry_short', 'exit_short')
+NO_ACTION, ENTRY_LONG, EXIT_LONG, ENTRY_SHORT, EXIT_SHORT = range(len(ACTIONS))
+
+
+def _jit(func):
+    return njit(cache=True)(func) if NUMBA_AVAILABLE else func
+
+
+@_jit
+def find_peaks_distance(x, distance):
+    """
+    pivots.find_peaks(x, distance=distance) と同じ極大値を返す
+    同じ高さの極大値が distance 以内に並んだ場合は右側を優先する（pivots.find_peaks・PivotDetector と同じ）
+    """
+    n = len(x)
+    peaks = np.empty(n, dtype=np.int64)
+    count = 0
+    i = 1
+    while i < n - 1:
+        if x[i - 1] < x[i]:
+            ahead = i + 1
+            while ahead < n - 1 and x[ahead] == x[i]:
+                ahead += 1
+            if x[ahead] < x[i]:
+                peaks[count] = (i + ahead - 1) // 2
+                count += 1
+                i = ahead
+        i += 1
+    peaks = peaks[:count]
+
+    if distance <= 1 or count < 2:
+        return peaks
+
+    keep = np.ones(count, dtype=np.bool_)
+    order = np.argsort(x[peaks], kind='mergesort')
+    for k in range(count - 1, -1, -1):
+        j = order[k]
+        if not keep[j]:
+            continue
+        m = j - 1
+        while m >= 0 and peaks[j] - peaks[m] < distance:
+            keep[m] = False
+            m -= 1
+        m = j + 1
+        while m < count and peaks[m] - peaks[j] < distance:
+            keep[m] = False
+            m += 1
+    return peaks[keep]
+
+
+@_jit
+def horizontal_line_near(prices_high, prices_low, distance, threshold, close, entry_distance, aim_long):
+    """
+    detect_horizontal_lines と check_entry_condition_with_horizontal_line をまとめたもの
+    np.histogram(bins=極値の数) と同じビンの境界で数える
+    """
+    pivots_high = find_peaks_distance(prices_high, distance)
+    pivots_low = find_peaks_distance(-prices_low, distance)
+    size = len(pivots_high) + len(pivots_low)
+    if size == 0:
+        return False
+
+    values = np.empty(size)
+    values[:len(pivots_high)] = prices_high[pivots_high]
+    values[len(pivots_high):] = prices_low[pivots_low]
+
+    first_edge = values.min()
+    last_edge = values.max()
+    if first_edge == last_edge:
+        first_edge -= 0.5
+        last_edge += 0.5
+
+    # np.linspace(first_edge, last_edge, size + 1)
+    step = (last_edge - first_edge) / size
+    edges = np.empty(size + 1)
+    for k in range(size):
+        edges[k] = k * step + first_edge
+    edges[size] = last_edge
+
+    hist = np.zeros(size, dtype=np.int64)
+    for v in values:
+        k = np.searchsorted(edges, v, side='right') - 1
+        hist[min(k, size - 1)] += 1
+
+    for k in range(size):
+        if hist[k] >= threshold:
+            line = edges[k]
+            if aim_long and close <= line <= close + entry_distance:
+                return True
+            if not aim_long and close - entry_distance <= line <= close:
+                return True
+    return False
+
+
+@_jit
+def trend_line(prices_high, prices_low, distance, pivot_count, aim_long):
+    """
+    calculate_trend_line の最終バーでのトレンドラインの値を求める
+    Returns: (成立したか, トレンドラインの値, start_idx, end_idx, last_max_value, last_min_value)
+    """
+    pivots_high = find_peaks_distance(prices_high, distance)
+    pivots_low = find_peaks_distance(-prices_low, distance)
+
+    if aim_long:
+        if len(pivots_low) < 2 or prices_low[pivots_low[-1]] <= prices_low[pivots_low[-2]]:
+            return False, 0.0, 0, 0, 0.0, 0.0
+        prices = prices_low
+        x = pivots_low
+    else:
+        if len(pivots_high) < 2 or prices_high[pivots_high[-1]] >= prices_high[pivots_high[-2]]:
+            return False, 0.0, 0, 0, 0.0, 0.0
+        prices = prices_high
+        x = pivots_high
+
+    if len(pivots_high) == 0 or len(pivots_low) == 0 or len(x) < pivot_count:
+        raise IndexError("Not enough pivots to calculate the trend line")
+
+    # 直近 pivot_count 個の極値に最小二乗法で直線を当てはめる
+    xs = x[-pivot_count:].astype(np.float64)
+    ys = prices[x[-pivot_count:]]
+    x_mean = xs.mean()
+    y_mean = ys.mean()
+    slope = ((xs - x_mean) * (ys - y_mean)).sum() / ((xs - x_mean) ** 2).sum()
+    intercept = y_mean - slope * x_mean
+    value = slope * (len(prices) - 1) + intercept
+
+    return True, value, x[-pivot_count], x[-1], prices_high[pivots_high[-1]], prices_low[pivots_low[-1]]
+
+
+@_jit
+def candle_size_ok(opens, closes, i, aim_long):
+    current_body_size = abs(closes[i] - opens[i])
+    previous_body_size = abs(closes[i - 1] - opens[i - 1])
+    if aim_long:
+        return closes[i] > opens[i] and current_body_size > previous_body_size
+    return closes[i] < opens[i] and current_body_size > previous_body_size
+
+
+@_jit
+def triangle_kernel(opens, highs, lows, closes, spreads, pip_value, base_spread_pips,
+                    risk_reward_ratio, stop_loss_pips, df_sliced_period, distance, pivot_count,
+                    horizontal_distance, horizontal_threshold, entry_horizontal_distance,
+                    allow_long, allow_short, last_max_value, last_min_value):
+    """
+    TriangleStrategy.trade_conditions_func を全バーに対して実行する
+    (step_backtest.trade_logic と同じく、イグジットした次のバーからノーポジション)
+    """
+    n = len(closes)
+    actions = np.zeros(n, dtype=np.int8)
+    exit_pips = np.zeros(n)
+    trendline_starts = np.full(n, -1, dtype=np.int64)
+    trendline_ends = np.full(n, -1, dtype=np.int64)
+
+    position = NO_ACTION
+    entry_price = 0.0
+    take_profit = 0.0
+    stop_loss = 0.0
+
+    for i in range(n):
+        close = closes[i]
+        spread_pips = spreads[i] * pip_value
+
+        if base_spread_pips > 0 and spread_pips >= base_spread_pips * 2:
+            continue
+
+        # Exit
+        if position == ENTRY_LONG:
+            if close >= take_profit or close <= stop_loss:
+                exit_pips[i] = (close - entry_price) * (1 / pip_value) - spread_pips
+                actions[i] = EXIT_LONG
+                position = NO_ACTION
+            continue
+
+        if position == ENTRY_SHORT:
+            if close <= take_profit or close >= stop_loss:
+                exit_pips[i] = (entry_price - close) * (1 / pip_value) + spread_pips
+                actions[i] = EXIT_SHORT
+                position = NO_ACTION
+            continue
+
+        # Entry
+        start = max(0, i - df_sliced_period + 1)
+        if i - start < 1:
+            continue
+        window_highs = highs[start:i + 1]
+        window_lows = lows[start:i + 1]
+
+        for aim_long in (True, False):
+            if not horizontal_line_near(window_highs, window_lows, horizontal_distance, horizontal_threshold,
+                                        close, entry_horizontal_distance, aim_long):
+                continue
+
+            ok, value, start_idx, end_idx, max_value, min_value = trend_line(
+                window_highs, window_lows, distance, pivot_count, aim_long)
+            if ok:
+                last_max_value = max_value
+                last_min_value = min_value
+
+                if aim_long:
+                    entered = lows[i - 1] <= value and close > value and candle_size_ok(opens, closes, i, True)
+                else:
+                    entered = highs[i - 1] >= value and close < value and candle_size_ok(opens, closes, i, False)
+
+                if entered and aim_long and allow_long:
+                    position = ENTRY_LONG
+                    take_profit = close + (stop_loss_pips * risk_reward_ratio)
+                    stop_loss = last_min_value - stop_loss_pips
+                elif entered and not aim_long and allow_short:
+                    position = ENTRY_SHORT
+                    take_profit = close - (stop_loss_pips * risk_reward_ratio)
+                    stop_loss = last_max_value + stop_loss_pips
+
+                if position != NO_ACTION:
+                    entry_price = close
+                    actions[i] = position
+                    trendline_starts[i] = start_idx + start
+                    trendline_ends[i] = end_idx + start
+            # ロングの水平線条件が成立したバーではショートを判定しない
+            break
+
+    return actions, exit_pips, trendline_starts, trendline_ends, last_max_value, last_min_value
+
+
+class TriangleBacktest:
+    """
+    TriangleStrategy の全期間バックテスト
+
+    numba があれば極値検出・水平線のヒストグラム・トレンドラインの最小二乗法と
+    エントリー/イグジットの状態遷移をすべてコンパイル済みのカーネルで実行する。
+    numba が無い場合と、水平線を PriceLevelIndex で数える設定 (horizontal_bucket_pips) の場合は
+    trade_conditions_func を1本ずつ呼ぶ通常の経路で実行する。
+
+    同じ高さの極値が distance 以内に並んだ場合は右側を優先し、
+    トレンドラインは trendlines.fit_line と同じ最小二乗法の式で求める。
+    """
+    def __init__(self, strategy, use_numba=True):
+        self.strategy = strategy
+        self.use_numba = use_numba and NUMBA_AVAILABLE
+        self.trendline_starts = []
+        self.trendline_ends = []
+
+    def run(self, df):
+        """
+        Returns:
+        - actions: 各バーのアクション ('entry_long' など、無ければ None)
+        - exit_pips: イグジットしたバーの獲得 pips (それ以外は 0)
+        """
+        df = df.reset_index(drop=True)
+        if self.use_numba and not getattr(self.strategy, 'horizontal_bucket_pips', None):
+            return self._run_kernel(df)
+        return self._run_steps(df)
+
+    def _run_kernel(self, df):
+        st = self.strategy
+        actions, exit_pips, starts, ends, st.last_max_value, st.last_min_value = triangle_kernel(
+            df['open'].values.astype(np.float64),
+            df['high'].values.astype(np.float64),
+            df['low'].values.astype(np.float64),
+            df['close'].values.astype(np.float64),
+            df['spread'].values.astype(np.float64),
+            float(st.pip_value), float(st.base_spread_pips),
+            float(st.risk_reward_ratio), float(st.stop_loss_pips),
+            int(st.df_sliced_period), int(st.distance), int(st.pivot_count),
+            int(st.horizontal_distance), int(st.horizontal_threshold), float(st.entry_horizontal_distance),
+            bool(st.allow_long), bool(st.allow_short),
+            float(st.last_max_value), float(st.last_min_value),
+        )
+
+        entries = np.nonzero(starts >= 0)[0]
+        self.trendline_starts = starts[entries].tolist()
+        self.trendline_ends = ends[entries].tolist()
+        return [ACTIONS[a] for a in actions], exit_pips.tolist()
+
+    def _run_steps(self, df):
+        closes = df['close'].values
+        spreads = df['spread'].values
+        actions = [None] * len(df)
+        exit_pips = [0] * len(df)
+        portfolio = Position()
+
+        for i in range(len(df)):
+            action = self.strategy.trade_conditions_func(df, i, portfolio, closes, spreads)
+            actions[i] = action
+
+            if action in ('exit_long', 'exit_short'):
+                exit_pips[i] = portfolio['pips']
+                portfolio.reset()
+            elif action in ('entry_long', 'entry_short'):
+                portfolio['position'] = 'long' if action == 'entry_long' else 'short'
+                self.trendline_starts.append(portfolio['start_idx'])
+                self.trendline_ends.append(portfolio['end_idx'])
+
+        return actions, exit_pips
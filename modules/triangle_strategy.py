@@ -1,5 +1,8 @@
-from scipy.signal import find_peaks
 import numpy as np
+from .computation_cache import ComputationCache
+from .pivots import PivotDetector, find_peaks
+from .price_levels import PriceLevelIndex
+from .trendlines import RollingLineFit, TrendLine, fit_line
 
 class TriangleStrategy:
     """
@@ -52,6 +55,13 @@ class TriangleStrategy:
         horizontal_distance: 水平線を検出するための最低距離
         horizontal_threshold: 水平線を検出するための閾値
         entry_horizontal_distance: (エントリー条件における水平線の許容距離
+        horizontal_bucket_pips: 水平線を固定幅のビンで数える場合のビンの幅
+            (指定すると PriceLevelIndex で極値を1本ずつ出し入れする。None の場合は毎バーでヒストグラムを作り直す)
+        use_pivot_detector: トレンドラインの極値をストリーミングで検出し、直線の当てはめを RollingLineFit で差分更新する
+            (False の場合は毎バー find_peaks で極値を求め、直近 pivot_count 個に直線を当てはめ直す)
+
+    極値・水平線・トレンドラインは cache に入れ、同じバーの判定の中では1回だけ計算する (cache.stats() で確認できる)
+    トレンドラインは配列ではなく TrendLine (slope, intercept) で返し、判定に使う位置の値だけを計算する
     """
     def __init__(self, symbol, allow_long=True, allow_short=False, params=None):
         self.last_max_value = 0
@@ -71,60 +81,132 @@ class TriangleStrategy:
         self.horizontal_distance = 10
         self.horizontal_threshold = 4
         self.entry_horizontal_distance = 0.0003 # 1 pips(0.0001 ~ 0.0003?)
+        self.horizontal_bucket_pips = None
+        self.use_pivot_detector = False
 
         if params:
             for key, value in params.items():
                 setattr(self, key, value)
 
+        self.cache = ComputationCache()
+        self.window = None  # 判定中のウィンドウ (終わりのバー位置, 長さ)。None の間はキャッシュしない
+
+        self.level_index = None
+        if self.horizontal_bucket_pips:
+            self.level_index = PriceLevelIndex(self.horizontal_bucket_pips, self.horizontal_threshold,
+                                               self.df_sliced_period, self.horizontal_distance)
+        self.pivot_detector = None
+        self.trend_fits = None
+        if self.use_pivot_detector:
+            self.pivot_detector = PivotDetector(self.distance, self.df_sliced_period)
+            self.trend_fits = {aim: RollingLineFit(self.pivot_count) for aim in ("longEntry", "shortEntry")}
+        self.bar_count = 0
+
+    def cached(self, key, compute):
+        if self.window is None:
+            return compute()
+        return self.cache.get(key + self.window, compute)
+
+    def find_pivots(self, prices_high, prices_low, distance):
+        def compute():
+            if self.pivot_detector is not None and distance == self.distance and self.window is not None:
+                # update_indicators() で1本ずつ更新した極値 (ウィンドウ先頭からの位置)
+                return self.pivot_detector.pivots()
+            pivots_high, _ = find_peaks(prices_high, distance=distance)
+            pivots_low, _ = find_peaks(-prices_low, distance=distance)
+            return pivots_high, pivots_low
+        return self.cached(('pivots', distance), compute)
+
+    def update_indicators(self, df, i):
+        # 水平線のビン・トレンドラインの極値には全てのバー (保有中も) を1本ずつ追加する
+        # 1本ずつ追加できない場合はウィンドウと極値の確定に必要な分だけ読み直す
+        if i == self.bar_count:
+            start = i
+        else:
+            start = max(0, i - self.df_sliced_period + 1)
+            if self.level_index is not None:
+                start = max(0, start - 3 * self.horizontal_distance)
+                self.level_index.reset(start)
+            if self.pivot_detector is not None:
+                self.pivot_detector.reset(start)
+                for fit in self.trend_fits.values():
+                    fit.reset()
+
+        highs = df['high'].values
+        lows = df['low'].values
+        for j in range(start, i + 1):
+            if self.level_index is not None:
+                self.level_index.update(highs[j], lows[j])
+            if self.pivot_detector is not None:
+                self.pivot_detector.update(highs[j], lows[j])
+        self.bar_count = i + 1
+
     def detect_horizontal_lines(self, prices_high, prices_low):
-        try:
-            pivots_high, _ = find_peaks(prices_high, distance=self.horizontal_distance)
-            pivots_low, _ = find_peaks(-prices_low, distance=self.horizontal_distance)
-            
-            combined_pivots = np.concatenate([prices_high[pivots_high], prices_low[pivots_low]])
-            hist, bin_edges = np.histogram(combined_pivots, bins=len(combined_pivots))
-            horizontal_lines = bin_edges[:-1][hist >= self.horizontal_threshold]
-            return horizontal_lines
-        except Exception as e:
+        if self.level_index is not None:
+            return self.level_index.lines()
+        return self.cached(('horizontal_lines', self.horizontal_distance, self.horizontal_threshold),
+                           lambda: self._detect_horizontal_lines(prices_high, prices_low))
+
+    def _detect_horizontal_lines(self, prices_high, prices_low):
+        pivots_high, pivots_low = self.find_pivots(prices_high, prices_low, self.horizontal_distance)
+
+        combined_pivots = np.concatenate([prices_high[pivots_high], prices_low[pivots_low]])
+        if len(combined_pivots) == 0:
+            # np.histogram は bins=0 を受け付けない
             return []
+        hist, bin_edges = np.histogram(combined_pivots, bins=len(combined_pivots))
+        horizontal_lines = bin_edges[:-1][hist >= self.horizontal_threshold]
+        return horizontal_lines
 
     def calculate_trend_line(self, prices_high, prices_low, aim="longEntry"):
+        trendline, start_idx, end_idx, last_values = self.cached(
+            ('trend_line', aim, self.distance, self.pivot_count),
+            lambda: self._fit_trend_line(prices_high, prices_low, aim))
+        if last_values is not None:
+            self.last_max_value, self.last_min_value = last_values
+        return trendline, start_idx, end_idx
+
+    def _fit_trend_line(self, prices_high, prices_low, aim):
         # Find pivots for highs and lows
-        pivots_high, _ = find_peaks(prices_high, distance=self.distance)
-        pivots_low, _ = find_peaks(-prices_low, distance=self.distance)
+        pivots_high, pivots_low = self.find_pivots(prices_high, prices_low, self.distance)
 
         # For aim="longEntry", ensure that both the highs and lows are in an uptrend
         if aim == "longEntry":
             # if len(pivots_high) < 2 or prices_high[pivots_high[-1]] <= prices_high[pivots_high[-2]]:
             #     return None
             if len(pivots_low) < 2 or prices_low[pivots_low[-1]] <= prices_low[pivots_low[-2]]:
-                return None, None, None
+                return None, None, None, None
             prices = prices_low
             x = pivots_low
 
         # For aim="shortEntry", ensure that both the highs and lows are in a downtrend
         elif aim == "shortEntry":
             if len(pivots_high) < 2 or prices_high[pivots_high[-1]] >= prices_high[pivots_high[-2]]:
-                return None, None, None
+                return None, None, None, None
             # if len(pivots_low) < 2 or prices_low[pivots_low[-1]] >= prices_low[pivots_low[-2]]:
             #     return None
             prices = prices_high
             x = pivots_high
 
         # Update pivots
-        self.last_max_value = prices_high[pivots_high[-1]]
-        self.last_min_value = prices_low[pivots_low[-1]]
+        last_values = (prices_high[pivots_high[-1]], prices_low[pivots_low[-1]])
         
-        # Use the last pivots-count to calculate the support line
-        y = prices[x[-self.pivot_count:]]
-        slope, intercept = np.polyfit(x[-self.pivot_count:], y, 1)
-        trendline = slope * np.arange(len(prices)) + intercept
-
         # Determine the start and end indices for the trendline
         start_idx = x[-self.pivot_count]
         end_idx = x[-1]
 
-        return trendline, start_idx, end_idx
+        # Use the last pivots-count to calculate the support line
+        if self.trend_fits is not None:
+            # 前のバーから増えた・消えた極値だけを足し引きする (位置はウィンドウ先頭を 0 にする)
+            origin = self.pivot_detector.highs.start
+            fit = self.trend_fits[aim]
+            fit.sync(x + origin, prices[x])
+            slope, intercept = fit.line(origin)
+        else:
+            slope, intercept = fit_line(x[-self.pivot_count:], prices[x[-self.pivot_count:]])
+        trendline = TrendLine(slope, intercept, len(prices))
+
+        return trendline, start_idx, end_idx, last_values
     
     def determine_trend_direction(self, df, i, period=200):
         """
@@ -199,7 +281,10 @@ class TriangleStrategy:
     
     # The updated check_entry_condition_with_horizontal_line function
     def check_entry_condition_with_horizontal_line(self, closes, highs, lows, aim):
-        
+        if self.level_index is not None:
+            # ビンの索引から二分探索で探す
+            return self.level_index.near(closes[-1], self.entry_horizontal_distance, above=aim == "longEntry")
+
         # Detect horizontal lines
         horizontal_lines = self.detect_horizontal_lines(highs, lows)
         
@@ -226,6 +311,9 @@ class TriangleStrategy:
         close = closes[i]
         spread_pips = spreads[i] * self.pip_value
 
+        if self.level_index is not None or self.pivot_detector is not None:
+            self.update_indicators(df, i)
+
         if self.base_spread_pips > 0 and spread_pips >= self.base_spread_pips * 2:
             # print(f"Warning: Spread is unusually high at {df.iloc[i]['spread']}pips. Skipping trade at index {i}.")
             return None
@@ -260,24 +348,33 @@ class TriangleStrategy:
             # trend_direction = self.determine_trend_direction(df, i)
             # print(f'{i}: {trend_direction}')
 
-            if self.check_entry_condition_with_horizontal_line(closes_sliced, highs_sliced, lows_sliced, "longEntry"):
-                trendline, start_idx, end_idx = self.calculate_trend_line(highs_sliced, lows_sliced, "longEntry")
-                if self.check_entry_condition(opens_sliced, closes_sliced, highs_sliced, lows_sliced, trendline, "longEntry"):
-                    if self.allow_long:
-                        portfolio['take_profit'] = close + (self.stop_loss_pips * self.risk_reward_ratio)
-                        portfolio['stop_loss'] = self.last_min_value - self.stop_loss_pips
-                        portfolio['entry_price'] = close
-                        portfolio['start_idx'] = start_idx + index_offset
-                        portfolio['end_idx'] = end_idx + index_offset
-                        return 'entry_long'
-
-            elif self.check_entry_condition_with_horizontal_line(closes_sliced, highs_sliced, lows_sliced, "shortEntry"):
-                trendline, start_idx, end_idx = self.calculate_trend_line(highs_sliced, lows_sliced, "shortEntry")
-                if self.check_entry_condition(opens_sliced, closes_sliced, highs_sliced, lows_sliced, trendline, "shortEntry"):
-                    if self.allow_short:
-                        portfolio['take_profit'] = close - (self.stop_loss_pips * self.risk_reward_ratio)
-                        portfolio['stop_loss'] = self.last_max_value + self.stop_loss_pips
-                        portfolio['entry_price'] = close
-                        portfolio['start_idx'] = start_idx + index_offset
-                        portfolio['end_idx'] = end_idx + index_offset
-                        return 'entry_short'
\ No newline at end of file
+            # 同じバーの中で水平線・トレンドラインの計算を共有する
+            self.cache.bind(df)
+            self.window = (i, len(df_sliced))
+            try:
+                return self.entry_signal(portfolio, close, index_offset, opens_sliced, closes_sliced, highs_sliced, lows_sliced)
+            finally:
+                self.window = None
+
+    def entry_signal(self, portfolio, close, index_offset, opens_sliced, closes_sliced, highs_sliced, lows_sliced):
+        if self.check_entry_condition_with_horizontal_line(closes_sliced, highs_sliced, lows_sliced, "longEntry"):
+            trendline, start_idx, end_idx = self.calculate_trend_line(highs_sliced, lows_sliced, "longEntry")
+            if self.check_entry_condition(opens_sliced, closes_sliced, highs_sliced, lows_sliced, trendline, "longEntry"):
+                if self.allow_long:
+                    portfolio['take_profit'] = close + (self.stop_loss_pips * self.risk_reward_ratio)
+                    portfolio['stop_loss'] = self.last_min_value - self.stop_loss_pips
+                    portfolio['entry_price'] = close
+                    portfolio['start_idx'] = start_idx + index_offset
+                    portfolio['end_idx'] = end_idx + index_offset
+                    return 'entry_long'
+
+        elif self.check_entry_condition_with_horizontal_line(closes_sliced, highs_sliced, lows_sliced, "shortEntry"):
+            trendline, start_idx, end_idx = self.calculate_trend_line(highs_sliced, lows_sliced, "shortEntry")
+            if self.check_entry_condition(opens_sliced, closes_sliced, highs_sliced, lows_sliced, trendline, "shortEntry"):
+                if self.allow_short:
+                    portfolio['take_profit'] = close - (self.stop_loss_pips * self.risk_reward_ratio)
+                    portfolio['stop_loss'] = self.last_max_value + self.stop_loss_pips
+                    portfolio['entry_price'] = close
+                    portfolio['start_idx'] = start_idx + index_offset
+                    portfolio['end_idx'] = end_idx + index_offset
+                    return 'entry_short'
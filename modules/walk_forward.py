@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from .metrics import TradeMetrics
+from .parameter_sweep import STRATEGIES, SharedPriceData, _init_worker, _worker
+
+
+def walk_forward_windows(times, in_sample='90D', out_of_sample='30D', step=None):
+    """
+    インサンプル・アウトオブサンプルの期間をずらしながら並べる
+    times: バーの時刻 (昇順)
+    Returns: [(インサンプルの開始, 終了, アウトオブサンプルの開始, 終了)] バーの位置 (終了は含まない)
+    """
+    times = pd.to_datetime(pd.Series(times)).values
+    in_sample = pd.Timedelta(in_sample)
+    out_of_sample = pd.Timedelta(out_of_sample)
+    step = pd.Timedelta(step) if step is not None else out_of_sample
+
+    windows = []
+    start = pd.Timestamp(times[0])
+    while True:
+        bounds = np.searchsorted(times, [start, start + in_sample, start + in_sample + out_of_sample]).tolist()
+        if bounds[1] >= len(times):
+            break
+        windows.append((bounds[0], bounds[1], bounds[1], bounds[2]))
+        start += step
+    return windows
+
+
+def _run_trades(strategy_name, params):
+    backtest = STRATEGIES[strategy_name](params)
+    actions, exit_pips = backtest.run(_worker['df'])
+    metrics = TradeMetrics.from_actions(actions, exit_pips)
+    return {
+        'entry_index': metrics.entry_index,
+        'exit_index': metrics.exit_index,
+        'side': metrics.side,
+        'pips': metrics.pips,
+        'pip_value': backtest.strategy.pip_value,
+    }
+
+
+class WalkForward:
+    """
+    ウォークフォワード最適化
+
+    インサンプルの期間ごとに rank_by が最も良い設定を選び、その設定の次のアウトオブサンプルの期間の
+    トレードをつなげて1本の損益曲線にする。
+
+    各設定のバックテストは全期間に対して1回だけ (全コアで並列に) 実行し、期間ごとの成績は
+    その結果のトレードから計算する。重なり合う期間で指標や極値を計算し直さない。
+    cache_dir を指定すると、設定とデータごとのトレードを保存して次の実行で再利用する。
+
+    トレードはエントリーしたバーの期間に含める（インサンプルではその期間内にイグジットしたものだけ）。
+    """
+    def __init__(self, strategy_name, in_sample='90D', out_of_sample='30D', step=None,
+                 rank_by='profit_factor', min_trades=10, max_workers=None, cache_dir=None):
+        if strategy_name not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy_name}. Choose from {list(STRATEGIES)}")
+        self.strategy_name = strategy_name
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.step = step
+        self.rank_by = rank_by
+        self.min_trades = min_trades
+        self.max_workers = max_workers or os.cpu_count()
+        self.cache_dir = cache_dir
+
+    def run(self, df, settings):
+        """
+        Returns:
+        - windows: 期間ごとに選んだ設定とインサンプル・アウトオブサンプルの成績 (DataFrame)
+        - metrics: アウトオブサンプルのトレードをつなげた TradeMetrics (metrics.equity() が損益曲線)
+        """
+        df = df.reset_index(drop=True)
+        trades = self.backtest_all(df, settings)
+
+        rows = []
+        stitched = []
+        for is_start, is_end, oos_start, oos_end in walk_forward_windows(
+                df['time'], self.in_sample, self.out_of_sample, self.step):
+            best, best_score, in_sample_summary = None, None, None
+            for k, result in enumerate(trades):
+                if result is None:
+                    continue
+                summary = self._window_metrics(result, is_start, is_end, completed=True).summary()
+                if summary['total_trades'] < self.min_trades:
+                    continue
+                score = summary[self.rank_by]
+                if best_score is None or score > best_score:
+                    best, best_score, in_sample_summary = k, score, summary
+
+            row = {
+                'in_sample_start': df['time'].iloc[is_start],
+                'out_of_sample_start': df['time'].iloc[oos_start],
+                'out_of_sample_end': df['time'].iloc[oos_end - 1],
+                'setting': best,
+            }
+            if best is not None:
+                selected = self._window_indices(trades[best], oos_start, oos_end, completed=False)
+                stitched.append((trades[best], selected))
+                out_of_sample = self._window_metrics(trades[best], oos_start, oos_end, completed=False).summary()
+                row.update(settings[best])
+                row.update({f"is_{key}": value for key, value in in_sample_summary.items()})
+                row.update({f"oos_{key}": value for key, value in out_of_sample.items()})
+            rows.append(row)
+
+        return pd.DataFrame(rows), self._stitch(df, stitched)
+
+    def backtest_all(self, df, settings):
+        """
+        各設定のバックテストを全期間で1回ずつ実行し、トレードの配列を返す (失敗した設定は None)
+        """
+        results = [self._load(df, params) for params in settings]
+        pending = [k for k, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        data = SharedPriceData.create(df)
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(data.name, data.layout)) as executor:
+                futures = {executor.submit(_run_trades, self.strategy_name, settings[k]): k for k in pending}
+                for future in as_completed(futures):
+                    k = futures[future]
+                    try:
+                        results[k] = future.result()
+                    except Exception as e:
+                        print(f"Setting {k} failed: {e}")
+                        continue
+                    self._save(df, settings[k], results[k])
+        finally:
+            data.close()
+        return results
+
+    def _window_indices(self, trades, start, end, completed):
+        entry_index = trades['entry_index']
+        lo, hi = np.searchsorted(entry_index, [start, end])
+        selected = np.arange(lo, hi)
+        if completed:
+            selected = selected[trades['exit_index'][selected] < end]
+        return selected
+
+    def _window_metrics(self, trades, start, end, completed):
+        selected = self._window_indices(trades, start, end, completed)
+        return TradeMetrics(trades['entry_index'][selected], trades['exit_index'][selected],
+                            trades['side'][selected], np.full(len(selected), np.nan), trades['pips'][selected],
+                            pip_value=trades['pip_value'])
+
+    def _stitch(self, df, stitched):
+        columns = {key: [] for key in ('entry_index', 'exit_index', 'side', 'pips')}
+        last_exit = -1
+        pip_value = 0.01
+        for trades, selected in stitched:
+            # 前の期間の設定のトレードを保有している間のエントリーは取らない
+            selected = selected[trades['entry_index'][selected] > last_exit]
+            if len(selected) == 0:
+                continue
+            for key in columns:
+                columns[key].append(trades[key][selected])
+            last_exit = trades['exit_index'][selected[-1]]
+            pip_value = trades['pip_value']
+
+        arrays = {key: np.concatenate(values) if values else np.zeros(0) for key, values in columns.items()}
+        entry_price = df['close'].values[arrays['entry_index'].astype(np.int64)]
+        return TradeMetrics(arrays['entry_index'], arrays['exit_index'], arrays['side'], entry_price,
+                            arrays['pips'], df, pip_value=pip_value)
+
+    def _cache_path(self, df, params):
+        if self.cache_dir is None:
+            return None
+        closes = df['close'].values
+        key = json.dumps({
+            'strategy': self.strategy_name,
+            'params': params,
+            'bars': len(df),
+            'first': str(df['time'].iloc[0]),
+            'last': str(df['time'].iloc[-1]),
+            'close_sum': float(closes.sum()),
+        }, sort_keys=True, default=str)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest()[:16] + '.npz')
+
+    def _load(self, df, params):
+        path = self._cache_path(df, params)
+        if path is None or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            trades = {key: data[key] for key in data.files}
+        trades['pip_value'] = float(trades['pip_value'])
+        return trades
+
+    def _save(self, df, params, trades):
+        path = self._cache_path(df, params)
+        if path is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(path + '.tmp.npz', **trades)
+        os.replace(path + '.tmp.npz', path)
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'trade'), os.path.join(ROOT, 'back-test')]
+
+
+def bars(n, seed=0, decimals=3):
+    """
+    USDJPY の1分足に似せたランダムウォーク (back-test/benchmark.py の make_bars と同じ作り方)
+    decimals を小さくすると同じ高さの極値が増える
+    """
+    rng = np.random.default_rng(seed)
+    vol = 0.01
+    closes = 150 + np.cumsum(rng.normal(0, vol, n) + 0.3 * vol * np.sin(np.arange(n) / 300))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + np.abs(rng.normal(0, vol / 2, n))
+    lows = np.minimum(opens, closes) - np.abs(rng.normal(0, vol / 2, n))
+    return pd.DataFrame({
+        'time': pd.date_range('2022-08-01', periods=n, freq='min'),
+        'open': opens.round(decimals),
+        'high': highs.round(decimals),
+        'low': lows.round(decimals),
+        'close': closes.round(decimals),
+        'tick_volume': rng.integers(10, 200, n),
+        'spread': rng.integers(0, 5, n),
+        'real_volume': 0,
+    })
+
+
+@pytest.fixture
+def make_bars():
+    return bars
+
+
+SETTINGS_REVERSAL = {
+    'symbol': 'USDJPY',
+    'risk_reward_ratio': 1.0,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 500,
+    'distance': 7,
+    'candle_size_pips': 0.02,
+}
+
+
+@pytest.fixture
+def replay(monkeypatch):
+    """
+    SimulatedTerminal 上で LiveEngine を最後の足まで動かす
+
+    replay({symbol: df}, settings) -> (terminal, engine, signals)
+    signals: {symbol: [(判定した足の確定時刻, シグナル)]} (シグナルが None の足は除く)
+    """
+    def run(frames, settings, bar_count=500):
+        from modules import SimulatedTerminal
+        terminal = SimulatedTerminal()
+        for symbol, df in frames.items():
+            terminal.add_symbol(symbol, df)
+        monkeypatch.setitem(sys.modules, 'MetaTrader5', terminal)
+        import trading
+        monkeypatch.setattr(trading, 'mt5', terminal)
+        from engine import LiveEngine
+
+        start = max(int(info.times[bar_count]) for info in terminal.symbols.values())
+        terminal.clock.set(start)
+        terminal.initialize()
+        engine = LiveEngine(terminal, settings, bar_count=bar_count, clock=terminal.clock, report_interval=1e9)
+
+        signals = {runner.symbol: [] for runner in engine.runners}
+        for runner in engine.runners:
+            def step(bar_close, runner=runner, step=runner.step):
+                signal = step(bar_close)
+                if signal is not None:
+                    signals[runner.symbol].append((int(bar_close), signal))
+                return signal
+            runner.step = step
+
+        engine.run(until=terminal.end_time())
+        return terminal, engine, signals
+    return run
@@ -0,0 +1,103 @@
+import numpy as np
+
+from modules import BarFeed, FakeRateSource, SimulatedTerminal
+
+
+def test_closed_frame_exposes_a_bar_only_after_its_close(make_bars):
+    df = make_bars(100)
+    terminal = SimulatedTerminal().add_symbol('USDJPY', df)
+    times = terminal.symbols['USDJPY'].times
+    terminal.initialize()
+    feed = BarFeed(terminal, 'USDJPY', terminal.TIMEFRAME_M1, capacity=20)
+
+    # 50本目の足が始まって30秒後: 50本目は形成中
+    terminal.clock.set(int(times[50]) + 30)
+    feed.poll()
+    assert feed.arrays()['time'][-1].astype(int) == times[50]
+    assert feed.closed_arrays()['time'][-1].astype(int) == times[49]
+    assert len(feed.closed_frame()) == len(feed) - 1
+
+    # 50本目が確定した直後: 51本目が形成中になり、50本目が確定した足として見える
+    terminal.clock.set(int(times[51]) + 0.5)
+    feed.poll()
+    closed = feed.closed_frame()
+    assert closed['time'].values[-1].astype('datetime64[s]').astype(int) == times[50]
+    assert closed['close'].values[-1] == df['close'].values[50]
+
+
+def source_and_feed(make_bars, n=400, now=100, capacity=50, fetch_count=10):
+    source = FakeRateSource.from_dataframe(make_bars(n), now=now)
+    feed = BarFeed(source, 'USDJPY', 1, capacity=capacity, fetch_count=fetch_count)
+    assert feed.poll() == capacity
+    return source, feed
+
+
+def assert_buffer_matches_source(feed, source):
+    # バッファは取得できる最後の capacity 本 (最後は形成中の足) と同じ
+    expected = source.rates[max(source.now - feed.capacity, 0):source.now]
+    arrays = feed.arrays()
+    assert len(feed) == len(expected)
+    for col in expected.dtype.names:
+        values = arrays[col].astype(np.int64) if col == 'time' else arrays[col]
+        np.testing.assert_array_equal(values, expected[col], err_msg=col)
+
+
+def test_poll_appends_new_bars_across_buffer_wraps(make_bars):
+    source, feed = source_and_feed(make_bars)
+    source.requests.clear()
+    # capacity の数倍進めて、配列の後半から先頭への詰め直しも通す
+    for _ in range(200):
+        source.advance()
+        assert feed.poll() == 1
+        assert_buffer_matches_source(feed, source)
+    assert feed.gaps == []
+    assert set(source.requests) == {feed.fetch_count}
+
+
+def test_poll_overwrites_the_forming_bar(make_bars):
+    source, feed = source_and_feed(make_bars)
+    source.rates['close'][source.now - 1] += 0.5
+    assert feed.poll() == 0
+    assert feed.arrays()['close'][-1] == source.rates['close'][source.now - 1]
+    assert_buffer_matches_source(feed, source)
+
+
+def test_poll_backfills_the_bars_missed_while_disconnected(make_bars):
+    source, feed = source_and_feed(make_bars)
+    last_time = feed.last_time
+
+    source.connected = False
+    source.advance(35)  # fetch_count より多く進める
+    assert feed.poll() is None
+    assert feed.last_time == last_time
+
+    source.connected = True
+    source.requests.clear()
+    assert feed.poll() == 35
+    # fetch_count で届かなかったので、前回の最後のバーまで届くように広げて取り直している
+    assert source.requests == [10, 40]
+    assert feed.gaps == [(last_time, int(source.rates['time'][source.now - 35]), 35)]
+    assert_buffer_matches_source(feed, source)
+
+    # 補完した後は普段どおり fetch_count だけ取得する
+    source.advance()
+    source.requests.clear()
+    assert feed.poll() == 1
+    assert source.requests == [10]
+    assert len(feed.gaps) == 1
+    assert_buffer_matches_source(feed, source)
+
+
+def test_poll_refetches_the_buffer_after_a_disconnect_longer_than_capacity(make_bars):
+    source, feed = source_and_feed(make_bars)
+    last_time = feed.last_time
+
+    source.connected = False
+    source.advance(120)
+    assert feed.poll() is None
+
+    source.connected = True
+    assert feed.poll() == feed.capacity
+    assert feed.gaps == [(last_time, int(source.rates['time'][source.now - feed.capacity]), feed.capacity)]
+    assert_buffer_matches_source(feed, source)
+    assert feed.closed_arrays()['time'][-1].astype(np.int64) == source.rates['time'][source.now - 2]
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules import BarStore
+import modules.bar_store as bar_store
+
+
+def test_write_merges_and_overwrites_bars_of_the_same_time(tmp_path, make_bars):
+    store = BarStore(str(tmp_path))
+    df = make_bars(300)
+    store.write('USDJPY', 1, df.iloc[:200])
+    update = df.iloc[150:].copy()
+    update['close'] += 1.0
+    store.write('USDJPY', 1, update)
+
+    loaded = store.load('USDJPY', 1)
+    assert len(loaded) == 300
+    np.testing.assert_array_equal(loaded['close'].values[:150], df['close'].values[:150])
+    np.testing.assert_array_equal(loaded['close'].values[150:], update['close'].values)
+    assert store.partitions('USDJPY', 1) == ['2022-08']
+
+
+def test_interrupted_write_keeps_the_previous_partition(tmp_path, make_bars, monkeypatch):
+    store = BarStore(str(tmp_path))
+    df = make_bars(300)
+    store.write('USDJPY', 1, df.iloc[:200])
+
+    # 3列目を書いている途中で止まる
+    save = np.save
+    calls = []
+
+    def failing_save(f, values):
+        calls.append(1)
+        if len(calls) == 3:
+            raise OSError("disk full")
+        save(f, values)
+
+    monkeypatch.setattr(bar_store.np, 'save', failing_save)
+    with pytest.raises(OSError):
+        store.write('USDJPY', 1, df)
+    monkeypatch.undo()
+
+    # 書きかけの列は見えず、前回の200本がそのまま読める
+    assert store.partitions('USDJPY', 1) == ['2022-08']
+    loaded = store.load('USDJPY', 1)
+    assert len(loaded) == 200
+    np.testing.assert_array_equal(loaded['close'].values, df['close'].values[:200])
+
+    # 次の書き込みで一時ディレクトリは片付く
+    store.write('USDJPY', 1, df)
+    assert len(store.load('USDJPY', 1)) == 300
+    assert os.listdir(store.symbol_dir('USDJPY', 1)) == ['2022-08']
+
+
+def test_partition_left_as_old_during_the_swap_is_still_readable(tmp_path, make_bars):
+    store = BarStore(str(tmp_path))
+    df = make_bars(200)
+    store.write('USDJPY', 1, df)
+    path = os.path.join(store.symbol_dir('USDJPY', 1), '2022-08')
+    os.rename(path, path + bar_store.OLD_SUFFIX)
+
+    assert store.partitions('USDJPY', 1) == ['2022-08']
+    assert len(store.load('USDJPY', 1)) == 200
+    assert store.last_time('USDJPY', 1) == int(df['time'].values[-1].astype('datetime64[s]').astype(np.int64))
+
+    store.write('USDJPY', 1, make_bars(250).iloc[200:])
+    assert len(store.load('USDJPY', 1)) == 250
+    assert os.listdir(store.symbol_dir('USDJPY', 1)) == ['2022-08']
+
+
+def test_partition_with_mismatched_column_lengths_raises(tmp_path, make_bars):
+    store = BarStore(str(tmp_path))
+    store.write('USDJPY', 1, make_bars(200))
+    path = os.path.join(store.symbol_dir('USDJPY', 1), '2022-08', 'close.npy')
+    np.save(path, np.zeros(150))
+
+    with pytest.raises(ValueError, match='column lengths'):
+        store.load('USDJPY', 1)
@@ -0,0 +1,16 @@
+from conftest import SETTINGS_REVERSAL
+
+
+def test_engine_places_orders_for_every_symbol(make_bars, replay, capsys):
+    frames = {'USDJPY': make_bars(1500, 1), 'EURJPY': make_bars(1500, 3)}
+    settings = [dict(SETTINGS_REVERSAL, symbol=symbol) for symbol in frames]
+
+    terminal, engine, signals = replay(frames, settings)
+    capsys.readouterr()
+
+    # 確定した足で判定していれば、どの通貨ペアもエントリーする
+    for symbol in frames:
+        assert any(signal.startswith('entry') for _, signal in signals[symbol]), symbol
+    deals = terminal.deals_frame()
+    assert set(deals['symbol']) == set(frames)
+    assert engine.gateway.stats()['sent'] >= 2
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'back-test'))
+from benchmark import measure_startup  # noqa: E402
+
+# ライブ取引のプロセスが最初の判定を終えるまでの秒数の上限
+STARTUP_BUDGET = 1.0
+# ライブ取引では使わない重いライブラリ・サブモジュール
+HEAVY_MODULES = ['scipy', 'numba', 'matplotlib', 'trendln',
+                 'modules.triangle_backtest', 'modules.parameter_sweep', 'modules.walk_forward']
+
+
+def loaded_modules(code):
+    script = f"import sys\n{code}\nprint(' '.join(sorted(sys.modules)))"
+    process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=ROOT, check=True)
+    return set(process.stdout.split())
+
+
+def test_import_modules_loads_no_submodules():
+    loaded = loaded_modules("import modules")
+    assert not {'numpy', 'pandas', 'scipy', 'numba'} & loaded
+    assert not [name for name in loaded if name.startswith('modules.')]
+
+
+def test_live_names_load_only_what_they_need():
+    loaded = loaded_modules("from modules import TradingStrategy, BarFeed, BarCloseScheduler, Instrumentation, "
+                            "OrderGateway, TerminalCache, Position")
+    assert not set(HEAVY_MODULES) & loaded
+
+
+def test_startup_to_first_evaluation_is_within_budget():
+    startup = measure_startup(repeat=3)
+    assert startup['heavy_modules'] == []
+    assert startup['min_seconds'] < STARTUP_BUDGET
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import ta
+
+from modules import EMA, WindowEMA, RollingMean, ATR, RSI
+
+
+@pytest.fixture
+def df(make_bars):
+    return make_bars(600, 2)
+
+
+def stream(indicator, rows):
+    return np.array([indicator.update(*row) for row in rows], dtype=float)
+
+
+def checkpointed(make, rows, split):
+    """
+    split 本で get_state() を JSON にして保存し、新しいインスタンスに set_state() して続きを計算する
+    """
+    first = make()
+    values = [first.update(*row) for row in rows[:split]]
+    second = make()
+    second.set_state(json.loads(json.dumps(first.get_state())))
+    values += [second.update(*row) for row in rows[split:]]
+    return np.array(values, dtype=float)
+
+
+def assert_same(actual, expected):
+    np.testing.assert_allclose(actual, np.asarray(expected, dtype=float), rtol=1e-10, atol=1e-10)
+
+
+def cases(df):
+    closes = df['close'].values
+    highs = df['high'].values
+    lows = df['low'].values
+    bodies = np.abs(closes - df['open'].values)
+    close_rows = [(x,) for x in closes]
+
+    window_ema = [pd.Series(closes[max(0, i - 49):i + 1]).ewm(span=100, adjust=False).mean().iloc[-1]
+                  for i in range(len(closes))]
+    return {
+        'EMA': (lambda: EMA(span=100), close_rows,
+                df['close'].ewm(span=100, adjust=False).mean(), lambda ind: ind.compute(closes)),
+        'WindowEMA': (lambda: WindowEMA(span=100, window=50), close_rows,
+                      window_ema, lambda ind: ind.compute(closes)),
+        'RollingMean': (lambda: RollingMean(20), [(x,) for x in bodies],
+                        pd.Series(bodies).rolling(20).mean(), lambda ind: ind.compute(bodies)),
+        'ATR': (lambda: ATR(14), list(zip(highs, lows, closes)),
+                ta.volatility.AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range(),
+                lambda ind: ind.compute(highs, lows, closes)),
+        'RSI': (lambda: RSI(14), close_rows,
+                ta.momentum.RSIIndicator(df['close'], window=14).rsi(), lambda ind: ind.compute(closes)),
+    }
+
+
+@pytest.mark.parametrize('name', ['EMA', 'WindowEMA', 'RollingMean', 'ATR', 'RSI'])
+def test_update_matches_pandas_and_ta(df, name):
+    make, rows, expected, _ = cases(df)[name]
+    assert_same(stream(make(), rows), expected)
+
+
+@pytest.mark.parametrize('name', ['EMA', 'WindowEMA', 'RollingMean', 'ATR', 'RSI'])
+def test_compute_matches_pandas_and_ta(df, name):
+    make, _, expected, compute = cases(df)[name]
+    assert_same(compute(make()), expected)
+
+
+@pytest.mark.parametrize('name', ['EMA', 'WindowEMA', 'RollingMean', 'ATR', 'RSI'])
+@pytest.mark.parametrize('split', [5, 300])
+def test_state_round_trip(df, name, split):
+    make, rows, _, _ = cases(df)[name]
+    assert_same(checkpointed(make, rows, split), stream(make(), rows))
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from modules import TradeMetrics
+
+
+def trade_metrics(df=None):
+    # 2回のトレード (long で +5 pips、short で -3 pips)
+    return TradeMetrics([10, 40], [20, 60], [1, -1], [100.0, 100.2], [5.0, -3.0], df)
+
+
+def test_breakdowns_count_trades_by_entry_time(make_bars):
+    # 2022-08-01 (月) 0:00 から1分足なので、どちらも月曜の0時台のエントリー
+    metrics = trade_metrics(make_bars(100))
+
+    by_hour = metrics.by_hour()
+    assert list(by_hour.index) == list(range(24))
+    assert by_hour.loc[0, 'trades'] == 2
+    assert by_hour.loc[0, 'total_pips'] == pytest.approx(2.0)
+    assert by_hour.loc[0, 'win_rate'] == pytest.approx(0.5)
+    assert by_hour['trades'].iloc[1:].sum() == 0
+    assert np.isnan(by_hour['win_rate'].iloc[1:]).all()
+
+    by_weekday = metrics.by_weekday()
+    assert by_weekday.loc['Mon', 'trades'] == 2
+    assert by_weekday['trades'].sum() == 2
+
+
+@pytest.mark.parametrize('method', ['by_hour', 'by_weekday'])
+def test_breakdowns_without_times_raise_value_error(make_bars, method):
+    for df in (None, make_bars(100).drop(columns='time')):
+        metrics = trade_metrics(df)
+        with pytest.raises(ValueError, match='time'):
+            getattr(metrics, method)()
+        # 時刻を使わない指標はそのまま計算できる
+        assert metrics.summary()['total_trades'] == 2
@@ -0,0 +1,22 @@
+from conftest import SETTINGS_REVERSAL
+from modules import TradingStrategy, TrendReversalBacktest
+
+
+def test_replay_matches_backtest(make_bars, replay, capsys):
+    df = make_bars(2000, 1)
+    terminal, engine, signals = replay({'USDJPY': df}, [SETTINGS_REVERSAL])
+    capsys.readouterr()
+
+    # 足 k の確定 (times[k] + 60) で判定したシグナルは、バックテストの k 本目のアクションと同じになる
+    times = terminal.symbols['USDJPY'].times
+    actions, _ = TrendReversalBacktest(TradingStrategy(params=SETTINGS_REVERSAL)).run(df)
+    expected = [(int(times[i]) + 60, action) for i, action in enumerate(actions)
+                if action is not None and i >= 499]
+
+    assert len(expected) >= 4
+    assert signals['USDJPY'] == expected
+
+    # エントリーはすべて約定している
+    deals = terminal.deals_frame()
+    entries = deals[deals['entry'] == terminal.DEAL_ENTRY_IN]
+    assert len(entries) == sum(action.startswith('entry') for _, action in expected)
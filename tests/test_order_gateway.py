@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+
+from modules import FakeBroker, OrderGateway
+import modules.order_gateway as order_gateway
+from modules.order_gateway import (TRADE_RETCODE_CONNECTION, TRADE_RETCODE_DONE, TRADE_RETCODE_ERROR,
+                                   TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_REQUOTE)
+
+
+def buy_request(price=150.003, deviation=0):
+    return {'action': FakeBroker.TRADE_ACTION_DEAL, 'symbol': 'USDJPY', 'volume': 0.1,
+            'type': FakeBroker.ORDER_TYPE_BUY, 'price': price, 'deviation': deviation}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # 送り直す前の待ち時間を記録する (実際には待たない)
+    waited = []
+    monkeypatch.setattr(order_gateway.time, 'sleep', waited.append)
+    return waited
+
+
+@pytest.fixture
+def gateway_for():
+    gateways = []
+
+    def make(broker, **kwargs):
+        gateway = OrderGateway(broker, **kwargs)
+        gateways.append(gateway)
+        return gateway
+    yield make
+    for gateway in gateways:
+        gateway.close(timeout=5)
+
+
+def test_retryable_retcodes_are_retried_with_backoff(gateway_for, sleeps):
+    broker = FakeBroker(retcodes=[TRADE_RETCODE_REQUOTE, TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_CONNECTION])
+    gateway = gateway_for(broker, max_retries=3, backoff=0.05, max_backoff=0.15)
+
+    ticket = gateway.submit(buy_request(), client_id='signal-1')
+    assert ticket.wait(5).retcode == TRADE_RETCODE_DONE
+    assert ticket.ok
+    assert ticket.attempts == 4
+    assert len(broker.requests) == 4
+    assert sleeps == [0.05, 0.1, 0.15]  # 倍にしながら max_backoff まで
+    assert gateway.stats()['sent'] == 4
+    assert gateway.stats()['retries'] == 3
+    assert gateway.stats()['failed'] == 0
+    assert len(broker.positions) == 1
+
+
+def test_none_result_is_retried(gateway_for, sleeps):
+    broker = FakeBroker(retcodes=[None, None])
+    gateway = gateway_for(broker, max_retries=3, backoff=0.01)
+
+    ticket = gateway.submit(buy_request())
+    ticket.wait(5)
+    assert ticket.ok
+    assert ticket.attempts == 3
+    assert ticket.error is None
+    assert len(broker.requests) == 3
+
+
+def test_retries_stop_at_max_retries(gateway_for, sleeps):
+    broker = FakeBroker(retcodes=[None] * 10)
+    gateway = gateway_for(broker, max_retries=2, backoff=0.01)
+
+    ticket = gateway.submit(buy_request())
+    assert ticket.wait(5) is None
+    assert not ticket.ok
+    assert ticket.attempts == 3
+    assert ticket.error == (-10004, 'No IPC connection')
+    assert len(broker.requests) == 3
+    assert gateway.stats()['failed'] == 1
+    assert broker.positions == {}
+
+
+def test_non_retryable_retcode_is_sent_once(gateway_for, sleeps):
+    broker = FakeBroker(retcodes=[TRADE_RETCODE_ERROR])
+    gateway = gateway_for(broker)
+
+    ticket = gateway.submit(buy_request())
+    assert ticket.wait(5).retcode == TRADE_RETCODE_ERROR
+    assert ticket.attempts == 1
+    assert sleeps == []
+    assert gateway.stats()['failed'] == 1
+
+
+def test_requote_is_retried_at_the_latest_price(gateway_for, sleeps):
+    broker = FakeBroker()
+    broker.set_price('USDJPY', 150.010, 150.013)
+    gateway = gateway_for(broker, backoff=0.01)
+
+    ticket = gateway.submit(buy_request(price=150.003))
+    ticket.wait(5)
+    assert ticket.ok
+    assert [request['price'] for request in broker.requests] == [150.003, 150.013]
+
+
+def test_duplicate_client_id_is_sent_once(gateway_for):
+    broker = FakeBroker(latency=0.05)
+    gateway = gateway_for(broker)
+
+    # 送信中と送信後のどちらで同じ client_id を渡しても送らない
+    first = gateway.submit(buy_request(), client_id='USDJPY-2022-08-01T00:10')
+    assert gateway.submit(buy_request(), client_id='USDJPY-2022-08-01T00:10') is first
+    gateway.drain()
+    assert gateway.submit(buy_request(), client_id='USDJPY-2022-08-01T00:10') is first
+    other = gateway.submit(buy_request(), client_id='USDJPY-2022-08-01T00:11')
+    gateway.drain()
+
+    assert first.ok and other.ok
+    assert len(broker.requests) == 2
+    assert len(broker.positions) == 2
+    assert gateway.stats()['duplicates'] == 2
+
+
+def test_duplicates_from_many_threads_are_sent_once(gateway_for):
+    broker = FakeBroker()
+    gateway = gateway_for(broker)
+
+    tickets = []
+    threads = [threading.Thread(target=lambda: tickets.append(gateway.submit(buy_request(), client_id='same')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gateway.drain()
+
+    assert len({id(ticket) for ticket in tickets}) == 1
+    assert len(broker.requests) == 1
+    assert gateway.stats()['duplicates'] == 7
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from modules.pivots import PeakTracker, find_peaks
+from modules.triangle_backtest import find_peaks_distance
+
+
+def tracker_peaks(x, distance):
+    tracker = PeakTracker(distance)
+    for value in x:
+        tracker.update(value)
+    return tracker.peaks()
+
+
+def test_equal_peaks_keep_the_right_one():
+    x = np.array([0, 1, 0, 1, 0, 1, 0, 0, 0, 2, 0, 2, 0], dtype=float)
+    # 左側を優先すると [1, 5, 9] になる
+    expected = [1, 5, 11]
+    assert find_peaks(x, distance=3)[0].tolist() == expected
+    assert find_peaks_distance(x, 3).tolist() == expected
+    assert tracker_peaks(x, 3).tolist() == expected
+
+
+@pytest.mark.parametrize('decimals', [0, 1, 2])
+def test_kernel_step_and_streaming_pivots_agree_with_ties(decimals):
+    # 丸めて同じ高さの極値を多くしたランダムウォーク
+    rng = np.random.default_rng(decimals)
+    for _ in range(300):
+        x = np.round(np.cumsum(rng.normal(0, 1, rng.integers(5, 300))) / 10, decimals)
+        distance = int(rng.integers(1, 20))
+        peaks, _ = find_peaks(x, distance=distance)
+        assert find_peaks_distance(x, distance).tolist() == peaks.tolist()
+        assert tracker_peaks(x, distance).tolist() == peaks.tolist()
+
+
+def test_matches_scipy_without_ties():
+    from scipy.signal import find_peaks as scipy_find_peaks
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.normal(0, 1, 2000))
+    for distance in (1, 2.5, 5, 15, 60):
+        for kwargs in ({}, {'height': 0}, {'prominence': 1}):
+            peaks, properties = find_peaks(x, distance=distance, **kwargs)
+            expected, expected_properties = scipy_find_peaks(x, distance=distance, **kwargs)
+            assert peaks.tolist() == expected.tolist()
+            assert properties.keys() == expected_properties.keys()
+            for key in properties:
+                np.testing.assert_array_equal(properties[key], expected_properties[key])
+
+
+def test_does_not_import_private_scipy_modules():
+    import inspect
+    from modules import pivots
+    assert '_peak_finding_utils' not in inspect.getsource(pivots)
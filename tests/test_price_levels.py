@@ -0,0 +1,62 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from modules import TriangleStrategy
+from modules.features import confirmed_pivots
+
+from test_triangle_backtest import SETTINGS_TRIANGLE
+
+SETTINGS_LEVELS = dict(SETTINGS_TRIANGLE, horizontal_bucket_pips=0.02)
+
+
+def brute_force_lines(strategy, i, confirmed):
+    """
+    i 本目までに確定し、直近 df_sliced_period 本に入っている極値を数え直した水平線
+    """
+    index = strategy.level_index
+    counts = Counter()
+    for positions, prices in confirmed:
+        in_window = (positions + strategy.horizontal_distance <= i) & (positions > i - strategy.df_sliced_period)
+        counts.update(index.bucket_of(price) for price in prices[positions[in_window]])
+    return np.array(sorted(b for b, count in counts.items() if count >= strategy.horizontal_threshold)) * index.bucket
+
+
+def brute_force_near(lines, price, distance, above):
+    low, high = (price, price + distance) if above else (price - distance, price)
+    return bool(((lines >= low) & (lines <= high)).any())
+
+
+def bar_sequence(n):
+    # 1本ずつ進める区間と、前後に飛んで reset(start) から読み直す区間
+    steps = list(range(0, 700))
+    steps += [1100, 1101, 1102, 900, 901, 1500, 20, 21, 22]
+    steps += list(range(1200, 1600))
+    steps += [n - 1, 0, 5, 3]
+    return steps
+
+
+@pytest.mark.parametrize('decimals', [3, 2])
+def test_level_index_matches_brute_force_counts(make_bars, decimals):
+    df = make_bars(2000, 4, decimals)
+    highs = df['high'].values
+    lows = df['low'].values
+    strategy = TriangleStrategy('USDJPY', True, True, SETTINGS_LEVELS)
+    distance = strategy.horizontal_distance
+    confirmed = [(confirmed_pivots(highs, distance)[1], highs), (confirmed_pivots(-lows, distance)[1], lows)]
+
+    levels_seen = near_seen = 0
+    for i in bar_sequence(len(df)):
+        strategy.update_indicators(df, i)
+        lines = strategy.level_index.lines()
+        np.testing.assert_allclose(lines, brute_force_lines(strategy, i, confirmed), err_msg=str(i))
+        levels_seen += len(lines)
+
+        close = df['close'].values[i]
+        for above in (True, False):
+            near = strategy.level_index.near(close, strategy.entry_horizontal_distance, above)
+            assert near == brute_force_near(lines, close, strategy.entry_horizontal_distance, above), (i, above)
+            near_seen += near
+    assert levels_seen > 100
+    assert near_seen > 10
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import MultiTimeframeResampler
+
+
+def bars_with_gaps(make_bars, n=3000, seed=0):
+    # ランダムに1分足を抜く (上位足の最後の1分足が欠けた区間も含む)
+    df = make_bars(n, seed)
+    rng = np.random.default_rng(seed)
+    df = df[rng.random(n) > 0.1].reset_index(drop=True)
+    times = df['time'].values.astype('datetime64[s]').astype(np.int64)
+    return df, times
+
+
+def compute(resampler, df, times):
+    return resampler.compute(times, df['open'].values, df['high'].values, df['low'].values,
+                             df['close'].values, df['tick_volume'].values)
+
+
+def test_update_matches_compute_row_by_row(make_bars):
+    df, times = bars_with_gaps(make_bars)
+    resampler = MultiTimeframeResampler()
+    expected = compute(resampler, df, times)
+
+    live = MultiTimeframeResampler()
+    rows = df[['open', 'high', 'low', 'close', 'tick_volume']].values
+    for i, (open_, high, low, close, volume) in enumerate(rows):
+        row = live.update(int(times[i]), open_, high, low, close, int(volume))
+        assert row.keys() == expected.keys()
+        for key, value in row.items():
+            assert value == expected[key][i], (i, key)
+
+
+@pytest.mark.parametrize('prefix, rule', [('5min_', '5min'), ('15min_', '15min'), ('1h_', '1h')])
+def test_closed_rows_match_pandas_resample(make_bars, prefix, rule):
+    df, times = bars_with_gaps(make_bars)
+    result = compute(MultiTimeframeResampler(), df, times)
+
+    resampled = df.set_index('time').resample(rule).agg({
+        'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'tick_volume': 'sum'})
+    closed = ~result[f"{prefix}partial"]
+    assert closed.sum() >= 10
+    # 最後の1分足が欠けた区間は確定しない
+    assert closed.sum() < len(resampled)
+
+    expected = resampled.loc[result[f"{prefix}time"][closed]]
+    for col in ['open', 'high', 'low', 'close', 'tick_volume']:
+        np.testing.assert_array_equal(result[f"{prefix}{col}"][closed], expected[col].values, err_msg=col)
+
+    # 確定した行は区切りの直前の1分足だけ
+    ends = times[closed] + 60
+    assert (ends % int(pd.Timedelta(rule).total_seconds()) == 0).all()
+
+
+@pytest.mark.parametrize('end', [1, 137, 1000, 2001])
+def test_compute_does_not_look_ahead(make_bars, end):
+    # 後の1分足を足しても、それまでの行は変わらない
+    df, times = bars_with_gaps(make_bars)
+    full = compute(MultiTimeframeResampler(), df, times)
+    head = compute(MultiTimeframeResampler(), df.iloc[:end], times[:end])
+    for key, values in head.items():
+        np.testing.assert_array_equal(values, full[key][:end], err_msg=key)
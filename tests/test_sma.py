@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from modules import Position
+from modules.pivots import find_peaks
+
+from sma import TradingStrategy
+
+PIVOT_COLUMNS = ['maxima', 'minima', 'maxima_ffill', 'minima_ffill', 'maxima_linear', 'minima_linear']
+DISTANCE = 5  # prepare_features の distance_threshold
+
+
+def test_features_are_rebuilt_for_another_df(make_bars):
+    strategy = TradingStrategy()
+    first = make_bars(1500, 0)
+    second = make_bars(2500, 1)
+
+    strategy.trade_conditions_ema(first, 100, Position())
+    features = strategy.features
+    strategy.trade_conditions_volume(first, 200, Position())
+    assert strategy.features is features  # 同じ df なら計算し直さない
+
+    # 長い df の最後のバーも読め、値は2つ目の df のもの
+    for func in (strategy.trade_conditions_ema, strategy.trade_conditions_volume):
+        func(second, len(second) - 1, Position())
+    np.testing.assert_array_equal(strategy.features['close'], second['close'].values)
+
+    # 期間を切り出した df も別のデータとして扱う
+    window = second.iloc[1000:2000]
+    strategy.trade_conditions_ema(window, 10, Position())
+    np.testing.assert_array_equal(strategy.features['close'], window['close'].values)
+
+
+def test_pivot_columns_are_filled_distance_bars_after_the_pivot(make_bars):
+    df = make_bars(1500, 2)
+    closes = df['close'].values
+    features = TradingStrategy().prepare_features(df)
+
+    marked = np.flatnonzero(~np.isnan(features['maxima']))
+    assert len(marked) >= 20
+    for t in marked:
+        # t - distance 本目の極値を、t 本目までの直近 3 * distance 本 (PeakTracker の窓) で極値と分かってから記録する
+        assert features['maxima'][t] == closes[t - DISTANCE]
+        start = max(0, t + 1 - 3 * DISTANCE)
+        assert t - DISTANCE - start in find_peaks(closes[start:t + 1], distance=DISTANCE)[0]
+
+    marked = np.flatnonzero(~np.isnan(features['minima']))
+    assert len(marked) >= 20
+    np.testing.assert_array_equal(features['minima'][marked], closes[marked - DISTANCE])
+
+
+@pytest.mark.parametrize('end', [200, 777, 1200])
+def test_pivot_columns_do_not_look_ahead(make_bars, end):
+    # 後のバーを足しても、それまでの行は変わらない
+    df = make_bars(1500, 2)
+    full = TradingStrategy().prepare_features(df)
+    head = TradingStrategy().prepare_features(df.iloc[:end])
+    for name in PIVOT_COLUMNS:
+        np.testing.assert_array_equal(head[name], full[name][:end], err_msg=name)
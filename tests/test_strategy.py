@@ -0,0 +1,23 @@
+from conftest import SETTINGS_REVERSAL
+from modules import TradingStrategy, Position
+
+
+def test_update_indicators_is_incremental_on_a_rolling_window(make_bars):
+    # ライブと同じく、毎回作り直した直近 500 本の df の最後の足で判定する
+    df = make_bars(800, 1)
+    strategy = TradingStrategy(params=SETTINGS_REVERSAL)
+    resets = []
+    reset = strategy.pivot_detector.reset
+    strategy.pivot_detector.reset = lambda start=0: (resets.append(start), reset(start))
+
+    for end in range(500, 800):
+        window = df.iloc[end - 500:end].reset_index(drop=True)
+        strategy.trade_logic_trend_reversal(window, len(window) - 1, Position(),
+                                            window['close'].values, window['spread'].values)
+        fresh = TradingStrategy(params=SETTINGS_REVERSAL)
+        fresh.update_indicators(window, len(window) - 1)
+        assert [p.tolist() for p in strategy.pivot_detector.pivots()] == \
+               [p.tolist() for p in fresh.pivot_detector.pivots()]
+        assert abs(strategy.ema100.value - fresh.ema100.value) < 1e-9
+
+    assert len(resets) == 1
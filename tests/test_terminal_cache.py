@@ -0,0 +1,126 @@
+import sys
+import threading
+
+import pytest
+
+from modules import FakeBroker, OrderGateway, TerminalCache
+import modules.terminal_cache as terminal_cache
+
+from conftest import SETTINGS_REVERSAL
+
+
+def buy_request(broker):
+    bid, ask = broker.prices['USDJPY']
+    return {'action': broker.TRADE_ACTION_DEAL, 'symbol': 'USDJPY', 'volume': 0.1,
+            'type': broker.ORDER_TYPE_BUY, 'price': ask, 'deviation': 0, 'magic': 7}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(terminal_cache.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def broker_and_cache():
+    broker = FakeBroker()
+    lock = threading.Lock()
+    cache = TerminalCache(broker, lock, symbols=['USDJPY'], positions_max_age=60)
+    gateway = OrderGateway(broker, lock)
+    yield broker, cache, gateway
+    gateway.close(timeout=5)
+
+
+def test_position_opened_through_the_gateway_is_read_after_invalidate(broker_and_cache):
+    broker, cache, gateway = broker_and_cache
+    assert cache.refresh()
+    assert cache.positions(symbol='USDJPY') == []
+
+    # invalidate() しないうちは、取得済みのスナップショット (max_age 以内) を返す
+    gateway.submit(buy_request(broker)).wait(5)
+    assert len(broker.positions) == 1
+    assert cache.positions(symbol='USDJPY') == []
+
+    # エンジンと同じく、送信が終わったら invalidate() する
+    ticket = gateway.submit(buy_request(broker), callback=lambda ticket: cache.invalidate())
+    ticket.wait(5)
+    gateway.drain()
+    misses = cache.misses
+    positions = cache.positions(symbol='USDJPY')
+    assert cache.misses == misses + 1
+    assert sorted(p.ticket for p in positions) == sorted(broker.positions)
+    assert cache.position(positions[0].ticket) is broker.positions[positions[0].ticket]
+    assert [p.ticket for p in cache.positions(magic=7)] == [p.ticket for p in positions]
+
+    # 次からはキャッシュから返す
+    hits = cache.hits
+    assert len(cache.positions(symbol='USDJPY')) == 2
+    assert cache.hits == hits + 1
+
+
+def test_positions_and_ticks_are_fetched_again_after_max_age(clock):
+    broker = FakeBroker()
+    cache = TerminalCache(broker, symbols=['USDJPY'], tick_max_age=1.0, positions_max_age=5.0)
+    cache.refresh()
+    tick = cache.tick('USDJPY')
+
+    broker.set_price('USDJPY', 151.000, 151.003)
+    broker.positions[1] = type('P', (), {'ticket': 1, 'symbol': 'USDJPY', 'magic': 0})()
+    clock.now += 0.9
+    assert cache.tick('USDJPY') is tick
+    assert cache.positions() == []
+
+    clock.now += 0.2
+    assert cache.tick('USDJPY').bid == 151.000
+    assert cache.positions() == []  # ポジションはまだ max_age 以内
+
+    clock.now += 4.0
+    assert [p.ticket for p in cache.positions()] == [1]
+
+
+def test_invalidate_while_fetching_fetches_again(clock):
+    broker = FakeBroker()
+    cache = TerminalCache(broker, symbols=['USDJPY'])
+    positions_get = broker.positions_get
+
+    def positions_get_then_order(*args, **kwargs):
+        # 取得している間に別のスレッドが発注して invalidate() した
+        positions = positions_get(*args, **kwargs)
+        broker.positions[1] = type('P', (), {'ticket': 1, 'symbol': 'USDJPY', 'magic': 0})()
+        cache.invalidate()
+        return positions
+
+    broker.positions_get = positions_get_then_order
+    assert cache.positions() == []
+    broker.positions_get = positions_get
+    assert [p.ticket for p in cache.positions()] == [1]
+
+
+def test_trading_reads_positions_through_the_cache(monkeypatch, broker_and_cache):
+    broker, cache, _ = broker_and_cache
+    monkeypatch.setitem(sys.modules, 'MetaTrader5', broker)
+    import trading
+    monkeypatch.setattr(trading, 'mt5', broker)
+
+    trader = trading.Trading(params=SETTINGS_REVERSAL, cache=cache)
+    cache.refresh()
+    assert trader.get_position() is None
+
+    bid, ask = broker.prices['USDJPY']
+    assert trader.place_order('USDJPY', broker.ORDER_TYPE_BUY, 0.01, ask, bid - 0.1, ask + 0.1) is not None
+    position = trader.get_position()
+    assert position is not None
+    assert position['id'] in broker.positions
+
+    assert trader.close_position(position['id']) is not None
+    assert broker.positions == {}
+    assert trader.get_position() is None
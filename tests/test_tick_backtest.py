@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from modules import TICK_DTYPE, MultiStrategyBacktest, TickBacktest, TradingStrategy, TriangleStrategy
+
+from conftest import SETTINGS_REVERSAL
+from test_triangle_backtest import SETTINGS_TRIANGLE
+
+
+def ticks_at_closes(df):
+    """
+    バーごとに2ティック: バーの開始時刻に前のバーの終値、終了の1秒前にそのバーの終値 (ask == bid)
+    バーの確定後の最初のティックが終値なので、ティックでの約定がバーの終値での判定と同じになる
+    """
+    starts = df['time'].values.astype('datetime64[ms]').astype(np.int64)
+    closes = df['close'].values
+    ticks = np.empty(2 * len(df), dtype=TICK_DTYPE)
+    ticks['time_msc'][0::2] = starts
+    ticks['time_msc'][1::2] = starts + 59_000
+    ticks['bid'][0::2] = np.r_[closes[0], closes[:-1]]
+    ticks['bid'][1::2] = closes
+    ticks['ask'] = ticks['bid']
+    return ticks
+
+
+def bar_actions(func, df):
+    """
+    バーの終値で判定するバックテストの [(バーの位置, アクション)] と TradeLedger
+    """
+    backtest = MultiStrategyBacktest()
+    backtest.add(func, 'bar')
+    ledger = backtest.run(df)['bar']
+    return list(zip(ledger['index'].tolist(), ledger.actions().tolist())), ledger
+
+
+STRATEGIES = {
+    'triangle': lambda: TriangleStrategy('USDJPY', True, True, SETTINGS_TRIANGLE).trade_conditions_func,
+    'trend_reversal': lambda: TradingStrategy(params=SETTINGS_REVERSAL).trade_logic_trend_reversal,
+}
+
+
+@pytest.mark.parametrize('name', list(STRATEGIES))
+def test_ticks_at_bar_closes_match_the_bar_backtest(make_bars, name):
+    df = make_bars(3000, 1)
+    df['spread'] = 0  # ティックも ask == bid
+    expected, ledger = bar_actions(STRATEGIES[name](), df)
+
+    actions, exit_pips = TickBacktest(STRATEGIES[name]()).run(df, ticks_at_closes(df))
+    got = [(i, action) for i, action in enumerate(actions) if action is not None]
+
+    assert sum(action.startswith('exit') for _, action in expected) >= 5
+    assert got == expected
+    exits = ledger.exits()
+    np.testing.assert_allclose(np.asarray(exit_pips)[exits['index']], exits['gained_pips'])
+
+
+def test_fills_follow_the_entry_side(make_bars):
+    df = make_bars(3000, 1)
+    df['spread'] = 0
+    backtest = TickBacktest(STRATEGIES['triangle']())
+    actions, _ = backtest.run(df, ticks_at_closes(df))
+
+    assert {'entry_long', 'entry_short'} <= set(actions)
+    for fill in backtest.fills:
+        if fill['reason'] == 'take_profit':
+            assert fill['gained_pips'] > 0
+        elif fill['reason'] == 'stop_loss':
+            assert fill['gained_pips'] < 0
+
+
+def test_plain_function_takes_the_strategy_explicitly(make_bars):
+    df = make_bars(3000, 1)
+    df['spread'] = 0
+    strategy = TradingStrategy(params=SETTINGS_REVERSAL)
+
+    def func(df, i, portfolio, closes, spreads):
+        return strategy.trade_logic_trend_reversal(df, i, portfolio, closes, spreads)
+
+    with pytest.raises(ValueError, match='pip_value'):
+        TickBacktest(func)
+
+    # イグジットを戦略に記録させると、メソッドを渡した場合と同じになる
+    actions, _ = TickBacktest(func, strategy=strategy).run(df, ticks_at_closes(df))
+    expected, _ = bar_actions(STRATEGIES['trend_reversal'](), df)
+    assert [(i, a) for i, a in enumerate(actions) if a is not None] == expected
+
+    # 記録する戦略が無い関数 (TriangleStrategy と同じくイグジットで状態を持たないもの) は pip_value だけで良い
+    triangle = STRATEGIES['triangle']()
+    actions, _ = TickBacktest(lambda *args: triangle(*args), pip_value=0.01).run(df, ticks_at_closes(df))
+    expected, _ = bar_actions(STRATEGIES['triangle'](), df)
+    assert [(i, a) for i, a in enumerate(actions) if a is not None] == expected
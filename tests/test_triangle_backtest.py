@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from modules import TriangleBacktest, TriangleStrategy
+
+SETTINGS_TRIANGLE = {
+    'risk_reward_ratio': 1.3,
+    'take_profit_pips': 0.15,
+    'stop_loss_pips': 0.10,
+    'base_spread_pips': 0.03,
+    'df_sliced_period': 200,
+    'distance': 5,
+    'pivot_count': 2,
+    'horizontal_distance': 8,
+    'horizontal_threshold': 2,
+    'entry_horizontal_distance': 0.05,
+}
+
+
+@pytest.mark.parametrize('use_pivot_detector', [False, True])
+@pytest.mark.parametrize('decimals', [3, 2])
+def test_step_mode_matches_kernel_with_equal_pivots(make_bars, decimals, use_pivot_detector):
+    # 小数点以下を丸めたデータは同じ高さの極値が多い
+    df = make_bars(3000, 1, decimals)
+    step = TriangleStrategy('USDJPY', True, True, dict(SETTINGS_TRIANGLE, use_pivot_detector=use_pivot_detector))
+    step_backtest = TriangleBacktest(step, use_numba=False)
+    step_actions, step_pips = step_backtest.run(df)
+
+    kernel = TriangleStrategy('USDJPY', True, True, SETTINGS_TRIANGLE)
+    kernel_backtest = TriangleBacktest(kernel)
+    kernel_actions, kernel_pips = kernel_backtest.run(df)
+
+    assert sum(action is not None for action in step_actions) >= 10
+    assert step_actions == kernel_actions
+    np.testing.assert_allclose(step_pips, kernel_pips)
+    assert step_backtest.trendline_starts == kernel_backtest.trendline_starts
+    assert step_backtest.trendline_ends == kernel_backtest.trendline_ends
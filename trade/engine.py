@@ -0,0 +1,235 @@
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from trading import Trading
+from modules import BarFeed, BarCloseScheduler, Instrumentation, OrderGateway, TerminalCache
+
+
+class LockedSource:
+    """
+    1つの MT5 接続を複数のスレッドから使うため、呼び出しをロックで1本ずつにする
+    ロックの待ち時間と copy_rates_from_pos 自体の時間は別々に記録する
+    """
+    def __init__(self, mt5, lock, instrumentation):
+        self.mt5 = mt5
+        self.lock = lock
+        self.instrumentation = instrumentation
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        start = time.perf_counter()
+        with self.lock:
+            acquired = time.perf_counter()
+            rates = self.mt5.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+            done = time.perf_counter()
+        self.instrumentation.record('mt5_lock_wait', acquired - start)
+        self.instrumentation.record('copy_rates_from_pos', done - acquired)
+        return rates
+
+    def last_error(self):
+        with self.lock:
+            return self.mt5.last_error()
+
+
+class SymbolRunner:
+    """
+    1つの通貨ペア・戦略の設定ごとのバー取得・判定・発注とポートフォリオ
+    """
+    def __init__(self, mt5, lock, params, timeframe, instrumentation, gateway, cache, bar_count=500, lot=0.01,
+                 clock=time):
+        self.mt5 = mt5
+        self.clock = clock
+        self.lock = lock
+        self.gateway = gateway
+        self.cache = cache
+        self.instrumentation = instrumentation
+        self.params = params
+        self.symbol = params['symbol']
+        self.lot = lot
+
+        self.trading = Trading(params=params, cache=cache)
+        # 確定した足を bar_count 本判定に使えるよう、形成中の足の分を1本多く持つ
+        self.feed = BarFeed(LockedSource(mt5, lock, instrumentation), self.symbol, timeframe, capacity=bar_count + 1)
+        self.portfolio = self.trading.init_portfolio()
+
+        # 判定のうち指標の更新にかかった時間
+        if hasattr(self.trading.strategy, 'update_indicators'):
+            instrumentation.wrap(self.trading.strategy, 'update_indicators', 'features')
+
+        self.running = False
+        self.skipped = 0  # 前の足の処理が終わっていなかったので飛ばした回数
+        self.latency = deque(maxlen=1000)  # 足の確定から判定・発注が終わるまでの秒数
+
+    def step(self, bar_close):
+        ins = self.instrumentation
+        try:
+            with ins.iteration('step'):
+                gap_count = len(self.feed.gaps)
+                with ins.timer('fetch'):
+                    polled = self.feed.poll()
+                if polled is None:
+                    ins.count('fetch_errors')
+                    print(f"{self.symbol}: Error in copy_rates_from_pos(), error code =", self.feed.source.last_error())
+                    return None
+
+                for last_time, first_time, bars in self.feed.gaps[gap_count:]:
+                    ins.count('gaps')
+                    print(f"{self.symbol}: Backfilled {bars} bars after a gap: {pd.to_datetime(last_time, unit='s')} -> {pd.to_datetime(first_time, unit='s')}")
+
+                with ins.timer('frame'):
+                    # 起きた時点の最後の行は始まったばかりの足なので、確定した直前の足までで判定する
+                    df = self.feed.closed_frame()
+                with ins.timer('signal'):
+                    signal = self.trading.trade_conditions(df, len(df)-1, self.portfolio)
+                with ins.timer('dispatch'):
+                    self.dispatch(signal)
+
+            self.latency.append(self.clock.time() - bar_close)
+            ins.record('bar_close_to_done', self.latency[-1])
+            print(f'{self.symbol} signal: {signal} (+{self.latency[-1] * 1000:.0f}ms after bar close)')
+            return signal
+
+        except Exception as e:
+            print(f"{self.symbol}: An error occurred:", str(e))
+            traceback.print_exc()
+            return None
+
+        finally:
+            self.running = False
+
+    def dispatch(self, signal):
+        mt5 = self.mt5
+
+        if self.portfolio['position'] == 'long' and signal == 'exit_long':
+            self.portfolio.reset()
+
+        elif self.portfolio['position'] == 'short' and signal == 'exit_short':
+            self.portfolio.reset()
+
+        elif signal in ('entry_long', 'entry_short'):
+            ins = self.instrumentation
+            ins.count(signal)
+            # 足ごとにまとめて取得したティック (古すぎる場合は取得し直す)
+            tick = self.cache.tick(self.symbol)
+            if tick is None:
+                ins.count('orders_failed')
+                print(f"{self.symbol}: symbol_info_tick failed, error code =", self.feed.source.last_error())
+                return None
+
+            request = self.trading.order_request(
+                        self.symbol,
+                        mt5.ORDER_TYPE_BUY if signal == 'entry_long' else mt5.ORDER_TYPE_SELL,
+                        self.lot,
+                        tick.ask if signal == 'entry_long' else tick.bid,
+                        self.portfolio['stop_loss'],
+                        self.portfolio['take_profit'])
+            # 送信は gateway のスレッドに任せて判定のループは待たない
+            # 同じ足の同じシグナルは2回発注しない
+            client_id = f"{self.symbol}:{self.feed.arrays()['time'][-1]}:{signal}"
+            return self.gateway.submit(request, client_id, callback=self.on_order_done)
+
+    def on_order_done(self, ticket):
+        self.cache.invalidate()
+        if ticket.ok:
+            print(f"{self.symbol}: order placed ({ticket.client_id}, {ticket.attempts} attempts, "
+                  f"{ticket.latency * 1000:.0f}ms)")
+        else:
+            print(f"{self.symbol}: order_send failed ({ticket.client_id}), result={ticket.result}, error={ticket.error}")
+
+
+class LiveEngine:
+    """
+    複数の通貨ペア・戦略の設定を1つのプロセスで動かす
+
+    MT5 への接続は1つを共有し、MT5 の呼び出しはロックで1本ずつにする。
+    足が確定するたびに各設定の処理（バー取得・判定・発注）をスレッドプールに投げ、
+    前の足の処理が終わっていない設定は待たずに飛ばすので、遅い設定が他の設定を遅らせない。
+
+    発注は OrderGateway のスレッドから送り、判定のループは応答を待たない。
+    ティックとポジションは足ごとに TerminalCache でまとめて取得し、各設定はそれを使う。
+
+    取得・指標・判定・発注の各区間の時間は instrumentation に記録し、report_interval 秒ごとに表示する。
+    profile_threshold (秒) を指定すると、それより遅かった処理のスタックをサンプリングして表示する。
+
+    clock は time() と sleep() を持つもの (既定は time モジュール)。
+    SimulatedTerminal の clock を渡すと、足の確定を待たずに過去のデータで同じ処理を動かせる。
+    """
+    def __init__(self, mt5, settings, timeframe_name='M1', bar_count=500, lot=0.01,
+                 wakeup_offset=0.5, max_workers=None, report_interval=600, profile_threshold=None,
+                 tick_max_age=1.0, clock=None):
+        self.mt5 = mt5
+        self.clock = clock or time
+        self.lock = threading.Lock()
+        self.instrumentation = Instrumentation(report_interval=report_interval, profile_threshold=profile_threshold)
+        self.gateway = OrderGateway(mt5, self.lock, instrumentation=self.instrumentation)
+        self.cache = TerminalCache(mt5, self.lock, symbols=[params['symbol'] for params in settings],
+                                   tick_max_age=tick_max_age, instrumentation=self.instrumentation)
+        timeframe = getattr(mt5, f'TIMEFRAME_{timeframe_name}')
+        self.runners = [
+            SymbolRunner(mt5, self.lock, params, timeframe, self.instrumentation, self.gateway, self.cache,
+                         bar_count, lot, self.clock)
+            for params in settings
+        ]
+        # 実際に待つ場合は長い sleep の誤差を避けるため1秒ずつ待つ
+        self.scheduler = BarCloseScheduler([timeframe_name], offset=wakeup_offset, clock=self.clock.time,
+                                           sleep=self.clock.sleep, max_sleep=1.0 if clock is None else None)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(len(self.runners), 32))
+
+    def run_once(self, bar_close, timeout=None):
+        # 全設定のティックとポジションを1回で取得する
+        if not self.cache.refresh():
+            with self.lock:
+                print("positions_get failed, error code =", self.mt5.last_error())
+        futures = []
+        for runner in self.runners:
+            if runner.running:
+                runner.skipped += 1
+                continue
+            runner.running = True
+            futures.append(self.executor.submit(runner.step, bar_close))
+        wait(futures, timeout=timeout)
+
+    def run(self, until=None):
+        """
+        until (UNIX 時間) を指定すると、その時刻を過ぎたら終わる
+        """
+        try:
+            while until is None or self.clock.time() < until:
+                wakeup = self.scheduler.wait()
+                # 次の足の確定までに終わらなかった処理は待たない
+                period = min(self.scheduler.periods.values())
+                self.instrumentation.record('wakeup_lateness', wakeup['lateness'])
+                self.run_once(wakeup['time'], timeout=period - self.scheduler.offset)
+                if self.clock is not time:
+                    # 時計を飛ばす場合は、送信中の注文が次の足の価格で約定しないよう送り終えるのを待つ
+                    self.gateway.drain()
+
+                if self.instrumentation.report():
+                    self.print_latency()
+                    self.instrumentation.print_slow_iterations()
+        finally:
+            self.executor.shutdown(wait=False)
+            # キューに残っている注文は送ってから終わる
+            self.gateway.close(timeout=10)
+
+    def latency_summary(self):
+        rows = []
+        for runner in self.runners:
+            latency = np.array(runner.latency) * 1000
+            rows.append({
+                'symbol': runner.symbol,
+                'bars': len(latency),
+                'p50_ms': np.percentile(latency, 50) if len(latency) else np.nan,
+                'p99_ms': np.percentile(latency, 99) if len(latency) else np.nan,
+                'max_ms': latency.max() if len(latency) else np.nan,
+                'skipped': runner.skipped,
+            })
+        return pd.DataFrame(rows)
+
+    def print_latency(self):
+        print("===== Latency after bar close =====")
+        print(self.latency_summary().to_string(index=False))
+        print("===================================")
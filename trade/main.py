@@ -1,11 +1,13 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import MetaTrader5 as mt5
 import configparser
-import time
-import pandas as pd
 import traceback
-from trading import Trading
+from engine import LiveEngine
 
-def main_process(polling_interval=60):
+def main_process(wakeup_offset=0.5):
 
     settings_reversal_usdjpy = { 
         'symbol': 'USDJPY',
@@ -17,15 +19,17 @@ def main_process(polling_interval=60):
         'candle_size_pips': 0.05, # 0.04~0.05
     }
 
-    params = settings_reversal_usdjpy
-
-    print("===== Currency Settings =====")
-    for key, value in params.items():
-        print(f"- {key.replace('_', ' ').capitalize()}: {value}")
-    print("=============================")
-    print()
+    # 同じプロセスで動かす通貨ペア・戦略の設定
+    settings = [
+        settings_reversal_usdjpy,
+    ]
 
-    trading = Trading(params=params)
+    for params in settings:
+        print("===== Currency Settings =====")
+        for key, value in params.items():
+            print(f"- {key.replace('_', ' ').capitalize()}: {value}")
+        print("=============================")
+        print()
 
     # MT5に接続
     config = configparser.ConfigParser()
@@ -48,68 +52,13 @@ def main_process(polling_interval=60):
         print("initialize() failed, error code =", mt5.last_error())
         quit()
 
-    # ポートフォリオを初期化
-    portfolio = {
-        'position': None,  # "long" or "short"
-        'entry_price': None,
-        'entry_point': 0,
-        'trailing_stop': 0,
-        'take_profit': None,
-        'stop_loss': None,
-        'profit': 0
-    }
+    # 確定した直近N本のデータを保持し、1分足が確定した wakeup_offset 秒後にその足で全設定を判定する
+    # 区間ごとの時間は10分ごとに表示する (遅い処理を調べるときは profile_threshold=0.05 などを指定)
+    engine = LiveEngine(mt5, settings, timeframe_name='M1', bar_count=500, lot=0.01, wakeup_offset=wakeup_offset,
+                        report_interval=600, profile_threshold=None)
 
     try:
-        while True:
-            bar_count = 500 # 直近N本のデータを取得
-            rates = mt5.copy_rates_from_pos(params['symbol'], mt5.TIMEFRAME_M1, 0, bar_count)
-            if rates is None:
-                print("Error in copy_rates_from_pos(), error code =", mt5.last_error())
-                continue
-
-            df = pd.DataFrame(rates)
-            df['time'] = pd.to_datetime(df['time'], unit='s')
-
-            # position = trading.get_position()
-
-            lot = 0.01 # 1ロット=100,000通貨　(最小取引数量 10,000通貨)
-            signal = trading.trade_conditions(df, len(df)-1, portfolio)
-            print(f'{params["symbol"]} signal: {signal}')
-
-            if portfolio['position'] == 'long'and signal == 'exit_long': 
-                # trading.close_position(position["id"])
-                portfolio = trading.init_portfolio()
-
-            elif portfolio['position'] == 'short' and signal == 'exit_short':
-                # trading.close_position(position["id"])
-                portfolio = trading.init_portfolio()
-
-            else:
-                if signal == 'entry_long':
-                    result = trading.place_order(
-                                params['symbol'], 
-                                mt5.ORDER_TYPE_BUY,
-                                lot,
-                                mt5.symbol_info_tick(params['symbol']).ask,
-                                portfolio['stop_loss'],
-                                portfolio['take_profit'])
-                    
-                    if result.retcode != mt5.TRADE_RETCODE_DONE:
-                        print("order_send failed, retcode={}".format(result.retcode))
-
-                elif signal == 'entry_short':
-                    result = trading.place_order(
-                                params['symbol'], 
-                                mt5.ORDER_TYPE_SELL,
-                                lot,
-                                mt5.symbol_info_tick(params['symbol']).bid,
-                                portfolio['stop_loss'],
-                                portfolio['take_profit'])
-                    
-                    if result.retcode != mt5.TRADE_RETCODE_DONE:
-                        print("order_send failed, retcode={}".format(result.retcode))
-
-            time.sleep(polling_interval)
+        engine.run()
 
     except Exception as e:
         print("An error occurred:", str(e))
@@ -0,0 +1,69 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import numpy as np
+from modules import BarStore, SimulatedTerminal
+
+def replay_process(bar_count=500, spread=0, slippage=2, latency=0.05):
+
+    settings_reversal_usdjpy = {
+        'symbol': 'USDJPY',
+        'risk_reward_ratio': 1.0,
+        'stop_loss_pips': 0.10,
+        'base_spread_pips': 0.03,
+        'df_sliced_period': 500,
+        'distance': 7,
+        'candle_size_pips': 0.05,
+    }
+
+    settings = [
+        settings_reversal_usdjpy,
+    ]
+
+    # 保存したバーを MT5 の代わりに返す端末 (約定は latency 秒後の価格で、slippage ポイントまで滑る)
+    bars = BarStore('./bars').load("USDJPY", 1, "2022-08-01", "2023-08-01")
+    terminal = SimulatedTerminal(spread=spread, slippage=slippage, latency=latency)
+    terminal.add_symbol("USDJPY", bars, point=0.001, digits=3)
+    terminal.install()
+
+    # import MetaTrader5 しているモジュールは install() の後に読み込む
+    from engine import LiveEngine
+
+    # bar_count 本が揃ったところから始める
+    terminal.clock.set(int(terminal.symbols["USDJPY"].times[bar_count]) + 60)
+    terminal.initialize()
+
+    engine = LiveEngine(terminal, settings, timeframe_name='M1', bar_count=bar_count, lot=0.01,
+                        wakeup_offset=0.5, report_interval=600, clock=terminal.clock)
+
+    start = time.perf_counter()
+    try:
+        engine.run(until=terminal.end_time())
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram = engine.instrumentation.histograms.get('step')
+        steps = histogram.count if histogram is not None else 0
+        terminal.shutdown()
+
+    print("===== Replay =====")
+    print(f"- Bars: {steps} in {elapsed:.1f}s ({steps / elapsed:.0f} bars/s)")
+    engine.print_latency()
+    engine.instrumentation.report(force=True)
+    print(engine.gateway.stats())
+
+    deals = terminal.deals_frame()
+    closed = deals[deals['entry'] == terminal.DEAL_ENTRY_OUT] if len(deals) else deals
+    profits = closed['profit'].values if len(closed) else np.zeros(0)
+    print(f"- Trades: {len(closed)}, profit: {profits.sum():.0f}, win rate: {(profits > 0).mean() if len(profits) else 0:.2f}")
+    print(f"- Balance: {terminal.balance:.0f}")
+    print("==================")
+
+    # 1年分のバーで1回も約定しないのは、判定か発注の経路が壊れている
+    if len(closed) == 0:
+        print("No trades were made during the replay")
+        sys.exit(1)
+
+
+replay_process()
@@ -1,16 +1,15 @@
-import sys
-sys.path.append('d:\\dev\\mt5-python')
-
-from modules import TradingStrategy
+from modules import TradingStrategy, Position
 import MetaTrader5 as mt5
 
 class Trading:
-    def __init__(self, lot_size=0.01, slippage=3, params=None):
+    def __init__(self, lot_size=0.01, slippage=3, params=None, cache=None):
         self.symbol = params['symbol']
         self.lot_size = lot_size
         self.slippage = slippage
         self.strategy = TradingStrategy(params=params)
         self.magic_number = 19850001
+        # TerminalCache を渡すと、ティックとポジションは MT5 に問い合わせずにキャッシュから使う
+        self.cache = cache
 
         self.portfolio = {
             'position': None,  # "long" or "short"
@@ -22,26 +21,33 @@ class Trading:
             'profit': 0
         }
 
+    def order_request(self, symbol, order_type, volume, price, stop_loss, take_profit):
+        # 注文プロパティをセット
+        return {
+            "action": mt5.TRADE_ACTION_DEAL,
+            "symbol": symbol,
+            "volume": volume,
+            "type": order_type,
+            "price": price,
+            "sl": stop_loss,
+            "tp": take_profit,
+            "deviation": self.slippage, # point単位
+            "magic": self.magic_number,
+            "comment": "python script open",
+            "type_time": mt5.ORDER_TIME_GTC,
+            "type_filling": mt5.ORDER_FILLING_IOC,
+        }
+
     def place_order(self, symbol, order_type, volume, price, stop_loss, take_profit):
         try:
-            # 注文プロパティをセット
-            request = {
-                "action": mt5.TRADE_ACTION_DEAL,
-                "symbol": symbol,
-                "volume": volume,
-                "type": order_type,
-                "price": price,
-                "sl": stop_loss,
-                "tp": take_profit,
-                "deviation": self.slippage, # point単位
-                "magic": self.magic_number,
-                "comment": "python script open",
-                "type_time": mt5.ORDER_TIME_GTC,
-                "type_filling": mt5.ORDER_FILLING_IOC,
-            }
+            request = self.order_request(symbol, order_type, volume, price, stop_loss, take_profit)
 
             # 注文を実行
             result = mt5.order_send(request)
+            if self.cache is not None:
+                self.cache.invalidate()
+            if result is None:
+                raise Exception("order_send failed, error code={}".format(mt5.last_error()))
             if result.retcode != mt5.TRADE_RETCODE_DONE:
                 raise Exception("order_send failed, retcode={}".format(result.retcode))
 
@@ -63,6 +69,8 @@ class Trading:
                 "order": order_ticket,
             }
             result = mt5.order_send(request)
+            if result is None:
+                raise Exception("Failed to cancel order, error code={}".format(mt5.last_error()))
             if result.retcode != mt5.TRADE_RETCODE_DONE:
                 raise Exception("Failed to cancel order, retcode={}".format(result.retcode))
 
@@ -75,11 +83,13 @@ class Trading:
 
     def close_position(self, position_ticket):
         try:
-            position = mt5.positions_get(ticket=position_ticket)
-            if position == None:
+            pos = self.find_position(position_ticket)
+            if pos is None:
                 raise Exception("Position not found")
-            
-            pos = position[0]
+
+            tick = self.cache.tick(pos.symbol) if self.cache is not None else mt5.symbol_info_tick(pos.symbol)
+            if tick is None:
+                raise Exception("symbol_info_tick failed, error code={}".format(mt5.last_error()))
 
             request = {
                 "action": mt5.TRADE_ACTION_DEAL,
@@ -87,7 +97,8 @@ class Trading:
                 "volume": pos.volume,
                 "type": mt5.ORDER_TYPE_SELL if pos.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
                 "position": pos.ticket,
-                "price": mt5.symbol_info_tick(pos.symbol).ask if pos.type == mt5.ORDER_TYPE_BUY else mt5.symbol_info_tick(pos.symbol).bid,
+                # 買いポジションは bid で売って決済する
+                "price": tick.bid if pos.type == mt5.ORDER_TYPE_BUY else tick.ask,
                 "deviation": self.slippage,
                 "magic": 234001,
                 "comment": "python script close",
@@ -95,6 +106,10 @@ class Trading:
                 "type_filling": mt5.ORDER_FILLING_IOC,
             }
             result = mt5.order_send(request)
+            if self.cache is not None:
+                self.cache.invalidate()
+            if result is None:
+                raise Exception("Failed to close position, error code={}".format(mt5.last_error()))
             if result.retcode != mt5.TRADE_RETCODE_DONE:
                 raise Exception("Failed to close position, retcode={}".format(result.retcode))
 
@@ -106,15 +121,23 @@ class Trading:
         return None
 
 
+    def find_position(self, position_ticket):
+        if self.cache is not None:
+            return self.cache.position(position_ticket)
+        position = mt5.positions_get(ticket=position_ticket)
+        return position[0] if position else None
+
     def get_position(self):
-        # MT5のすべての開いているポジションを取得
-        positions = mt5.positions_get()
+        # 特定の通貨ペアの開いているポジションを取得
+        if self.cache is not None:
+            positions = self.cache.positions(symbol=self.symbol)
+        else:
+            positions = mt5.positions_get(symbol=self.symbol)
 
         if positions == None:
             print('No positions found, error code:', mt5.last_error())
             return None
 
-        # 特定の通貨ペアに対応するポジションを探す
         for position in positions:
             if position.symbol == self.symbol:
                 # ポジションの詳細を辞書として返す
@@ -134,15 +157,7 @@ class Trading:
     
     # Initialize portfolio state
     def init_portfolio(self):
-        return {
-            'position': None,  # "long" or "short"
-            'entry_price': None,
-            'entry_point': 0,
-            'trailing_stop': 0,
-            'take_profit': None,
-            'stop_loss': None,
-            'profit': 0
-        }
+        return Position()
     
     def trade_conditions(self, df, i, portfolio):
         closes = df['close'].values